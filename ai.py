@@ -0,0 +1,346 @@
+"""Computer players which predict where the ball will go.
+
+Rather than chase the ball, these bots work out where it will be when it
+reaches their paddle, and go there. Between walls the ball moves in a
+straight line, so without the bounce pickup its height when it arrives is
+found in one go by unfolding the wall reflections of Ball.update: bouncing
+between 0 and a limit is the same as moving freely and folding the result
+back into range every 2 * limit. With the bounce pickup the ball falls along
+a parabola, so the prediction is worked out an arc at a time, each arc (and
+the frame it hits a wall) found from the formula for the sum of the
+velocities. Either way the work is done only when the ball's velocity
+changes unexpectedly (it hits a paddle, is sped up, is served or changes
+size), not every frame, so each bot costs almost nothing per frame.
+
+PaddleAI plays a Paddle in a GameState, and BatchAI plays one side of every
+match of a batch.BatchGame. Both have difficulty knobs: how many frames they
+take to react to a new prediction, and how far off (in pixels) the prediction
+tends to be.
+
+    python3 ai.py
+
+checks the predictions against the ball and plays the bots against each other.
+"""
+
+import random
+import numpy as np
+
+from objects import BOUNCE, BOUNCE_FRICTION
+from engine import (
+    HEIGHT,
+    PADDLE_WIDTH,
+    INPUT_L_UP,
+    INPUT_L_DOWN,
+    INPUT_R_UP,
+    INPUT_R_DOWN,
+)
+from batch import PADDLE_X, LEFT
+
+# (reaction frames, error pixels) for each difficulty
+DIFFICULTIES = {
+    "easy": (20, 6.0),
+    "medium": (8, 2.5),
+    "hard": (0, 0.0),
+}
+MAX_ARCS = 64  # Bounces followed before giving up on a prediction
+
+
+#######################
+# Predicting the ball #
+#######################
+
+
+def predict_y(y, y_vol, frames, limit, bouncing):
+    """Return the y of balls after the given number of frames of Ball.update,
+    ignoring the sides of the board.
+
+    Limit is the board height less the ball height, and bouncing whether the
+    bounce pickup is on. Arguments can be numbers or arrays."""
+
+    shape = np.broadcast(y, y_vol, frames, limit, bouncing).shape
+    y, y_vol, frames, limit = (
+        np.broadcast_to(np.asarray(value, dtype=float), shape).ravel()
+        for value in (y, y_vol, frames, limit)
+    )
+    bouncing = np.broadcast_to(np.asarray(bouncing, dtype=bool), shape).ravel()
+    frames = np.maximum(np.floor(frames), 0)
+
+    # Without bounce: unfold the reflections.
+    folded = np.mod(y + y_vol * frames, 2 * limit)
+    result = np.where(folded > limit, 2 * limit - folded, folded)
+    if not bouncing.any():
+        return result.reshape(shape)
+
+    # With bounce, an arc at a time. After n frames without touching a wall,
+    # y is y + n * y_vol + gravity * n * (n - 1) / 2.
+    todo = np.flatnonzero(bouncing)
+    y = y[todo].copy()
+    y_vol = y_vol[todo].copy()
+    left = frames[todo].copy()
+    limit = limit[todo]
+    a = BOUNCE / 2
+
+    for _ in range(MAX_ARCS):
+        b = y_vol - a
+        # First frame below the bottom: past the larger root of
+        # a n^2 + b n + y - limit
+        root = np.sqrt(np.maximum(b * b - 4 * a * (y - limit), 0))
+        bottom = np.maximum(np.floor((-b + root) / (2 * a)) + 1, 1)
+        # First frame above the top: between the roots of a n^2 + b n + y,
+        # if there are any
+        discriminant = b * b - 4 * a * y
+        root = np.sqrt(np.maximum(discriminant, 0))
+        top = np.maximum(np.floor((-b - root) / (2 * a)) + 1, 1)
+        top = np.where((discriminant > 0) & (top < (-b + root) / (2 * a)), top, np.inf)
+
+        hits_top = top < bottom
+        wall = np.where(hits_top, top, bottom)
+        arriving = wall > left
+        if arriving.all():
+            break
+
+        # Reflect off the wall as Ball.update does, and carry on from there.
+        n = np.where(arriving, left, wall)
+        y_wall = y + n * y_vol + a * n * (n - 1)
+        vol_wall = y_vol + n * BOUNCE
+        y = np.where(arriving, y, np.where(hits_top, -y_wall, 2 * limit - y_wall))
+        y_vol = np.where(
+            arriving, y_vol, np.where(hits_top, -vol_wall, -vol_wall + BOUNCE_FRICTION)
+        )
+        left = np.where(arriving, left, left - n)
+
+    y = y + left * y_vol + a * left * (left - 1)
+    result[todo] = np.clip(y, 0, limit)
+    return result.reshape(shape)
+
+
+def frames_to_reach(ball_x, x_vol, ball_width, paddle_x, paddle_width):
+    """Frames until balls moving towards a paddle reach its face (inf if moving away)."""
+
+    towards_right = paddle_x > ball_x
+    distance = np.where(
+        towards_right, paddle_x - ball_width - ball_x, ball_x - paddle_x - paddle_width
+    )
+    speed = np.where(towards_right, x_vol, -x_vol)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        frames = np.where(speed > 0, np.ceil(np.maximum(distance, 0) / speed), np.inf)
+    return frames
+
+
+############
+# The bots #
+############
+
+
+class PaddleAI:
+    """Plays a paddle by going to where the ball will reach it."""
+
+    def __init__(self, paddle, ball, reaction=0, error=0.0, rng=random):
+        """Play the paddle against the ball.
+
+        A new prediction is only acted on after reaction frames, and is off
+        by a normally distributed error with the given standard deviation."""
+        self.paddle = paddle
+        self.ball = ball
+        self.reaction = reaction
+        self.error = error
+        self.rng = rng
+
+        self.frame = 0
+        self.key = None  # The ball's velocity and size when last predicted
+        self.last_x = None
+        self.target = self.next_target = HEIGHT / 2
+        self.target_frame = 0
+        self.predictions = 0
+
+    @classmethod
+    def with_difficulty(cls, paddle, ball, difficulty, rng=random):
+        """Create a bot with one of the DIFFICULTIES."""
+        reaction, error = DIFFICULTIES[difficulty]
+        return cls(paddle, ball, reaction, error, rng)
+
+    def controls(self):
+        """Return the (up, down) controls to hold this frame."""
+
+        ball = self.ball
+        # Wall bounces are part of the prediction, so only a change of x_vol
+        # (paddle hits and speed ups), bounce or size means predicting again,
+        # or the ball not having moved as expected (being served).
+        key = (ball.x_vol, ball.bounce_status, ball.height)
+        expected = self.last_x is not None and (
+            ball.x == self.last_x or ball.x == self.last_x + ball.x_vol
+        )
+        if key != self.key or not expected:
+            self.predict()
+            self.key = key
+        self.last_x = ball.x
+
+        if self.frame >= self.target_frame:
+            self.target = self.next_target
+        self.frame += 1
+
+        paddle = self.paddle
+        centre = paddle.y + paddle.height / 2
+        if self.target < centre - paddle.move_speed:
+            return True, False
+        if self.target > centre + paddle.move_speed:
+            return False, True
+        return False, False
+
+    def predict(self):
+        """Work out where to go: where the ball will arrive, or the middle if
+        it's going the other way."""
+
+        ball = self.ball
+        paddle = self.paddle
+        self.predictions += 1
+        frames = frames_to_reach(ball.x, ball.x_vol, ball.width, paddle.x, paddle.width)
+        if np.isinf(frames):
+            target = HEIGHT / 2
+        else:
+            limit = HEIGHT - ball.height
+            y = predict_y(ball.y, ball.y_vol, frames, limit, ball.bounce_status > 0)
+            target = float(y) + ball.height / 2
+            if self.error:
+                target += self.rng.gauss(0, self.error)
+        self.next_target = target
+        self.target_frame = self.frame + self.reaction
+
+
+class BatchAI:
+    """Plays one side's paddle in every match of a batch.BatchGame.
+
+    Call it with the batch to get that side's engine.INPUT_* flags for every
+    match, so it can be used as a VectorPongEnv opponent."""
+
+    def __init__(self, n, side, reaction=0, error=0.0, seed=None):
+        """Play the LEFT or RIGHT paddle of n matches."""
+        self.side = side
+        self.paddle_x = PADDLE_X[side, 0]
+        if side == LEFT:
+            self.up, self.down = INPUT_L_UP, INPUT_L_DOWN
+        else:
+            self.up, self.down = INPUT_R_UP, INPUT_R_DOWN
+        self.reaction = reaction
+        self.error = error
+        self.generator = np.random.default_rng(seed)
+
+        self.frame = 0
+        self.key = np.full((3, n), np.nan)
+        self.last_x = np.full(n, np.nan)
+        self.target = np.zeros(n)
+        self.next_target = np.zeros(n)
+        self.target_frame = np.zeros(n, dtype=np.int64)
+        self.predictions = 0
+
+    def __call__(self, batch):
+        """Return the inputs for this side of every match."""
+        key = np.stack((batch.x_vol, batch.bounce_status, batch.height))
+        expected = (batch.x == self.last_x) | (batch.x == self.last_x + batch.x_vol)
+        changed = (key != self.key).any(axis=0) | ~expected
+        self.key = key
+        self.last_x = batch.x.copy()
+
+        if changed.any():
+            self.predict(batch, np.flatnonzero(changed))
+        ready = self.frame >= self.target_frame
+        self.target[ready] = self.next_target[ready]
+        self.frame += 1
+
+        paddle_y = batch.paddle_y[self.side]
+        centre = paddle_y + batch.paddle_height[self.side] / 2
+        speed = batch.move_speed[self.side]
+        up = self.target < centre - speed
+        down = self.target > centre + speed
+        return np.where(up, self.up, np.where(down, self.down, 0))
+
+    def predict(self, batch, matches):
+        """Work out where to go in the given matches."""
+        self.predictions += len(matches)
+        frames = frames_to_reach(
+            batch.x[matches],
+            batch.x_vol[matches],
+            batch.width[matches],
+            self.paddle_x,
+            PADDLE_WIDTH,
+        )
+        coming = ~np.isinf(frames)
+        height = batch.height[matches]
+        y = predict_y(
+            batch.y[matches],
+            batch.y_vol[matches],
+            np.where(coming, frames, 0),
+            HEIGHT - height,
+            batch.bounce_status[matches] > 0,
+        )
+        target = np.where(coming, y + height / 2, HEIGHT / 2)
+        if self.error:
+            target += np.where(coming, self.generator.normal(0, self.error, len(matches)), 0)
+        self.next_target[matches] = target
+        self.target_frame[matches] = self.frame + self.reaction
+
+
+############
+# Checking #
+############
+
+
+def check_predictions(trials=200, seed=0):
+    """Throw the ball at the left paddle from random places, with and without
+    bounce, and raise AssertionError unless it arrives where predicted."""
+
+    from engine import GameState
+
+    rng = random.Random(seed)
+    state = GameState(seed=seed)
+    ball = state.ball
+    paddle = state.l_paddle
+    for _ in range(trials):
+        for bouncing in (0, 1):
+            ball.x, ball.y = 70.0, rng.uniform(0, HEIGHT - ball.height)
+            ball.x_vol, ball.y_vol = -rng.uniform(0.3, 1.5), rng.uniform(-1.5, 1.5)
+            ball.bounce_status = bouncing
+            frames = frames_to_reach(ball.x, ball.x_vol, ball.width, paddle.x, paddle.width)
+            predicted = predict_y(ball.y, ball.y_vol, frames, HEIGHT - ball.height, bouncing)
+            for _ in range(int(frames)):
+                ball.update()
+            if abs(ball.y - predicted) > 1e-6:
+                raise AssertionError(f"Predicted y {predicted}, ball arrived at {ball.y}")
+
+
+def play_batch(n=1000, frames=5000, difficulty="hard"):
+    """Play a BatchAI on the left against the ball-following bot in n matches.
+
+    Returns (the AI's share of points, predictions per frame per match,
+    match-frames per second)."""
+
+    import time
+    from batch import BatchGame, RIGHT, OUTCOME_L, OUTCOME_R
+    from env import track_ball
+
+    batch = BatchGame(n, seeds=range(n))
+    reaction, error = DIFFICULTIES[difficulty]
+    bot = BatchAI(n, LEFT, reaction, error, seed=0)
+    points = [0, 0]
+    begin = time.perf_counter()
+    for _ in range(frames):
+        batch.step(bot(batch) | track_ball(batch))
+        points[0] += np.count_nonzero(batch.outcome == OUTCOME_L)
+        points[1] += np.count_nonzero(batch.outcome == OUTCOME_R)
+        batch.reset(batch.finish)
+    elapsed = time.perf_counter() - begin
+    share = points[0] / max(sum(points), 1)
+    return share, bot.predictions / (n * frames), n * frames / elapsed
+
+
+if __name__ == "__main__":
+    check_predictions()
+    print("Predictions match the ball.")
+    for difficulty in DIFFICULTIES:
+        share, predictions, speed = play_batch(difficulty=difficulty)
+        print(
+            "{:>6} AI against a ball follower: wins {:.0%} of points, predicts on "
+            "{:.1%} of frames, {:,.0f} match-frames/sec".format(
+                difficulty, share, predictions, speed
+            )
+        )
@@ -0,0 +1,389 @@
+"""Keeping thousands of recorded matches in one file.
+
+An archive holds many recordings (see replay.py) in a single file, laid out
+so any frame of any match can be reached without reading the rest:
+
+    header     magic, number of matches, steps between keyframes
+    index      a fixed-size entry per match (INDEX_DTYPE): its id, seed, how
+               it was stepped, length, final score and hash, and where its
+               keyframes and controls are
+    per match  its keyframes (KEYFRAME_DTYPE): the step each was taken at,
+               where in the controls that is and where its snapshot is;
+               its controls as fixed-size (controls, steps) runs (RUN_DTYPE);
+               and the snapshots (GameState.save_state, zlib compressed)
+
+The ArchiveReader maps the file into memory and views the index, keyframes
+and runs as NumPy arrays in place, so opening an archive reads nothing but
+the header, and the operating system only pages in what is looked at. To
+get to a frame, the match is restored from the keyframe at or before it and
+played on from there, which is never more than KEYFRAME_INTERVAL steps.
+
+    python3 archive.py kiosk.pongarc recordings/*.pongrec
+
+builds an archive (checking each recording still plays out as recorded),
+
+    python3 archive.py kiosk.pongarc
+
+lists its matches, and
+
+    python3 archive.py kiosk.pongarc --seek MATCH_ID FRAME
+
+shows a match as it was at a frame.
+
+Requires numpy.
+"""
+
+import argparse
+import mmap
+import os
+import re
+import struct
+import zlib
+import numpy as np
+
+from engine import GameState
+from replay import Recording, InputLog, state_hash
+
+ARCHIVE_MAGIC = b"PONGARC1"
+ARCHIVE_EXTENSION = ".pongarc"
+ARCHIVE_HEADER = struct.Struct("<8sII")  # magic, number of matches, keyframe interval
+KEYFRAME_INTERVAL = 600  # Steps between keyframes, ten seconds of play
+SNAPSHOT_COMPRESSION = 1  # zlib level, the fastest
+
+INDEX_DTYPE = np.dtype(
+    [
+        ("match_id", "<u8"),
+        ("seed", "<u8"),
+        ("frames", "u1"),  # Frames per step
+        ("swept", "?"),
+        ("l_score", "u1"),
+        ("r_score", "u1"),
+        ("length", "<u8"),  # Frames
+        ("steps", "<u8"),
+        ("keyframes", "<u8"),  # Offset of the keyframes
+        ("keyframe_count", "<u4"),
+        ("runs", "<u8"),  # Offset of the controls
+        ("run_count", "<u4"),
+        ("final_hash", "S16"),
+    ]
+)
+KEYFRAME_DTYPE = np.dtype(
+    [
+        ("step", "<u8"),
+        ("run", "<u4"),  # The run of controls this step is in
+        ("run_step", "<u4"),  # Steps of that run already played
+        ("snapshot", "<u8"),  # Offset of the compressed snapshot
+        ("size", "<u4"),
+    ]
+)
+RUN_DTYPE = np.dtype([("inputs", "u1"), ("steps", "<u4")])
+
+# Recordings saved by pong.py are named from when the match finished, which
+# makes a good id
+RECORDING_NAME = re.compile(r"(\d{8})-(\d{6})-")
+
+
+############
+# Building #
+############
+
+
+def write_archive(filename, recordings, ids=None, keyframe_interval=KEYFRAME_INTERVAL):
+    """Write a list of Recordings to an archive, with the given match ids (by
+    default their positions in the list).
+
+    Each match is replayed to take its keyframes, and a ValueError is raised
+    if one doesn't end in its recorded state."""
+
+    if ids is None:
+        ids = range(len(recordings))
+    index = np.zeros(len(recordings), INDEX_DTYPE)
+
+    with open(filename, "wb") as file:
+        file.write(
+            ARCHIVE_HEADER.pack(ARCHIVE_MAGIC, len(recordings), keyframe_interval)
+        )
+        file.write(index.tobytes())  # Filled in at the end
+
+        for entry, match_id, recording in zip(index, ids, recordings):
+            runs = np.array([tuple(run) for run in recording.inputs.runs], RUN_DTYPE)
+            keyframes = []
+            snapshots = []
+            state = recording.new_state()
+
+            def keyframe(step, run, run_step):
+                snapshot = zlib.compress(state.save_state(), SNAPSHOT_COMPRESSION)
+                keyframes.append((step, run, run_step, 0, len(snapshot)))
+                snapshots.append(snapshot)
+
+            # Every match has a keyframe at step 0, even one with no steps
+            keyframe(0, 0, 0)
+            step = 0
+            for run, (inputs, steps) in enumerate(recording.inputs.runs):
+                for run_step in range(steps):
+                    if step and step % keyframe_interval == 0:
+                        keyframe(step, run, run_step)
+                    state.step(inputs, recording.frames)
+                    step += 1
+            if state_hash(state) != recording.final_hash:
+                raise ValueError("Match {} doesn't end as recorded.".format(match_id))
+
+            keyframes = np.array(keyframes, KEYFRAME_DTYPE)
+            entry["keyframes"] = file.tell()
+            entry["runs"] = entry["keyframes"] + keyframes.nbytes
+            offset = entry["runs"] + runs.nbytes
+            for keyframe, snapshot in zip(keyframes, snapshots):
+                keyframe["snapshot"] = offset
+                offset += len(snapshot)
+            file.write(keyframes.tobytes())
+            file.write(runs.tobytes())
+            file.write(b"".join(snapshots))
+
+            entry["match_id"] = match_id
+            entry["seed"] = recording.seed
+            entry["frames"] = recording.frames
+            entry["swept"] = recording.swept
+            entry["l_score"] = state.l_score
+            entry["r_score"] = state.r_score
+            entry["length"] = state.frame_count
+            entry["steps"] = step
+            entry["keyframe_count"] = len(keyframes)
+            entry["run_count"] = len(runs)
+            entry["final_hash"] = recording.final_hash
+
+        file.seek(ARCHIVE_HEADER.size)
+        file.write(index.tobytes())
+
+
+def recording_id(filename, default):
+    """The id of a recording saved by pong.py, from its name (the date and time
+    as one number, like 20240131235959), or default for any other name."""
+
+    match = RECORDING_NAME.match(os.path.basename(filename))
+    return int(match.group(1) + match.group(2)) if match else default
+
+
+###########
+# Reading #
+###########
+
+
+class ArchiveReader:
+    """An archive mapped into memory, for jumping to any frame of any match."""
+
+    def __init__(self, filename):
+        """Map the archive and view its index."""
+
+        with open(filename, "rb") as file:
+            self.map = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, count, self.keyframe_interval = ARCHIVE_HEADER.unpack_from(self.map)
+        if magic != ARCHIVE_MAGIC:
+            self.map.close()
+            raise ValueError("Not a pong archive.")
+        self.index = np.frombuffer(self.map, INDEX_DTYPE, count, ARCHIVE_HEADER.size)
+        self.positions = None  # Match id: position in the index, made when needed
+
+    def __len__(self):
+        return len(self.index)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        try:
+            self.close()
+        except BufferError:
+            if exc_type is None:
+                raise
+            # The traceback still holds views into the map, which is unmapped
+            # once they go, so don't hide the error behind this one
+
+    def close(self):
+        """Unmap the archive.
+
+        Arrays and entries from index, keyframes and runs are views into the
+        map, so they must be gone first, or this raises BufferError."""
+        self.index = None
+        self.positions = None
+        if self.map is not None:
+            self.map.close()
+            self.map = None
+
+    def find(self, match_id):
+        """The position in the index of the match with the given id."""
+
+        if self.positions is None:
+            self.positions = {
+                int(match_id): position
+                for position, match_id in enumerate(self.index["match_id"])
+            }
+        try:
+            return self.positions[match_id]
+        except KeyError:
+            raise KeyError("No match {} in the archive.".format(match_id)) from None
+
+    def keyframes(self, position):
+        """The keyframes of the match at a position in the index."""
+        entry = self.index[position]
+        return np.frombuffer(
+            self.map, KEYFRAME_DTYPE, entry["keyframe_count"], entry["keyframes"]
+        )
+
+    def runs(self, position):
+        """The runs of controls of the match at a position in the index."""
+        entry = self.index[position]
+        return np.frombuffer(self.map, RUN_DTYPE, entry["run_count"], entry["runs"])
+
+    def recording(self, position):
+        """The match at a position in the index as a Recording."""
+        entry = self.index[position]
+        runs = [[int(inputs), int(steps)] for inputs, steps in self.runs(position)]
+        return Recording(
+            int(entry["seed"]),
+            int(entry["frames"]),
+            bool(entry["swept"]),
+            InputLog(runs),
+            bytes(entry["final_hash"]),
+        )
+
+    def state_at(self, position, frame):
+        """The match at a position in the index as it was at the given frame
+        (or the step which reached it), restored from the keyframe before it."""
+
+        entry = self.index[position]
+        step = min(-(-frame // int(entry["frames"])), int(entry["steps"]))
+        keyframes = self.keyframes(position)
+        keyframe = keyframes[np.searchsorted(keyframes["step"], step, "right") - 1]
+
+        state = GameState(seed=int(entry["seed"]), swept=bool(entry["swept"]))
+        start = int(keyframe["snapshot"])
+        end = start + int(keyframe["size"])
+        state.load_state(zlib.decompress(self.map[start:end]))
+
+        frames = int(entry["frames"])
+        remaining = step - int(keyframe["step"])
+        runs = self.runs(position)
+        run = int(keyframe["run"])
+        done = int(keyframe["run_step"])
+        while remaining:
+            inputs, steps = runs[run]
+            for _ in range(min(int(steps) - done, remaining)):
+                state.step(int(inputs), frames)
+                remaining -= 1
+            run += 1
+            done = 0
+        return state
+
+
+def list_matches(archive):
+    """Print the id, seed, length and final score of every match in an archive."""
+
+    for entry in archive.index:
+        print(
+            "{:>14}  seed {:>10}  {:>6} frames  {} - {}".format(
+                entry["match_id"],
+                entry["seed"],
+                entry["length"],
+                entry["l_score"],
+                entry["r_score"],
+            )
+        )
+
+
+def check_archive(filename, matches=20, seeks=200):
+    """Archive some headless matches to a new file and check that seeking to
+    random frames gets the same states as playing the matches from the start."""
+
+    from random import Random
+    from replay import Recorder
+
+    rng = Random(0)
+    recordings = []
+    for seed in range(matches):
+        recorder = Recorder(GameState(seed=seed))
+        state = recorder.state
+        while not state.finish:
+            # Follow the ball, badly enough to lose now and then
+            target = state.ball.y + (state.frame_count // 97 % 5 - 2) * 4
+            inputs = 0
+            for paddle, up, down in ((state.l_paddle, 1, 2), (state.r_paddle, 4, 8)):
+                middle = paddle.y + paddle.height / 2
+                if target < middle - 1:
+                    inputs |= up
+                elif target > middle + 1:
+                    inputs |= down
+            recorder.step(inputs)
+        recordings.append(recorder.finish())
+    write_archive(filename, recordings)
+
+    with ArchiveReader(filename) as archive:
+        for _ in range(seeks):
+            position = rng.randrange(len(archive))
+            frame = rng.randrange(int(archive.index[position]["length"]) + 1)
+            state = archive.recording(position).new_state()
+            for inputs in list(archive.recording(position).inputs)[:frame]:
+                state.step(inputs)
+            if state_hash(archive.state_at(position, frame)) != state_hash(state):
+                raise AssertionError(
+                    "Match {} differs at frame {}.".format(position, frame)
+                )
+        print(
+            "{} random seeks into {} matches ({:,} bytes) all matched.".format(
+                seeks, len(archive), os.path.getsize(filename)
+            )
+        )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Build, list or seek into an archive.")
+    parser.add_argument("archive", help="the archive file")
+    parser.add_argument(
+        "recordings", nargs="*", help="recordings to build a new archive from"
+    )
+    parser.add_argument(
+        "--seek",
+        nargs=2,
+        type=int,
+        metavar=("MATCH_ID", "FRAME"),
+        help="show a match as it was at a frame",
+    )
+    parser.add_argument(
+        "--check",
+        action="store_true",
+        help="archive some headless matches to a new file, and check seeking into it",
+    )
+    args = parser.parse_args()
+
+    if args.check:
+        check_archive(args.archive)
+    elif args.recordings:
+        write_archive(
+            args.archive,
+            [Recording.load(filename) for filename in args.recordings],
+            [recording_id(name, i) for i, name in enumerate(args.recordings)],
+        )
+        print("Archived {} matches.".format(len(args.recordings)))
+    else:
+        with ArchiveReader(args.archive) as archive:
+            if args.seek:
+                match_id, frame = args.seek
+                try:
+                    position = archive.find(match_id)
+                except KeyError as error:
+                    parser.error(error.args[0])
+                state = archive.state_at(position, frame)
+                print(
+                    "Match {} at frame {}: {} - {}, ball at ({:.1f}, {:.1f}), "
+                    "paddles at {:.1f} and {:.1f}.".format(
+                        match_id,
+                        state.frame_count,
+                        state.l_score,
+                        state.r_score,
+                        state.ball.x,
+                        state.ball.y,
+                        state.l_paddle.y,
+                        state.r_paddle.y,
+                    )
+                )
+            else:
+                list_matches(archive)
@@ -0,0 +1,648 @@
+"""Many matches of pong simulated at once with NumPy.
+
+BatchGame holds N matches as a structure of arrays (one array per ball, paddle,
+score and pickup variable, indexed by match) and advances them all with one
+call to BatchGame.step. The rules are the same as engine.GameState: the ball
+moves and bounces as in Ball.update, hits paddles as in Ball.check_collision
+and Ball.spin_ball, speeds up as in GameState.check_speed and scores as in
+GameState.score, and pickups spawn, take effect and expire as in Pickups.
+
+Each match has its own random number generator, seeded in the same way as
+GameState, and the rare random draws (ball directions after a score, new
+pickups) are made from it in the same order. A batch with the same seeds and
+inputs as a list of GameStates therefore plays out identically, which
+check_parity below verifies frame by frame:
+
+    python3 batch.py
+
+Sparkles are only for show, so they are not simulated here.
+
+Requires numpy.
+"""
+
+from random import Random
+import time
+import numpy as np
+
+from engine import (
+    GameState,
+    WIDTH,
+    HEIGHT,
+    PADDLE_HEIGHT,
+    PADDLE_HEIGHT_EXPANDED,
+    PADDLE_WIDTH,
+    PADDLE_SIDE,
+    PADDLE_MOVE_SPEED,
+    PADDLE_MOVE_SPEED_SLOW,
+    BALL_INITIAL_VELOCITY,
+    BALL_SIDE,
+    WIN_CONDITION,
+    SPEED_PERIOD,
+    SPEED_AMOUNT,
+    START_DELAY,
+    INPUT_L_UP,
+    INPUT_L_DOWN,
+    INPUT_R_UP,
+    INPUT_R_DOWN,
+)
+from objects import SPIN, BOUNCE, BOUNCE_FRICTION, GIANT_SIDE_CHANGE
+from pickups import PICKUP_INTERVAL, PICKUP_WIDTH, PICKUP_LENGTH
+
+#############
+# Constants #
+#############
+
+# Pickup types, in the same order as the pickup table in GameState.
+PICKUP_TYPES = ("sparkle", "expand", "slow", "bounce", "giantball")
+SPARKLE, EXPAND, SLOW, BOUNCE_TYPE, GIANT = range(len(PICKUP_TYPES))
+
+# Capacity of the per-match pickup slots. Pickups stay on the board until
+# collected, and GameState has no limit, so a match which fills them stops
+# following GameState: further spawns are dropped (and counted in
+# BatchGame.pickups_dropped) rather than stop every other match in the batch.
+MAX_PICKUPS = 16
+# Starting capacity of the per-match condition slots, which grow as needed.
+MAX_CONDITIONS = 16
+CONDITION_ARRAYS = (
+    "condition_alive",
+    "condition_type",
+    "condition_end",
+    "condition_target",
+)
+
+LEFT, RIGHT = 0, 1
+
+# Rows of BatchGame.buffer, which holds the floating point state of the ball
+# and paddles. The first STATE_ROWS are what a player can see.
+BUFFER_ROWS = (
+    "x",
+    "y",
+    "x_vol",
+    "y_vol",
+    "l_paddle_y",
+    "r_paddle_y",
+    "l_paddle_height",
+    "r_paddle_height",
+    "width",
+    "height",
+    "l_move_speed",
+    "r_move_speed",
+)
+STATE_ROWS = 8
+PADDLE_X = np.array([[PADDLE_SIDE], [WIDTH - PADDLE_SIDE - PADDLE_WIDTH]], dtype=float)
+
+# Values of BatchGame.outcome.
+OUTCOME_NONE = 0
+OUTCOME_L = 1  # Left player scored
+OUTCOME_R = 2  # Right player scored
+
+
+#####################
+# The batched game #
+#####################
+
+
+class BatchGame:
+    """N matches of pong, stepped together."""
+
+    def __init__(self, n, seeds=None):
+        """Allocate the state arrays and set up every match.
+
+        Match i draws its random numbers from Random(seeds[i]). If no seeds are
+        given each match gets an unseeded generator."""
+
+        self.n = n
+        if seeds is None:
+            seeds = [None] * n
+        self.seeds = list(seeds)
+        self.rngs = [Random(seed) for seed in self.seeds]
+
+        self.frame = np.zeros(n, dtype=np.int64)
+        self.start = np.zeros(n, dtype=np.int64)
+        self.speed_up = np.zeros(n, dtype=np.int64)
+        self.l_score = np.zeros(n, dtype=np.int64)
+        self.r_score = np.zeros(n, dtype=np.int64)
+        self.finish = np.zeros(n, dtype=bool)
+
+        # The ball and paddle arrays are all rows of one buffer, so they can
+        # be handed out together without copying (see BUFFER_ROWS). They are
+        # only ever updated in place.
+        self.buffer = np.zeros((len(BUFFER_ROWS), n))
+
+        # Ball
+        self.x = self.buffer[0]
+        self.y = self.buffer[1]
+        self.x_vol = self.buffer[2]
+        self.y_vol = self.buffer[3]
+        self.width = self.buffer[8]
+        self.height = self.buffer[9]
+        self.bounce_status = np.zeros(n, dtype=np.int64)
+
+        # Paddles, indexed by [LEFT or RIGHT, match]
+        self.paddle_y = self.buffer[4:6]
+        self.paddle_height = self.buffer[6:8]
+        self.move_speed = self.buffer[10:12]
+        self.expand_count = np.zeros((2, n), dtype=np.int64)
+        self.slow_count = np.zeros((2, n), dtype=np.int64)
+
+        # Pickups on the board, and active conditions, indexed by [match, slot]
+        self.next_pickup = np.zeros(n, dtype=np.int64)
+        self.pickup_alive = np.zeros((n, MAX_PICKUPS), dtype=bool)
+        self.pickup_x = np.zeros((n, MAX_PICKUPS))
+        self.pickup_y = np.zeros((n, MAX_PICKUPS))
+        self.pickup_type = np.zeros((n, MAX_PICKUPS), dtype=np.int64)
+        self.pickup_order = np.zeros((n, MAX_PICKUPS), dtype=np.int64)
+        self.condition_alive = np.zeros((n, MAX_CONDITIONS), dtype=bool)
+        self.condition_type = np.zeros((n, MAX_CONDITIONS), dtype=np.int64)
+        self.condition_end = np.zeros((n, MAX_CONDITIONS), dtype=np.int64)
+        self.condition_target = np.zeros((n, MAX_CONDITIONS), dtype=np.int64)
+        self.pickup_count = 0
+        self.pickups_dropped = np.zeros(n, dtype=np.int64)  # Spawns onto a full board
+
+        # What happened in the last step
+        self.outcome = np.zeros(n, dtype=np.int8)
+        self.hit = np.zeros(n, dtype=bool)
+        self.collected = np.zeros(n, dtype=bool)
+
+        self.pickup_left = PADDLE_WIDTH + PADDLE_SIDE + 2
+        self.pickup_right = WIDTH - self.pickup_left
+
+        self.reset()
+
+    def reset(self, mask=None):
+        """Start new matches for the masked matches (all of them by default).
+
+        Each match carries on drawing from its own random number generator."""
+
+        if mask is None:
+            mask = np.ones(self.n, dtype=bool)
+
+        self.frame[mask] = 0
+        self.l_score[mask] = 0
+        self.r_score[mask] = 0
+        self.finish[mask] = False
+
+        self.x[mask] = WIDTH // 2
+        self.y[mask] = HEIGHT // 2
+        self.width[mask] = BALL_SIDE
+        self.height[mask] = BALL_SIDE
+        self.bounce_status[mask] = 0
+
+        self.paddle_y[:, mask] = (HEIGHT - PADDLE_HEIGHT) // 2
+        self.paddle_height[:, mask] = PADDLE_HEIGHT
+        self.move_speed[:, mask] = PADDLE_MOVE_SPEED
+        self.expand_count[:, mask] = 0
+        self.slow_count[:, mask] = 0
+
+        self.pickup_alive[mask] = False
+        self.pickup_x[mask] = 0  # Cleared too, as they are observed (see env.py)
+        self.pickup_y[mask] = 0
+        self.pickup_type[mask] = 0
+        self.pickups_dropped[mask] = 0
+        self.condition_alive[mask] = False
+
+        # Draw in the same order as GameState.__init__: the ball is reset when
+        # it is created, then the first pickup is timed, then the ball is reset
+        # again by reset_after_score.
+        for i in np.flatnonzero(mask):
+            rng = self.rngs[i]
+            rng.choice((-1, 1))
+            rng.choice((-1, 1))
+            self.next_pickup[i] = rng.randint(*PICKUP_INTERVAL)
+        self.reset_after_score(mask)
+
+    def reset_after_score(self, mask):
+        """Restart the timers and send the ball off from the middle again."""
+
+        self.start[mask] = self.frame[mask] + START_DELAY
+        self.speed_up[mask] = self.start[mask] + SPEED_PERIOD
+        self.x[mask] = WIDTH // 2
+        self.y[mask] = HEIGHT // 2
+        for i in np.flatnonzero(mask):
+            rng = self.rngs[i]
+            self.x_vol[i] = BALL_INITIAL_VELOCITY * rng.choice((-1, 1))
+            self.y_vol[i] = BALL_INITIAL_VELOCITY * rng.choice((-1, 1))
+
+    ##############
+    # Game logic #
+    ##############
+
+    def step(self, inputs):
+        """Advance every match by one frame.
+
+        Inputs is an array of N integers made up of the engine.INPUT_* flags.
+        The results of the step are left in self.outcome, self.hit and
+        self.collected.
+        """
+
+        inputs = np.asarray(inputs)
+        self.outcome[:] = OUTCOME_NONE
+        self.hit[:] = False
+        self.collected[:] = False
+
+        self.update_paddles(inputs)
+
+        active = (self.frame > self.start) & ~self.finish
+        if active.any():
+            self.update_ball(active)
+            self.check_speed(active)
+            self.check_collision(active)
+            self.check_pickup(active)
+            self.check_pickup_collision(active)
+
+        self.frame += 1
+
+    def update_paddles(self, inputs):
+        """Move the paddles, as in Paddle.update."""
+
+        for side, up_flag, down_flag in (
+            (LEFT, INPUT_L_UP, INPUT_L_DOWN),
+            (RIGHT, INPUT_R_UP, INPUT_R_DOWN),
+        ):
+            up = (inputs & up_flag) != 0
+            down = ~up & ((inputs & down_flag) != 0)
+            y = self.paddle_y[side]
+            speed = self.move_speed[side]
+            height = self.paddle_height[side]
+
+            y = np.where(up, y - speed, np.where(down, y + speed, y))
+            y = np.where(y < 0, 0.0, y)
+            y = np.where(y + height > HEIGHT, HEIGHT - height, y)
+            self.paddle_y[side] = y
+
+    def update_ball(self, active):
+        """Move the ball and bounce it off the walls or score, as in Ball.update."""
+
+        bouncing = self.bounce_status > 0
+
+        x = np.where(active, self.x + self.x_vol, self.x)
+        y = np.where(active, self.y + self.y_vol, self.y)
+        y_vol = np.where(active & bouncing, self.y_vol + BOUNCE, self.y_vol)
+
+        r_scores = active & (x < 0)
+        l_scores = active & ~r_scores & (x + self.width > WIDTH)
+        walls = active & ~(r_scores | l_scores)
+
+        top = walls & (y < 0)
+        bottom = walls & ~top & (y + self.height > HEIGHT)
+        y_vol = np.where(top, -y_vol, y_vol)
+        y = np.where(top, -y, y)
+        y_vol = np.where(
+            bottom, np.where(bouncing, -y_vol + BOUNCE_FRICTION, -y_vol), y_vol
+        )
+        y = np.where(bottom, 2 * HEIGHT - y - 2 * self.height, y)
+
+        self.x[:] = x
+        self.y[:] = y
+        self.y_vol[:] = y_vol
+
+        scored = l_scores | r_scores
+        if scored.any():
+            self.score(l_scores, r_scores)
+
+    def score(self, l_scores, r_scores):
+        """Add to the scores and check the win condition, as in GameState.score."""
+
+        self.outcome[l_scores] = OUTCOME_L
+        self.outcome[r_scores] = OUTCOME_R
+        self.l_score += l_scores
+        self.r_score += r_scores
+        scored = l_scores | r_scores
+        self.finish |= scored & (
+            (self.l_score >= WIN_CONDITION) | (self.r_score >= WIN_CONDITION)
+        )
+        self.reset_after_score(scored)
+
+    def check_speed(self, active):
+        """Add velocity to the ball periodically, as in GameState.check_speed."""
+
+        speed = active & (self.frame > self.speed_up)
+        if not speed.any():
+            return
+        self.speed_up += np.where(speed, SPEED_PERIOD, 0)
+        x_sign = np.where(self.x_vol >= 0, 1.0, -1.0)
+        y_sign = np.where(self.y_vol >= 0, 1.0, -1.0)
+        self.x_vol[:] = np.where(speed, self.x_vol + SPEED_AMOUNT * x_sign, self.x_vol)
+        self.y_vol[:] = np.where(speed, self.y_vol + SPEED_AMOUNT * y_sign, self.y_vol)
+
+    def check_collision(self, active):
+        """Rebound the ball off the paddles with spin, as in Ball.check_collision."""
+
+        unhit = active.copy()
+        for side in (LEFT, RIGHT):
+            paddle_x = PADDLE_X[side, 0]
+            paddle_y = self.paddle_y[side]
+            paddle_height = self.paddle_height[side]
+
+            hit = unhit & ~(
+                (self.x + self.width < paddle_x)
+                | (paddle_x + PADDLE_WIDTH < self.x)
+                | (self.y + self.height < paddle_y)
+                | (paddle_y + paddle_height < self.y)
+            )
+            if not hit.any():
+                continue
+            unhit &= ~hit
+
+            # Ball.spin_ball
+            paddle_centre = paddle_height / 2
+            ball_centre = self.y + self.height / 2
+            hit_position = ball_centre - paddle_y
+            spin = (hit_position - paddle_centre) / paddle_centre * SPIN
+            self.y_vol[:] = np.where(hit, self.y_vol + spin, self.y_vol)
+
+            self.x_vol[:] = np.where(hit, -self.x_vol, self.x_vol)
+            ball_center = self.x + self.width / 2
+            paddle_center = paddle_x + PADDLE_WIDTH / 2
+            self.x[:] = np.where(
+                hit,
+                np.where(
+                    ball_center > paddle_center,
+                    paddle_x + PADDLE_WIDTH,
+                    paddle_x - self.width,
+                ),
+                self.x,
+            )
+            self.hit |= hit
+
+    def check_pickup(self, active):
+        """Create pickups and end conditions, as in Pickups.check_pickup.
+
+        A pickup spawning onto a full board is dropped (see MAX_PICKUPS), after
+        the same random draws, so the match's random numbers stay in step."""
+
+        spawn = active & (self.frame > self.next_pickup)
+        for i in np.flatnonzero(spawn):
+            rng = self.rngs[i]
+            x = rng.randint(self.pickup_left, self.pickup_right - PICKUP_WIDTH)
+            y = rng.randint(0, HEIGHT - PICKUP_WIDTH)
+            pickup_type = PICKUP_TYPES.index(rng.choice(PICKUP_TYPES))
+            self.next_pickup[i] = self.frame[i] + rng.randint(*PICKUP_INTERVAL)
+
+            if self.pickup_alive[i].all():
+                self.pickups_dropped[i] += 1
+            else:
+                self.add_pickup(i, x, y, pickup_type)
+
+        ending = (
+            active[:, None]
+            & self.condition_alive
+            & (self.frame[:, None] > self.condition_end)
+        )
+        if ending.any():
+            self.condition_alive &= ~ending
+            self.end_conditions(ending)
+
+    def add_pickup(self, i, x, y, pickup_type):
+        """Put a pickup on the board of match i, in its first free slot."""
+
+        free = np.flatnonzero(~self.pickup_alive[i])
+        if not len(free):
+            raise OverflowError(
+                "Match {} has more than MAX_PICKUPS ({}) pickups on the board.".format(
+                    i, MAX_PICKUPS
+                )
+            )
+        slot = free[0]
+        self.pickup_alive[i, slot] = True
+        self.pickup_x[i, slot] = x
+        self.pickup_y[i, slot] = y
+        self.pickup_type[i, slot] = pickup_type
+        self.pickup_order[i, slot] = self.pickup_count
+        self.pickup_count += 1
+
+    def grow_conditions(self):
+        """Double the condition slots of every match, keeping those in use."""
+
+        for name in CONDITION_ARRAYS:
+            array = getattr(self, name)
+            grown = np.zeros((self.n, 2 * array.shape[1]), dtype=array.dtype)
+            grown[:, : array.shape[1]] = array
+            setattr(self, name, grown)
+
+    def end_conditions(self, ending):
+        """Run the exit functions of the ending conditions."""
+
+        def count(pickup_type, target=None):
+            matches = ending & (self.condition_type == pickup_type)
+            if target is not None:
+                matches &= self.condition_target == target
+            return matches.sum(axis=1)
+
+        for side in (LEFT, RIGHT):
+            # GameState.contract_paddle
+            contracting = count(EXPAND, side)
+            self.expand_count[side] -= contracting
+            normal = (contracting > 0) & (self.expand_count[side] == 0)
+            self.paddle_height[side] = np.where(
+                normal, PADDLE_HEIGHT, self.paddle_height[side]
+            )
+            self.paddle_y[side] = np.where(
+                normal,
+                self.paddle_y[side] + (PADDLE_HEIGHT_EXPANDED - PADDLE_HEIGHT) // 2,
+                self.paddle_y[side],
+            )
+
+            # GameState.speed_paddle
+            speeding = count(SLOW, side)
+            self.slow_count[side] -= speeding
+            normal = (speeding > 0) & (self.slow_count[side] == 0)
+            self.move_speed[side] = np.where(
+                normal, PADDLE_MOVE_SPEED, self.move_speed[side]
+            )
+
+        self.bounce_status -= count(BOUNCE_TYPE)
+        self.resize_ball(-count(GIANT))
+
+    def check_pickup_collision(self, active):
+        """Collect the first pickup the ball is touching, as in Pickups.check_collision."""
+
+        touching = (
+            active[:, None]
+            & self.pickup_alive
+            & ~(
+                (self.pickup_x + PICKUP_WIDTH < self.x[:, None])
+                | (self.x[:, None] + self.width[:, None] < self.pickup_x)
+                | (self.pickup_y + PICKUP_WIDTH < self.y[:, None])
+                | (self.y[:, None] + self.height[:, None] < self.pickup_y)
+            )
+        )
+        collected = touching.any(axis=1)
+        if not collected.any():
+            return
+
+        matches = np.flatnonzero(collected)
+        order = np.where(touching[matches], self.pickup_order[matches], np.iinfo(np.int64).max)
+        slots = order.argmin(axis=1)
+        pickup_types = self.pickup_type[matches, slots]
+        self.pickup_alive[matches, slots] = False
+        self.collected |= collected
+
+        # The expand and slow pickups affect the paddle that last hit the ball.
+        targets = np.where(self.x_vol[matches] > 0, LEFT, RIGHT)
+
+        # Every collected pickup starts a condition, so none can be left
+        # without its end: when a match's slots are full there are more
+        if self.condition_alive[matches].all(axis=1).any():
+            self.grow_conditions()
+        condition_slots = (~self.condition_alive[matches]).argmax(axis=1)
+        fill = matches, condition_slots
+        self.condition_alive[fill] = True
+        self.condition_type[fill] = pickup_types
+        self.condition_end[fill] = self.frame[matches] + PICKUP_LENGTH
+        self.condition_target[fill] = targets
+
+        for pickup_type in (EXPAND, SLOW):
+            chosen = pickup_types == pickup_type
+            sides = targets[chosen], matches[chosen]
+            if pickup_type == EXPAND:
+                # GameState.expand_paddle
+                self.paddle_height[sides] = PADDLE_HEIGHT_EXPANDED
+                self.paddle_y[sides] -= (PADDLE_HEIGHT_EXPANDED - PADDLE_HEIGHT) // 2
+                self.expand_count[sides] += 1
+            else:
+                # GameState.slow_paddle
+                self.move_speed[sides] = PADDLE_MOVE_SPEED_SLOW
+                self.slow_count[sides] += 1
+
+        self.bounce_status[matches[pickup_types == BOUNCE_TYPE]] += 1
+        growing = np.zeros(self.n, dtype=np.int64)
+        growing[matches[pickup_types == GIANT]] = 1
+        self.resize_ball(growing)
+
+    def resize_ball(self, amount):
+        """Grow (or shrink, if negative) the ball around its centre, as in
+        Ball.giant_on and Ball.giant_off."""
+
+        changing = amount != 0
+        if not changing.any():
+            return
+        self.width[:] = np.where(changing, self.width + GIANT_SIDE_CHANGE * amount, self.width)
+        self.height[:] = np.where(changing, self.height + GIANT_SIDE_CHANGE * amount, self.height)
+        self.x[:] = np.where(changing, self.x - GIANT_SIDE_CHANGE // 2 * amount, self.x)
+        self.y[:] = np.where(changing, self.y - GIANT_SIDE_CHANGE // 2 * amount, self.y)
+
+
+#########################
+# Checking against the #
+# scalar game engine    #
+#########################
+
+
+def tracking_inputs(ball_y, l_paddle_y, l_height, r_paddle_y, r_height):
+    """Simple bot controls for both paddles, which follow the ball.
+
+    Works on plain numbers or arrays."""
+
+    inputs = np.where(ball_y < l_paddle_y + 2, INPUT_L_UP, 0)
+    inputs |= np.where(ball_y > l_paddle_y + l_height - 2, INPUT_L_DOWN, 0) * (inputs == 0)
+    r_up = np.where(ball_y < r_paddle_y + 2, INPUT_R_UP, 0)
+    inputs |= r_up
+    inputs |= np.where(ball_y > r_paddle_y + r_height - 2, INPUT_R_DOWN, 0) * (r_up == 0)
+    return inputs
+
+
+def batch_fields(batch):
+    """The fields of a BatchGame compared by check_parity."""
+
+    return {
+        "x": batch.x,
+        "y": batch.y,
+        "x_vol": batch.x_vol,
+        "y_vol": batch.y_vol,
+        "width": batch.width,
+        "l_y": batch.paddle_y[LEFT],
+        "r_y": batch.paddle_y[RIGHT],
+        "l_height": batch.paddle_height[LEFT],
+        "r_height": batch.paddle_height[RIGHT],
+        "l_speed": batch.move_speed[LEFT],
+        "r_speed": batch.move_speed[RIGHT],
+        "l_score": batch.l_score,
+        "r_score": batch.r_score,
+        "finish": batch.finish,
+        "pickups": batch.pickup_alive.sum(axis=1),
+    }
+
+
+def state_fields(states):
+    """The fields of a list of GameStates compared by check_parity."""
+
+    return {
+        "x": [s.ball.x for s in states],
+        "y": [s.ball.y for s in states],
+        "x_vol": [s.ball.x_vol for s in states],
+        "y_vol": [s.ball.y_vol for s in states],
+        "width": [s.ball.width for s in states],
+        "l_y": [s.l_paddle.y for s in states],
+        "r_y": [s.r_paddle.y for s in states],
+        "l_height": [s.l_paddle.height for s in states],
+        "r_height": [s.r_paddle.height for s in states],
+        "l_speed": [s.l_paddle.move_speed for s in states],
+        "r_speed": [s.r_paddle.move_speed for s in states],
+        "l_score": [s.l_score for s in states],
+        "r_score": [s.r_score for s in states],
+        "finish": [s.finish for s in states],
+        "pickups": [len(s.pickups.pickups) for s in states],
+    }
+
+
+def tracking_policy(batch, frame):
+    """Inputs for every match of a batch from tracking_inputs."""
+
+    return tracking_inputs(
+        batch.y,
+        batch.paddle_y[LEFT],
+        batch.paddle_height[LEFT],
+        batch.paddle_y[RIGHT],
+        batch.paddle_height[RIGHT],
+    )
+
+
+def check_parity(n=50, frames=20000, seeds=None, policy=tracking_policy, setup=None):
+    """Step n GameStates and a BatchGame with the same seeds (0 to n - 1 by
+    default) and inputs, and raise AssertionError at the first frame where any
+    match differs.
+
+    The inputs each frame are policy(batch, frame), an array of n. If setup is
+    given, setup(states, batch) is called before the first step, to put the
+    matches into some particular position."""
+
+    if seeds is None:
+        seeds = range(n)
+    states = [GameState(seed=seed) for seed in seeds]
+    batch = BatchGame(n, seeds=seeds)
+    if setup:
+        setup(states, batch)
+
+    for frame in range(frames):
+        inputs = policy(batch, frame)
+        for state, match_inputs in zip(states, inputs):
+            state.step(int(match_inputs))
+        batch.step(inputs)
+
+        expected = state_fields(states)
+        for name, actual in batch_fields(batch).items():
+            differs = np.flatnonzero(np.asarray(expected[name]) != actual)
+            if len(differs):
+                i = differs[0]
+                raise AssertionError(
+                    f"Frame {frame}, match {i}: {name} is {actual[i]}, "
+                    f"expected {expected[name][i]}"
+                )
+
+
+def measure(n=10000, frames=1000):
+    """Return the match-frames per second of a BatchGame of n matches."""
+
+    batch = BatchGame(n, seeds=range(n))
+    begin = time.perf_counter()
+    for frame in range(frames):
+        batch.step(tracking_policy(batch, frame))
+        batch.reset(batch.finish)
+    return n * frames / (time.perf_counter() - begin)
+
+
+if __name__ == "__main__":
+    check_parity()
+    print("Batch and scalar engines agree.")
+    print("{:,.0f} match-frames/sec".format(measure()))
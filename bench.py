@@ -0,0 +1,386 @@
+"""Benchmarks of the game's hot paths, with a check for regressions.
+
+Each benchmark times a fixed, seeded piece of work headless, over and over
+until at least MIN_TIME seconds have gone by, repeats that a few times (taking
+turns with the other benchmarks) and keeps the fastest run. It reports how
+many operations a second it managed (so higher is always better), and its
+noise - how much faster its fastest run was than its slowest:
+
+    python3 bench.py
+
+prints the results,
+
+    python3 bench.py --save baselines.json
+
+saves them as a baseline, and
+
+    python3 bench.py --compare baselines.json --tolerance 10
+
+runs them again and exits with an error if any are more than 10% slower than
+the baseline, so a change to the physics or drawing can't quietly eat into
+the frame budget. The noise in the baseline and now is printed alongside, to
+judge a failure by; --allow-noise widens the tolerance to it, so a benchmark
+which varies by 30% from run to run on this machine is only flagged if it's
+more than 30% slower. Baselines only compare fairly on the machine they were
+made on.
+
+The music benchmarks need pyxel, and are left out where it can't start.
+
+Requires numpy.
+"""
+
+import argparse
+import json
+import os
+import platform
+import sys
+import tempfile
+import time
+from random import Random
+import numpy as np
+
+from engine import (
+    GameState,
+    WIDTH,
+    HEIGHT,
+    INPUT_L_UP,
+    INPUT_L_DOWN,
+    INPUT_R_UP,
+    INPUT_R_DOWN,
+    DIMENSIONS,
+    BALL_SIDE,
+    BALL_INITIAL_VELOCITY,
+    COL_BALL,
+)
+from objects import Ball
+from pickups import Pickups, PickupType, PICKUP_LENGTH
+from particle_emitter import ParticleEmitter
+from utilities import is_overlap, Rect
+
+REPEATS = 5  # Runs of each benchmark, keeping the fastest
+MIN_TIME = 0.25  # Seconds each run is kept going for, at least
+TOLERANCE = 10  # Percent slower than the baseline allowed by --compare
+PICKUP_COUNTS = (10, 100, 1000)
+PARTICLE_COUNTS = (4096, 65536)
+
+
+##############
+# Benchmarks #
+##############
+
+
+def bench_overlap(number=200_000):
+    """is_overlap between rectangles scattered over the board."""
+
+    rng = Random(0)
+    rects = [
+        Rect(rng.uniform(0, WIDTH), rng.uniform(0, HEIGHT), 2, 2) for _ in range(1000)
+    ]
+    pairs = [(rects[i % 1000], rects[(i * 7 + 1) % 1000]) for i in range(number)]
+    begin = time.perf_counter()
+    for first, second in pairs:
+        is_overlap(first, second)
+    return number, time.perf_counter() - begin
+
+
+def bench_ball(number=100_000):
+    """Ball.update and Ball.check_collision against both paddles, a frame at a time."""
+
+    state = GameState(seed=0)
+    ball = state.ball
+    paddles = [state.l_paddle, state.r_paddle]
+    begin = time.perf_counter()
+    for _ in range(number):
+        if ball.update():
+            ball.reset()
+        ball.check_collision(paddles)
+    return number, time.perf_counter() - begin
+
+
+def bench_pickups(count, number=20_000):
+    """Pickups.check_pickup and check_collision with count pickups on the board
+    and count conditions active, the ball wandering over the board."""
+
+    rng = Random(count)
+    pickups = Pickups(
+        {name: PickupType(colour) for name, colour in (("a", 8), ("b", 11))},
+        6,
+        WIDTH - 6,
+        0,
+        HEIGHT,
+        rng=rng,
+    )
+    pickups.next_pickup = float("inf")  # Only those created here
+    for _ in range(count):
+        pickups.create_pickup()
+    for i in range(count):
+        pickups.active_conditions.schedule("a", i * PICKUP_LENGTH // count)
+    positions = [
+        Rect(rng.uniform(0, WIDTH - 2), rng.uniform(0, HEIGHT - 2), 2, 2)
+        for _ in range(number)
+    ]
+
+    begin = time.perf_counter()
+    for frame, ball in enumerate(positions):
+        pickups.check_pickup(frame)
+        if pickups.check_collision(ball, frame):
+            pickups.create_pickup()
+        while len(pickups.active_conditions) < count:
+            pickups.active_conditions.schedule("a", frame + PICKUP_LENGTH)
+    return number, time.perf_counter() - begin
+
+
+def bench_particles(count, number=200):
+    """ParticleEmitter.display (with a drawing function which does nothing)
+    and ParticleEmitter.draw with count live particles."""
+
+    ball = Ball(
+        (0, 0), COL_BALL, BALL_SIDE, BALL_SIDE, BALL_INITIAL_VELOCITY, DIMENSIONS
+    )
+    emitter = ParticleEmitter(ball, capacity=count, rng=Random(0))
+    generator = np.random.default_rng(0)
+    emitter.emit_many(
+        generator.uniform(0, WIDTH, count),
+        generator.uniform(0, HEIGHT, count),
+        generator.integers(8, 15, count),
+        0,
+    )
+    pixels = np.zeros((HEIGHT, WIDTH), dtype=np.uint8)
+
+    def pset(x, y, colour):
+        pass
+
+    frames = max(number * 4096 // count, 1)
+    begin = time.perf_counter()
+    for _ in range(frames):
+        emitter.display(pset, 1)
+        emitter.draw(pixels, 1)
+    return frames, time.perf_counter() - begin
+
+
+def bench_match(matches=5):
+    """Whole matches, frames a second, between paddles scripted to follow the
+    ball (missing now and then)."""
+
+    rng = Random(0)
+    frames = 0
+    begin = time.perf_counter()
+    for _ in range(matches):
+        state = GameState(seed=rng.getrandbits(64))
+        while not state.finish:
+            target = state.ball.y + (state.frame_count // 97 % 5 - 2) * 4
+            inputs = 0
+            for paddle, up, down in (
+                (state.l_paddle, INPUT_L_UP, INPUT_L_DOWN),
+                (state.r_paddle, INPUT_R_UP, INPUT_R_DOWN),
+            ):
+                middle = paddle.y + paddle.height / 2
+                if target < middle - 1:
+                    inputs |= up
+                elif target > middle + 1:
+                    inputs |= down
+            state.step(inputs)
+        frames += state.frame_count
+    return frames, time.perf_counter() - begin
+
+
+def bench_music_build(number=20):
+    """Music.__init__ with no sound bank yet, building every sound and the
+    music and saving the bank (in a temporary directory)."""
+
+    from music import Music
+
+    with tempfile.TemporaryDirectory() as directory:
+        bank = Music.bank_path(directory)
+        seconds = 0
+        for _ in range(number):
+            if os.path.exists(bank):
+                os.remove(bank)
+            begin = time.perf_counter()
+            Music(bank)
+            seconds += time.perf_counter() - begin
+    return number, seconds
+
+
+def bench_music_load(number=20):
+    """Music.__init__ loading every sound and the music from a sound bank
+    (in a temporary directory)."""
+
+    from music import Music
+
+    with tempfile.TemporaryDirectory() as directory:
+        bank = Music.bank_path(directory)
+        Music(bank)
+        begin = time.perf_counter()
+        for _ in range(number):
+            Music(bank)
+        seconds = time.perf_counter() - begin
+    return number, seconds
+
+
+def start_pyxel():
+    """Start pyxel without a window or sound, returning whether it could."""
+
+    os.environ.setdefault("SDL_VIDEODRIVER", "dummy")
+    os.environ.setdefault("SDL_AUDIODRIVER", "dummy")
+    try:
+        import pyxel
+
+        pyxel.init(WIDTH, HEIGHT)
+    except Exception:
+        return False
+    return True
+
+
+def benchmarks():
+    """Return the benchmarks as a dict of name: function returning
+    (operations, seconds)."""
+
+    found = {
+        "overlap": bench_overlap,
+        "ball_step": bench_ball,
+    }
+    for count in PICKUP_COUNTS:
+        found[f"pickups_{count}"] = lambda count=count: bench_pickups(count)
+    for count in PARTICLE_COUNTS:
+        found[f"particles_{count}"] = lambda count=count: bench_particles(count)
+    found["match_frames"] = bench_match
+    if start_pyxel():
+        found["music_build"] = bench_music_build
+        found["music_load"] = bench_music_load
+    return found
+
+
+###########
+# Running #
+###########
+
+
+def time_run(function, min_time=MIN_TIME):
+    """Call a benchmark until at least min_time seconds have been timed,
+    returning the operations a second over all the calls."""
+
+    operations = seconds = 0
+    while seconds < min_time:
+        done, taken = function()
+        operations += done
+        seconds += taken
+    return operations / seconds
+
+
+def run(names=None, repeats=REPEATS):
+    """Run the benchmarks (all of them, or those named), printing the results.
+
+    Each round runs every benchmark once, so a spell of the machine being busy
+    with something else slows one run of many benchmarks rather than every run
+    of one. Returns a dict of name: operations a second, from the fastest run,
+    and a dict of name: noise, the percent the fastest run was faster than the
+    slowest."""
+
+    chosen = {
+        name: function
+        for name, function in benchmarks().items()
+        if not names or name in names
+    }
+    rates = {name: [] for name in chosen}
+    for _ in range(repeats):
+        for name, function in chosen.items():
+            rates[name].append(time_run(function))
+
+    results = {}
+    noise = {}
+    for name, runs in rates.items():
+        results[name] = max(runs)
+        noise[name] = (max(runs) / min(runs) - 1) * 100
+        print(
+            "{:<16}{:>16,.0f} /sec  noise {:.1f}%".format(name, max(runs), noise[name])
+        )
+    return results, noise
+
+
+def save_baseline(results, noise, filename):
+    """Save results and their noise as a JSON baseline, noting the machine
+    they were made on."""
+
+    baseline = {
+        "python": platform.python_version(),
+        "machine": platform.platform(),
+        "results": results,
+        "noise": noise,
+    }
+    with open(filename, "w") as file:
+        json.dump(baseline, file, indent=2)
+
+
+def compare(results, noise, filename, tolerance=TOLERANCE, allow_noise=False):
+    """Compare results with a saved baseline, printing the change in each and
+    the noise in the baseline and now.
+
+    Returns the names of the benchmarks more than tolerance percent slower, or
+    with allow_noise, more than their noise if that is more."""
+
+    with open(filename) as file:
+        baseline = json.load(file)
+    baseline_noise = baseline.get("noise", {})
+    baseline = baseline["results"]
+
+    regressions = []
+    for name, rate in results.items():
+        if name not in baseline:
+            continue
+        change = (rate / baseline[name] - 1) * 100
+        worst_noise = max(noise[name], baseline_noise.get(name, 0))
+        allowed = max(tolerance, worst_noise) if allow_noise else tolerance
+        slower = change < -allowed
+        if slower:
+            regressions.append(name)
+        print(
+            "{:<16}{:>+8.1f}%  (allowed -{:.1f}%, noise {:.1f}%){}".format(
+                name, change, allowed, worst_noise, "  REGRESSION" if slower else ""
+            )
+        )
+    return regressions
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Benchmark the game's hot paths, and check for regressions."
+    )
+    parser.add_argument(
+        "names", nargs="*", help="benchmarks to run (default: all of them)"
+    )
+    parser.add_argument("--save", metavar="JSON", help="save the results as a baseline")
+    parser.add_argument(
+        "--compare", metavar="JSON", help="fail if slower than this baseline"
+    )
+    parser.add_argument(
+        "--tolerance",
+        type=float,
+        default=TOLERANCE,
+        help="percent slower than the baseline allowed",
+    )
+    parser.add_argument(
+        "--allow-noise",
+        action="store_true",
+        help="allow each benchmark to be as much slower as its noise, if more",
+    )
+    parser.add_argument(
+        "--repeat", type=int, default=REPEATS, help="runs of each, keeping the fastest"
+    )
+    args = parser.parse_args()
+
+    results, noise = run(args.names, args.repeat)
+    if args.save:
+        save_baseline(results, noise, args.save)
+    if args.compare:
+        print()
+        regressions = compare(
+            results, noise, args.compare, args.tolerance, args.allow_noise
+        )
+        if regressions:
+            print(
+                "{} benchmark(s) slower than allowed by {}.".format(
+                    len(regressions), args.compare
+                )
+            )
+            sys.exit(1)
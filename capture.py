@@ -0,0 +1,394 @@
+"""Capturing matches to video.
+
+A Capture takes frames of the board at its own size (a 2d array of pyxel
+colour numbers, such as pong.py's screen) and writes them to a capture file
+on a background thread, so the game never waits on encoding or the disk.
+Each frame is copied into the next of a ring of preallocated buffers, and if
+the writer falls so far behind that the ring is full, the frame is dropped
+rather than holding up the game.
+
+The writer packs two pixels into each byte (there are only 16 colours),
+keeps only how each frame differs from the one before (XORed with it, so
+mostly zeros), and compresses CHUNK_FRAMES frames at a time into a chunk,
+each starting from a blank frame so chunks can be read on their own. A
+capture file is CAPTURE_MAGIC, a CAPTURE_HEADER_FORMAT header and the RGB
+palette, followed by chunks of a CHUNK_HEADER_FORMAT header and the
+compressed frames.
+
+    python3 pong.py --capture match.pongcap
+
+captures a match as it is played,
+
+    python3 capture.py recordings/match.pongrec match.pongcap
+
+captures a recorded match (see replay.py) headless, faster than real time,
+and
+
+    python3 capture.py match.pongcap match.gif --scale 4
+
+turns a capture into an animated GIF.
+
+Requires numpy.
+"""
+
+import argparse
+import struct
+import threading
+import time
+import zlib
+import numpy as np
+
+from engine import WIDTH, HEIGHT, PADDLE_SIDE, PADDLE_WIDTH
+from replay import Recording
+
+CAPTURE_MAGIC = b"PONGCAP1"
+CAPTURE_EXTENSION = ".pongcap"
+CAPTURE_HEADER_FORMAT = struct.Struct("<HHHH")  # width, height, fps, palette size
+CHUNK_HEADER_FORMAT = struct.Struct("<II")  # frames, compressed length
+CAPTURE_RING = 64  # Frames which can wait to be written
+CHUNK_FRAMES = 120  # Frames compressed together
+
+# The colours drawn by pong.py, and pyxel's palette as 0xRRGGBB
+COL_BACKGROUND = 5
+COL_SCORE = 13
+# fmt: off
+PALETTE = (
+    0x000000, 0x2B335F, 0x7E2072, 0x19959C, 0x8B4852, 0x395C98, 0xA9C1FF, 0xEEEEEE,
+    0xD4186C, 0xD38441, 0xE9C35B, 0x70C6A9, 0x7696DE, 0xA3A3A3, 0xFF9798, 0xEDC7B0,
+)
+# fmt: on
+
+# Pyxel's font for the digits of the score, a row at a time
+FONT_WIDTH = 4
+DIGITS = {
+    "0": (".##", "#.#", "#.#", "#.#", "##."),
+    "1": (".#.", "##.", ".#.", ".#.", ".#."),
+    "2": ("##.", "..#", ".#.", "#..", "###"),
+    "3": ("##.", "..#", ".#.", "..#", "##."),
+    "4": ("#.#", "#.#", "###", "..#", "..#"),
+    "5": ("###", "#..", "##.", "..#", "##."),
+    "6": (".##", "#..", "###", "#.#", "###"),
+    "7": ("###", "..#", ".#.", "#..", "#.."),
+    "8": ("###", "#.#", "###", "#.#", "###"),
+    "9": ("###", "#.#", "###", "..#", "##."),
+}
+DIGIT_MASKS = {
+    digit: np.array([[pixel == "#" for pixel in row] for row in rows])
+    for digit, rows in DIGITS.items()
+}
+
+
+class Capture:
+    """Writes frames to a capture file on a background thread."""
+
+    def __init__(
+        self,
+        filename,
+        width=WIDTH,
+        height=HEIGHT,
+        fps=60,
+        palette=PALETTE,
+        ring=CAPTURE_RING,
+        chunk_frames=CHUNK_FRAMES,
+    ):
+        """Open the file and start the writer."""
+
+        self.file = open(filename, "wb")
+        self.file.write(CAPTURE_MAGIC)
+        self.file.write(CAPTURE_HEADER_FORMAT.pack(width, height, fps, len(palette)))
+        self.file.write(b"".join(colour.to_bytes(3, "big") for colour in palette))
+        self.file.flush()
+
+        self.frames = np.zeros((ring, height, width), dtype=np.uint8)
+        self.chunk_frames = chunk_frames
+        self.added = 0  # Frames put in the ring
+        self.dropped = 0
+        self.waiting = threading.Semaphore(0)  # Frames in the ring to write
+        self.space = threading.Semaphore(ring)  # Empty buffers in the ring
+        self.closing = False
+        self.writer = threading.Thread(target=self.write_frames, daemon=True)
+        self.writer.start()
+
+    def add(self, pixels, wait=False):
+        """Copy a frame into the ring, to be written.
+
+        If the ring is full the frame is dropped (and False returned), unless
+        wait is True, when it waits for the writer to catch up."""
+
+        if not self.space.acquire(blocking=wait):
+            self.dropped += 1
+            return False
+        np.copyto(self.frames[self.added % len(self.frames)], pixels)
+        self.added += 1
+        self.waiting.release()
+        return True
+
+    def close(self):
+        """Write the frames still waiting and close the file."""
+
+        self.closing = True
+        self.waiting.release()  # Wake the writer, if it's waiting
+        self.writer.join()
+        self.file.close()
+
+    ##########
+    # Writer #
+    ##########
+
+    def write_frames(self):
+        """Write frames from the ring as they arrive, until closed."""
+
+        written = 0
+        chunk = []
+        previous = None
+        while True:
+            self.waiting.acquire()
+            if written == self.added:
+                if self.closing:
+                    break
+                continue
+            packed = pack_pixels(self.frames[written % len(self.frames)])
+            written += 1
+            self.space.release()
+
+            chunk.append(packed if previous is None else packed ^ previous)
+            previous = packed
+            if len(chunk) == self.chunk_frames:
+                self.write_chunk(chunk)
+                chunk = []
+                previous = None
+        if chunk:
+            self.write_chunk(chunk)
+
+    def write_chunk(self, frames):
+        """Compress and write a chunk of frames, straight to the disk so a
+        capture cut short keeps all but its last chunk."""
+
+        data = zlib.compress(b"".join(frame.tobytes() for frame in frames), 1)
+        self.file.write(CHUNK_HEADER_FORMAT.pack(len(frames), len(data)))
+        self.file.write(data)
+        self.file.flush()
+
+
+def pack_pixels(pixels):
+    """Pack a 2d array of 4 bit colours two to a byte (padding odd widths)."""
+
+    if pixels.shape[1] % 2:
+        pixels = np.pad(pixels, ((0, 0), (0, 1)))
+    return (pixels[:, 0::2] << 4) | pixels[:, 1::2]
+
+
+def unpack_pixels(packed, width):
+    """Undo pack_pixels."""
+
+    pixels = np.empty((packed.shape[0], packed.shape[1] * 2), dtype=np.uint8)
+    pixels[:, 0::2] = packed >> 4
+    pixels[:, 1::2] = packed & 15
+    return pixels[:, :width]
+
+
+def read_capture(filename):
+    """Return the (width, height, fps, palette) of a capture file, and an
+    iterator over its frames as 2d arrays of colour numbers."""
+
+    file = open(filename, "rb")
+    if file.read(len(CAPTURE_MAGIC)) != CAPTURE_MAGIC:
+        file.close()
+        raise ValueError("{} is not a capture.".format(filename))
+    width, height, fps, colours = CAPTURE_HEADER_FORMAT.unpack(
+        file.read(CAPTURE_HEADER_FORMAT.size)
+    )
+    palette_data = file.read(3 * colours)
+    palette = [
+        int.from_bytes(palette_data[i : i + 3], "big") for i in range(0, 3 * colours, 3)
+    ]
+    packed_shape = (height, (width + 1) // 2)
+
+    def frames():
+        with file:
+            while header := file.read(CHUNK_HEADER_FORMAT.size):
+                count, length = CHUNK_HEADER_FORMAT.unpack(header)
+                data = zlib.decompress(file.read(length))
+                deltas = np.frombuffer(data, dtype=np.uint8)
+                packed = np.bitwise_xor.accumulate(
+                    deltas.reshape((count,) + packed_shape), axis=0
+                )
+                for frame in packed:
+                    yield unpack_pixels(frame, width)
+
+    return (width, height, fps, palette), frames()
+
+
+##############
+# Drawing it #
+##############
+
+
+def fill(pixels, x, y, width, height, colour):
+    """Fill a rectangle of a 2d array of pixels, as pyxel.rect does (rounding
+    the position to the nearest pixel, halves away from zero)."""
+
+    left, top = (int(np.sign(value) * np.floor(abs(value) + 0.5)) for value in (x, y))
+    right = left + int(width)
+    bottom = top + int(height)
+    pixels[max(top, 0) : max(bottom, 0), max(left, 0) : max(right, 0)] = colour
+
+
+def text(pixels, x, y, digits, colour):
+    """Write a number into a 2d array of pixels in pyxel's font."""
+
+    height, width = pixels.shape
+    for i, digit in enumerate(digits):
+        rows, columns = np.nonzero(DIGIT_MASKS[digit])
+        rows = rows + y
+        columns = columns + x + i * FONT_WIDTH
+        visible = (columns >= 0) & (columns < width) & (rows >= 0) & (rows < height)
+        pixels[rows[visible], columns[visible]] = colour
+
+
+def draw_state(pixels, state):
+    """Draw a GameState (or MultiBallState) into a 2d array of pixels, as
+    pong.py draws it while the match is being played."""
+
+    pixels[:] = COL_BACKGROUND
+    state.sparkler.draw(pixels, state.frame_count)
+    for paddle in (state.l_paddle, state.r_paddle):
+        fill(pixels, paddle.x, paddle.y, paddle.width, paddle.height, paddle.colour)
+    for pickup in state.pickups.pickups:
+        colour = state.pickups.pickup_types[pickup.pickup_type].colour
+        fill(pixels, pickup.x, pickup.y, pickup.width, pickup.height, colour)
+    ball = state.ball
+    if np.ndim(ball.x):
+        ball.draw(pixels)
+    else:
+        fill(pixels, ball.x, ball.y, ball.width, ball.height, ball.colour)
+
+    buffer = PADDLE_SIDE + PADDLE_WIDTH + 2
+    text(pixels, buffer, 2, str(state.l_score), COL_SCORE)
+    text(pixels, WIDTH - FONT_WIDTH - buffer, 2, str(state.r_score), COL_SCORE)
+
+
+def capture_recording(recording, filename, fps=60):
+    """Replay a recording headless, capturing every step to a capture file.
+
+    Returns the final state."""
+
+    capture = Capture(filename, fps=fps)
+    pixels = np.zeros((HEIGHT, WIDTH), dtype=np.uint8)
+    state = recording.new_state()
+    try:
+        for inputs, steps in recording.inputs.runs:
+            for _ in range(steps):
+                state.step(inputs, recording.frames)
+                state.sparkler.sparkle_events(state.events)
+                draw_state(pixels, state)
+                capture.add(pixels, wait=True)
+    finally:
+        capture.close()
+    return state
+
+
+#######
+# GIF #
+#######
+
+GIF_CLEAR_EVERY = 12  # Codes between clear codes, so the code size never grows
+GIF_FPS = 30  # GIF viewers can't show frames for less than 2 hundredths of a second
+
+
+def lzw_codes(indices):
+    """Encode colour indices (0 - 15) as 5 bit GIF LZW codes without ever
+    building up the code table: a clear code every few codes keeps it empty,
+    which makes the codes simply the indices themselves."""
+
+    clear, end = 16, 17
+    groups = -(-len(indices) // GIF_CLEAR_EVERY)
+    table = np.full((groups, GIF_CLEAR_EVERY + 1), -1, dtype=np.int16)
+    table[:, 0] = clear
+    table[:, 1:].flat[: len(indices)] = indices
+    codes = np.append(table[table >= 0], end)
+    bits = (codes[:, None] >> np.arange(5)) & 1
+    data = np.packbits(bits.ravel(), bitorder="little").tobytes()
+    blocks = [data[i : i + 255] for i in range(0, len(data), 255)]
+    return b"".join(bytes([len(block)]) + block for block in blocks) + b"\x00"
+
+
+def write_gif(capture_filename, gif_filename, scale=1):
+    """Turn a capture file into an animated GIF, each pixel scale pixels wide.
+
+    Frames are dropped to bring it down to GIF_FPS, and only the rectangle of
+    each frame which changed is stored."""
+
+    (width, height, fps, palette), frames = read_capture(capture_filename)
+    rate = min(fps, GIF_FPS)
+    palette = (list(palette) + [0] * 16)[:16]
+    with open(gif_filename, "wb") as gif:
+        gif.write(b"GIF89a")
+        gif.write(struct.pack("<HHBBB", width * scale, height * scale, 0xF3, 0, 0))
+        gif.write(b"".join(colour.to_bytes(3, "big") for colour in palette))
+        gif.write(b"!\xff\x0bNETSCAPE2.0\x03\x01\x00\x00\x00")  # Loop forever
+
+        previous = None
+        shown = -1
+        for i, frame in enumerate(frames):
+            frame_number = i * rate // fps
+            if frame_number == shown:
+                continue
+            shown = frame_number
+            # In hundredths of a second, rounded so they add up to the right time
+            delay = round(100 * (shown + 1) / rate) - round(100 * shown / rate)
+
+            if previous is None:
+                top, left, bottom, right = 0, 0, height, width
+            else:
+                changed = frame != previous
+                rows = np.flatnonzero(changed.any(axis=1))
+                columns = np.flatnonzero(changed.any(axis=0))
+                if len(rows):
+                    top, bottom = rows[0], rows[-1] + 1
+                    left, right = columns[0], columns[-1] + 1
+                else:
+                    top, left, bottom, right = 0, 0, 1, 1
+            previous = frame
+            part = frame[top:bottom, left:right]
+            part = np.repeat(np.repeat(part, scale, axis=0), scale, axis=1)
+
+            gif.write(struct.pack("<BBBBHBB", 0x21, 0xF9, 4, 0x04, delay, 0, 0))
+            gif.write(
+                struct.pack(
+                    "<BHHHHB",
+                    0x2C,
+                    left * scale,
+                    top * scale,
+                    part.shape[1],
+                    part.shape[0],
+                    0,
+                )
+            )
+            gif.write(b"\x04" + lzw_codes(part.ravel()))
+        gif.write(b";")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Capture a recorded match, or turn a capture into a GIF."
+    )
+    parser.add_argument("source", help="a recording, or a capture")
+    parser.add_argument("destination", help="the capture, or GIF, to write")
+    parser.add_argument(
+        "--scale", type=int, default=1, help="size of each pixel in the GIF"
+    )
+    args = parser.parse_args()
+
+    begin = time.perf_counter()
+    if args.source.endswith(CAPTURE_EXTENSION):
+        write_gif(args.source, args.destination, args.scale)
+        print("Saved {}.".format(args.destination))
+    else:
+        state = capture_recording(Recording.load(args.source), args.destination)
+        elapsed = time.perf_counter() - begin
+        print(
+            "Captured {:,} frames at {:,.0f} frames/sec.".format(
+                state.frame_count, state.frame_count / elapsed
+            )
+        )
@@ -0,0 +1,577 @@
+"""Headless pong simulation.
+
+The GameState class holds a whole match - paddles, ball, pickups, sparkles and
+score - along with its own frame counter, and knows nothing about pyxel. Each
+call to GameState.step advances the match by a single frame given the state of
+the paddle controls, and leaves the things that happened in GameState.events (an
+EventQueue, see events.py) for a front end to turn into sound, sparkles and
+telemetry.
+
+This means matches can be run without a window, as fast as the CPU allows:
+
+>>> state = GameState()
+>>> while not state.finish:
+...     state.step(INPUT_L_UP | INPUT_R_DOWN)
+
+"""
+
+from collections import Counter
+from random import Random
+import struct
+import numpy as np
+from particle_emitter import ParticleEmitter, PARTICLE_LIFETIME
+from objects import Paddle, Ball
+from pickups import Pickups, PickupType, Pickup, PICKUP_WIDTH
+from spatial_grid import SpatialGrid
+from utilities import sign, Rect
+from events import (
+    EventQueue,
+    EVENT_HIT,
+    EVENT_SCORE,
+    EVENT_PICKUP,
+    EVENT_FINISH,
+    EVENT_SPAWN,
+    EVENT_EXPIRE,
+    EVENT_SPEED,
+    EVENT_SPARKLE,
+)
+
+#############
+# Constants #
+#############
+
+COL_PADDLE = 6
+COL_PADDLE_SLOW = 8
+COL_BALL = 9
+
+WIDTH = 80
+HEIGHT = 50
+DIMENSIONS = WIDTH, HEIGHT
+
+PADDLE_HEIGHT = 10
+PADDLE_HEIGHT_EXPANDED = 15
+PADDLE_WIDTH = 2
+PADDLE_SIDE = 2
+PADDLE_MOVE_SPEED = 1
+PADDLE_MOVE_SPEED_SLOW = 0.5
+
+
+BALL_INITIAL_VELOCITY = 0.4
+BALL_SIDE = 2
+
+WIN_CONDITION = 5
+
+SPEED_PERIOD = 150
+SPEED_AMOUNT = 0.07
+
+START_DELAY = 50
+
+# Paddle controls, combined into a single integer per frame.
+INPUT_L_UP = 1
+INPUT_L_DOWN = 2
+INPUT_R_UP = 4
+INPUT_R_DOWN = 8
+
+# Layout of GameState.save_state. The fixed part is followed by the pickups,
+# the active conditions, the random number generator, the sparkle generator and
+# the live window of the particle arrays (see ParticleEmitter.window).
+SNAPSHOT_MAGIC = b"PONGSNP1"
+SNAPSHOT_FORMAT = struct.Struct(
+    "<8s"  # magic
+    "5q??"  # frame_count, start, speed_up, l_score, r_score, finish, swept
+    "6d2q"  # ball x, y, x_vol, y_vol, width, height, bounce_status, size_status
+    "3dB3dB"  # left and right paddle y, height, move_speed, colour
+    "4q"  # expanded and slowed counts, left then right
+    "2q"  # next_pickup, conditions scheduled
+    "3q"  # sparkler status, next, last_emit
+    "3I"  # number of pickups, conditions and particles
+)
+SNAPSHOT_PICKUP_FORMAT = struct.Struct("<iiB")  # x, y, type
+SNAPSHOT_CONDITION_FORMAT = struct.Struct("<qqBB")  # end frame, order, type, side
+SNAPSHOT_RANDOM_FORMAT = struct.Struct("<625I?d")  # Random.getstate(), gauss_next
+SNAPSHOT_GENERATOR_FORMAT = struct.Struct("<16s16sBI")  # PCG64 state, inc, has_uint32, uinteger
+SIDES = (None, "l", "r")
+
+
+def pack_generator(generator):
+    """Return the state of a NumPy PCG64 generator as bytes."""
+    state = generator.bit_generator.state
+    return SNAPSHOT_GENERATOR_FORMAT.pack(
+        state["state"]["state"].to_bytes(16, "little"),
+        state["state"]["inc"].to_bytes(16, "little"),
+        state["has_uint32"],
+        state["uinteger"],
+    )
+
+
+def unpack_generator(generator, data, offset):
+    """Put a PCG64 generator back to the state packed at offset in data by
+    pack_generator. Returns the offset after it."""
+    state, inc, has_uint32, uinteger = SNAPSHOT_GENERATOR_FORMAT.unpack_from(
+        data, offset
+    )
+    generator.bit_generator.state = {
+        "bit_generator": "PCG64",
+        "state": {
+            "state": int.from_bytes(state, "little"),
+            "inc": int.from_bytes(inc, "little"),
+        },
+        "has_uint32": has_uint32,
+        "uinteger": uinteger,
+    }
+    return offset + SNAPSHOT_GENERATOR_FORMAT.size
+
+
+#######################
+# The simulation core #
+#######################
+
+
+class GameState:
+    """The state of a single match, advanced one frame at a time."""
+
+    def __init__(self, seed=None, swept=False):
+        """Set up the board, score and frame counter.
+
+        The ball directions and pickups are drawn from a random number generator
+        seeded with seed, so two states with the same seed and inputs play out
+        identically. Sparkles are only for show, so they have a separate
+        generator, and don't disturb the game's.
+
+        If swept is True the ball's collisions are found along its whole path
+        each step (see Ball.sweep) rather than just where it ends up. Steps of
+        more than one frame are always swept."""
+
+        self.seed = seed
+        self.swept = swept
+        self.rng = Random(seed)
+        self.sparkle_rng = Random(None if seed is None else "{}/sparkle".format(seed))
+        self.frame_count = 0
+        self.events = EventQueue()
+
+        self.l_score = 0
+        self.r_score = 0
+        self.finish = False
+
+        self.l_paddle = Paddle(
+            coordinates=(PADDLE_SIDE, (HEIGHT - PADDLE_HEIGHT) // 2),
+            colour=COL_PADDLE,
+            width=PADDLE_WIDTH,
+            height=PADDLE_HEIGHT,
+            move_speed=PADDLE_MOVE_SPEED,
+            dimensions=DIMENSIONS,
+        )
+
+        self.r_paddle = Paddle(
+            coordinates=(
+                WIDTH - PADDLE_SIDE - PADDLE_WIDTH,
+                (HEIGHT - PADDLE_HEIGHT) // 2,
+            ),
+            colour=COL_PADDLE,
+            width=PADDLE_WIDTH,
+            height=PADDLE_HEIGHT,
+            move_speed=PADDLE_MOVE_SPEED,
+            dimensions=DIMENSIONS,
+        )
+
+        self.ball = self.create_ball()
+
+        self.paddles = SpatialGrid()
+        self.paddles.add(self.l_paddle)
+        self.paddles.add(self.r_paddle)
+
+        self.sparkler = ParticleEmitter(self.ball, rng=self.sparkle_rng)
+
+        pickup_types = {
+            "sparkle": PickupType(14, self.sparkler.turn_on, self.sparkler.turn_off),
+            "expand": PickupType(12, self.expand_paddle, self.contract_paddle),
+            "slow": PickupType(8, self.slow_paddle, self.speed_paddle),
+            "bounce": PickupType(11, self.ball.bounce_on, self.ball.bounce_off),
+            "giantball": PickupType(10, self.ball.giant_on, self.ball.giant_off),
+        }
+        # How many expand and slow conditions apply to each paddle ("l" or "r")
+        self.expanded = Counter()
+        self.slowed = Counter()
+        pickup_side_buffer = PADDLE_WIDTH + PADDLE_SIDE + 2
+        self.pickups = Pickups(
+            pickup_types,
+            pickup_side_buffer,
+            WIDTH - pickup_side_buffer,
+            0,
+            HEIGHT,
+            self.frame_count,
+            self.rng,
+        )
+        self.ball.events = self.events
+        self.pickups.events = self.events
+
+        self.reset_after_score()
+
+    def create_ball(self):
+        """Create the ball."""
+        return Ball(
+            coordinates=(WIDTH // 2, HEIGHT // 2),
+            colour=COL_BALL,
+            width=BALL_SIDE,
+            height=BALL_SIDE,
+            initial_velocity=BALL_INITIAL_VELOCITY,
+            dimensions=DIMENSIONS,
+            rng=self.rng,
+        )
+
+    def reset_after_score(self):
+        """Reset paddles and ball."""
+        self.start = self.frame_count + START_DELAY
+        self.speed_up = self.start + SPEED_PERIOD
+        self.ball.reset()
+
+    ##############
+    # Game logic #
+    ##############
+
+    def step(self, inputs=0, frames=1):
+        """Advance the game by one frame, or by the given number of frames at once.
+
+        Inputs is an integer made up of the INPUT_* flags for the controls
+        held down this step. Events from this step are left in self.events.
+        """
+
+        self.events.clear()
+
+        self.l_paddle.update(inputs & INPUT_L_UP, inputs & INPUT_L_DOWN, frames)
+        self.r_paddle.update(inputs & INPUT_R_UP, inputs & INPUT_R_DOWN, frames)
+        self.paddles.move(self.l_paddle)
+        self.paddles.move(self.r_paddle)
+        if self.sparkler.status:
+            self.events.emit(EVENT_SPARKLE, value=self.frame_count)
+        self.sparkler.move(self.frame_count, frames)
+
+        if self.frame_count > self.start and not self.finish:
+            if self.swept or frames > 1:
+                self.update_swept(frames)
+            else:
+                self.update_ball()
+
+        self.frame_count += frames
+
+    def update_ball(self):
+        """Move the ball a frame and react to whatever it ends up touching."""
+
+        outcome = self.ball.update()
+        if outcome:
+            self.score(outcome)
+        self.check_speed()
+        self.ball.check_collision(self.paddles.near(self.ball))
+        self.pickups.check_pickup(self.frame_count)
+        self.pickups.check_collision(self.ball, self.frame_count)
+
+    def update_swept(self, frames):
+        """Move the ball the given number of frames, reacting to everything it
+        touches along the way."""
+
+        # Anywhere across the board the ball could reach this step, allowing
+        # for bounces (spin can change its height, so all of it)
+        ball = self.ball
+        reach_x = abs(ball.x_vol * frames)
+        reach = Rect(ball.x - reach_x, 0, ball.width + 2 * reach_x, HEIGHT)
+        outcome, _ = ball.sweep(self.paddles.near(reach), frames)
+        if outcome:
+            self.score(outcome)
+        self.check_speed()
+        self.pickups.check_pickup(self.frame_count)
+        self.pickups.check_sweep(self.ball, self.frame_count)
+
+    def check_speed(self):
+        """Adds velocity to the ball periodically."""
+
+        if self.frame_count > self.speed_up:
+            self.speed_up += SPEED_PERIOD
+            self.ball.x_vol += SPEED_AMOUNT * sign(self.ball.x_vol)
+            self.ball.y_vol += SPEED_AMOUNT * sign(self.ball.y_vol)
+            self.events.emit(EVENT_SPEED, value=abs(self.ball.x_vol))
+
+    def score(self, outcome):
+        """Adds to the score if the ball hits the side. Check win condition."""
+
+        self.events.emit(EVENT_SCORE, outcome, 1)
+        if outcome == "l":
+            self.l_score += 1
+        elif outcome == "r":
+            self.r_score += 1
+
+        if self.l_score >= WIN_CONDITION or self.r_score >= WIN_CONDITION:
+            self.win_event()
+
+        self.reset_after_score()
+
+    def win_event(self):
+        """What happens when someone wins the game!"""
+
+        self.finish = True
+        self.events.emit(EVENT_FINISH, value=self.frame_count)
+
+    ######################
+    # Pickup controllers #
+    ######################
+
+    def paddle(self, side):
+        """The paddle on the given side ("l" or "r")."""
+
+        return self.l_paddle if side == "l" else self.r_paddle
+
+    def last_hit_side(self):
+        """The side of the paddle which last hit the ball."""
+
+        return "l" if self.ball.x_vol > 0 else "r"
+
+    def expand_paddle(self):
+        """Expand the pandle temporarily. Returns the side expanded, for contract_paddle."""
+
+        side = self.last_hit_side()
+        paddle = self.paddle(side)
+
+        paddle.height = PADDLE_HEIGHT_EXPANDED
+        paddle.y -= (PADDLE_HEIGHT_EXPANDED - PADDLE_HEIGHT) // 2
+        self.expanded[side] += 1
+        return side
+
+    def contract_paddle(self, side):
+        """Revert paddle side to normal, once none of its expand conditions are left."""
+
+        self.expanded[side] -= 1
+        if not self.expanded[side]:
+            paddle = self.paddle(side)
+            paddle.height = PADDLE_HEIGHT
+            paddle.y += (PADDLE_HEIGHT_EXPANDED - PADDLE_HEIGHT) // 2
+
+    def slow_paddle(self):
+        """Slow the pandle temporarily. Returns the side slowed, for speed_paddle."""
+
+        side = self.last_hit_side()
+        paddle = self.paddle(side)
+
+        paddle.move_speed = PADDLE_MOVE_SPEED_SLOW
+        paddle.colour = COL_PADDLE_SLOW
+        self.slowed[side] += 1
+        return side
+
+    def speed_paddle(self, side):
+        """Speed the paddle back up to normal speed, once none of its slow conditions are left."""
+
+        self.slowed[side] -= 1
+        if not self.slowed[side]:
+            paddle = self.paddle(side)
+            paddle.move_speed = PADDLE_MOVE_SPEED
+            paddle.colour = COL_PADDLE
+
+    #############
+    # Snapshots #
+    #############
+
+    def save_state(self):
+        """Return everything about the match as bytes, for load_state.
+
+        This is a fixed binary layout (see SNAPSHOT_FORMAT) rather than a
+        pickle, so it takes microseconds. Only the particles still alive are
+        kept, so most of a snapshot is the random number generator's state."""
+
+        pickups = self.pickups
+        scheduler = pickups.active_conditions
+        sparkler = self.sparkler
+        pickup_names = list(pickups.pickup_types)
+        particles = sparkler.window(self.frame_count)
+
+        parts = [
+            SNAPSHOT_FORMAT.pack(
+                SNAPSHOT_MAGIC,
+                self.frame_count,
+                self.start,
+                self.speed_up,
+                self.l_score,
+                self.r_score,
+                self.finish,
+                self.swept,
+                *self.save_ball(),
+                self.l_paddle.y,
+                self.l_paddle.height,
+                self.l_paddle.move_speed,
+                self.l_paddle.colour,
+                self.r_paddle.y,
+                self.r_paddle.height,
+                self.r_paddle.move_speed,
+                self.r_paddle.colour,
+                self.expanded["l"],
+                self.expanded["r"],
+                self.slowed["l"],
+                self.slowed["r"],
+                pickups.next_pickup,
+                scheduler.scheduled,
+                sparkler.status,
+                sparkler.next,
+                sparkler.last_emit,
+                len(pickups.pickups),
+                len(scheduler.heap),
+                len(particles),
+            )
+        ]
+        for pickup in pickups.pickups:
+            parts.append(
+                SNAPSHOT_PICKUP_FORMAT.pack(
+                    pickup.x, pickup.y, pickup_names.index(pickup.pickup_type)
+                )
+            )
+        for end_frame, order, condition, token in scheduler.heap:
+            parts.append(
+                SNAPSHOT_CONDITION_FORMAT.pack(
+                    end_frame, order, pickup_names.index(condition), SIDES.index(token)
+                )
+            )
+        _, words, gauss_next = self.rng.getstate()
+        parts.append(
+            SNAPSHOT_RANDOM_FORMAT.pack(*words, gauss_next is not None, gauss_next or 0.0)
+        )
+        parts.append(pack_generator(sparkler.generator))
+        for array in (
+            sparkler.x,
+            sparkler.y,
+            sparkler.x_vol,
+            sparkler.y_vol,
+            sparkler.colour,
+            sparkler.zero_frame,
+        ):
+            parts.append(array[particles].tobytes())
+        return b"".join(parts)
+
+    def save_ball(self):
+        """Return the ball's part of SNAPSHOT_FORMAT."""
+
+        ball = self.ball
+        return (
+            ball.x,
+            ball.y,
+            ball.x_vol,
+            ball.y_vol,
+            ball.width,
+            ball.height,
+            ball.bounce_status,
+            ball.size_status,
+        )
+
+    def load_ball(self, values):
+        """Put the ball back from its part of SNAPSHOT_FORMAT."""
+
+        ball = self.ball
+        ball.x, ball.y, ball.x_vol, ball.y_vol, ball.width, ball.height, *statuses = values
+        ball.bounce_status, ball.size_status = statuses
+
+    def load_state(self, data):
+        """Put the match back as it was when save_state returned data.
+
+        The state is restored in place, so the pickup table and everything
+        else set up in __init__ are kept. Returns the number of bytes read."""
+
+        (
+            magic,
+            self.frame_count,
+            self.start,
+            self.speed_up,
+            self.l_score,
+            self.r_score,
+            self.finish,
+            self.swept,
+            *ball_values,
+            bounce_status,
+            size_status,
+            l_y,
+            l_height,
+            l_move_speed,
+            l_colour,
+            r_y,
+            r_height,
+            r_move_speed,
+            r_colour,
+            l_expanded,
+            r_expanded,
+            l_slowed,
+            r_slowed,
+            next_pickup,
+            scheduled,
+            sparkle_status,
+            sparkle_next,
+            sparkle_last_emit,
+            pickup_count,
+            condition_count,
+            particle_count,
+        ) = SNAPSHOT_FORMAT.unpack_from(data)
+        if magic != SNAPSHOT_MAGIC:
+            raise ValueError("Not a pong snapshot.")
+        offset = SNAPSHOT_FORMAT.size
+
+        self.load_ball((*ball_values, bounce_status, size_status))
+
+        for paddle, y, height, move_speed, colour in (
+            (self.l_paddle, l_y, l_height, l_move_speed, l_colour),
+            (self.r_paddle, r_y, r_height, r_move_speed, r_colour),
+        ):
+            paddle.y = y
+            paddle.height = height
+            paddle.move_speed = move_speed
+            paddle.colour = colour
+            self.paddles.move(paddle)
+
+        self.expanded = Counter(l=l_expanded, r=r_expanded)
+        self.slowed = Counter(l=l_slowed, r=r_slowed)
+
+        pickups = self.pickups
+        pickup_names = list(pickups.pickup_types)
+        pickups.next_pickup = next_pickup
+        for pickup in pickups.pickups:
+            pickups.grid.remove(pickup)
+        pickups.pickups = []
+        for _ in range(pickup_count):
+            x, y, pickup_type = SNAPSHOT_PICKUP_FORMAT.unpack_from(data, offset)
+            offset += SNAPSHOT_PICKUP_FORMAT.size
+            pickup = Pickup(x, y, PICKUP_WIDTH, PICKUP_WIDTH, pickup_names[pickup_type])
+            pickups.pickups.append(pickup)
+            pickups.grid.add(pickup)
+
+        scheduler = pickups.active_conditions
+        scheduler.heap = []
+        scheduler.counts = Counter()
+        scheduler.scheduled = scheduled
+        for _ in range(condition_count):
+            end_frame, order, condition, side = SNAPSHOT_CONDITION_FORMAT.unpack_from(
+                data, offset
+            )
+            offset += SNAPSHOT_CONDITION_FORMAT.size
+            condition = pickup_names[condition]
+            scheduler.heap.append((end_frame, order, condition, SIDES[side]))
+            scheduler.counts[condition] += 1
+
+        *words, has_gauss, gauss_next = SNAPSHOT_RANDOM_FORMAT.unpack_from(data, offset)
+        offset += SNAPSHOT_RANDOM_FORMAT.size
+        self.rng.setstate((3, tuple(words), gauss_next if has_gauss else None))
+
+        sparkler = self.sparkler
+        offset = unpack_generator(sparkler.generator, data, offset)
+
+        sparkler.status = sparkle_status
+        sparkler.next = sparkle_next
+        sparkler.last_emit = sparkle_last_emit
+        sparkler.zero_frame[:] = -PARTICLE_LIFETIME  # Everything else is gone
+        particles = (sparkle_next - particle_count + np.arange(particle_count)) % len(
+            sparkler.x
+        )
+        for array in (
+            sparkler.x,
+            sparkler.y,
+            sparkler.x_vol,
+            sparkler.y_vol,
+            sparkler.colour,
+            sparkler.zero_frame,
+        ):
+            array[particles] = np.frombuffer(data, array.dtype, particle_count, offset)
+            offset += particle_count * array.itemsize
+
+        self.events.clear()
+        return offset
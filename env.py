@@ -0,0 +1,224 @@
+"""A vectorized environment for training paddle agents.
+
+VectorPongEnv runs N matches at once on a batch.BatchGame, with the usual
+reset/step interface. The agent plays the left paddle in every match, and the
+right paddle is played by an opponent function (a bot which follows the ball,
+by default).
+
+Observations are not copies: they are NumPy views of the batch's own arrays,
+so they change in place with every step (copy them to keep them). The
+observation is a dict of:
+
+    state         (N, 8) ball x, y, x_vol, y_vol, left and right paddle y,
+                  left and right paddle height
+    pickup_alive  (N, MAX_PICKUPS) which pickup slots are on the board
+    pickup_x      (N, MAX_PICKUPS)
+    pickup_y      (N, MAX_PICKUPS)
+    pickup_type   (N, MAX_PICKUPS) index into batch.PICKUP_TYPES
+    pixels        (N, HEIGHT, WIDTH) screen colours, only if pixels=True
+
+The reward is +1 when the agent scores and -1 when the opponent does. A match
+which finishes (or runs for max_frames) is started again straight away, so
+the observation after it is the start of the next match.
+
+    python3 env.py
+
+reports how many environment steps a second it runs at.
+
+Requires numpy.
+"""
+
+from random import Random
+import time
+import numpy as np
+
+from engine import (
+    WIDTH,
+    HEIGHT,
+    PADDLE_WIDTH,
+    PADDLE_MOVE_SPEED_SLOW,
+    COL_PADDLE,
+    COL_PADDLE_SLOW,
+    COL_BALL,
+    INPUT_L_UP,
+    INPUT_L_DOWN,
+    INPUT_R_UP,
+    INPUT_R_DOWN,
+)
+from pickups import PICKUP_WIDTH
+from batch import (
+    BatchGame,
+    LEFT,
+    RIGHT,
+    PADDLE_X,
+    MAX_PICKUPS,
+    STATE_ROWS,
+    OUTCOME_L,
+    OUTCOME_R,
+    tracking_inputs,
+)
+
+# Actions for the agent's paddle
+ACTION_STAY = 0
+ACTION_UP = INPUT_L_UP
+ACTION_DOWN = INPUT_L_DOWN
+
+# Colours for the pixel observation, as drawn by pong.py
+COL_BACKGROUND = 5
+PICKUP_COLOURS = np.array([14, 12, 8, 11, 10])  # In the order of batch.PICKUP_TYPES
+
+
+def track_ball(batch):
+    """Opponent which moves the right paddle towards the ball."""
+
+    inputs = tracking_inputs(
+        batch.y,
+        batch.paddle_y[LEFT],
+        batch.paddle_height[LEFT],
+        batch.paddle_y[RIGHT],
+        batch.paddle_height[RIGHT],
+    )
+    return inputs & (INPUT_R_UP | INPUT_R_DOWN)
+
+
+class VectorPongEnv:
+    """N matches of pong, with an agent on the left paddle of each."""
+
+    def __init__(self, num_envs, seed=None, opponent=track_ball, pixels=False, max_frames=None):
+        """Set up the matches.
+
+        opponent(batch) returns the right paddle's inputs (engine.INPUT_R_*
+        flags) for every match, or is None for a paddle which never moves."""
+
+        self.num_envs = num_envs
+        self.opponent = opponent
+        self.max_frames = max_frames
+        self.batch = BatchGame(num_envs, self.seeds(seed))
+
+        self.rewards = np.zeros(num_envs, dtype=np.float32)
+        self.terminated = np.zeros(num_envs, dtype=bool)
+        self.truncated = np.zeros(num_envs, dtype=bool)
+
+        batch = self.batch
+        self.observation = {
+            "state": batch.buffer[:STATE_ROWS].T,
+            "pickup_alive": batch.pickup_alive,
+            "pickup_x": batch.pickup_x,
+            "pickup_y": batch.pickup_y,
+            "pickup_type": batch.pickup_type,
+        }
+        self.pixels = None
+        if pixels:
+            self.pixels = np.zeros((num_envs, HEIGHT, WIDTH), dtype=np.uint8)
+            self.rows = np.arange(HEIGHT)[None, :, None]
+            self.columns = np.arange(WIDTH)[None, None, :]
+            self.observation["pixels"] = self.pixels
+            self.render()
+
+    def seeds(self, seed):
+        """A seed for each match, drawn from the given seed."""
+        if seed is None:
+            return None
+        rng = Random(seed)
+        return [rng.getrandbits(64) for _ in range(self.num_envs)]
+
+    def reset(self, seed=None):
+        """Start every match again, optionally reseeding them. Returns (observation, info)."""
+
+        if seed is not None:
+            self.batch.seeds = self.seeds(seed)
+            self.batch.rngs = [Random(match_seed) for match_seed in self.batch.seeds]
+        self.batch.reset()
+        if self.pixels is not None:
+            self.render()
+        return self.observation, {}
+
+    def step(self, actions):
+        """Move the agents' paddles (an ACTION_* for each match) and step every match.
+
+        Returns (observation, rewards, terminated, truncated, info)."""
+
+        batch = self.batch
+        inputs = np.asarray(actions) & (INPUT_L_UP | INPUT_L_DOWN)
+        if self.opponent is not None:
+            inputs = inputs | self.opponent(batch)
+        batch.step(inputs)
+
+        rewards = self.rewards
+        rewards[:] = 0
+        rewards[batch.outcome == OUTCOME_L] = 1
+        rewards[batch.outcome == OUTCOME_R] = -1
+
+        np.copyto(self.terminated, batch.finish)
+        if self.max_frames is not None:
+            np.greater_equal(batch.frame, self.max_frames, out=self.truncated)
+        done = self.terminated | self.truncated
+        if done.any():
+            batch.reset(done)
+
+        if self.pixels is not None:
+            self.render()
+        return self.observation, rewards, self.terminated, self.truncated, {}
+
+    ##########
+    # Pixels #
+    ##########
+
+    def render(self):
+        """Draw every match into self.pixels, as pong.py draws the screen."""
+
+        batch = self.batch
+        self.pixels[:] = COL_BACKGROUND
+        for side in (LEFT, RIGHT):
+            colour = np.where(
+                batch.move_speed[side] == PADDLE_MOVE_SPEED_SLOW, COL_PADDLE_SLOW, COL_PADDLE
+            )
+            self.fill(
+                PADDLE_X[side], batch.paddle_y[side], PADDLE_WIDTH, batch.paddle_height[side], colour
+            )
+        for slot in range(MAX_PICKUPS):
+            alive = batch.pickup_alive[:, slot]
+            if alive.any():
+                colour = PICKUP_COLOURS[batch.pickup_type[:, slot]]
+                self.fill(
+                    batch.pickup_x[:, slot],
+                    batch.pickup_y[:, slot],
+                    PICKUP_WIDTH,
+                    np.where(alive, PICKUP_WIDTH, 0),
+                    colour,
+                )
+        self.fill(batch.x, batch.y, batch.width, batch.height, COL_BALL)
+
+    def fill(self, x, y, width, height, colour):
+        """Fill a rectangle in every match (each argument a number or an array of N)."""
+
+        x = np.floor(np.broadcast_to(x, (self.num_envs,)))[:, None, None]
+        y = np.floor(np.broadcast_to(y, (self.num_envs,)))[:, None, None]
+        width = np.broadcast_to(width, (self.num_envs,))[:, None, None]
+        height = np.broadcast_to(height, (self.num_envs,))[:, None, None]
+        colour = np.broadcast_to(colour, (self.num_envs,))[:, None, None]
+        inside = (
+            (self.columns >= x)
+            & (self.columns < x + width)
+            & (self.rows >= y)
+            & (self.rows < y + height)
+        )
+        np.copyto(self.pixels, colour, casting="unsafe", where=inside)
+
+
+def measure(num_envs=4096, steps=1000, pixels=False):
+    """Return the environment steps per second with random actions."""
+
+    env = VectorPongEnv(num_envs, seed=0, pixels=pixels)
+    rng = np.random.default_rng(0)
+    actions = rng.choice((ACTION_STAY, ACTION_UP, ACTION_DOWN), size=(steps, num_envs))
+    env.reset()
+    begin = time.perf_counter()
+    for step_actions in actions:
+        env.step(step_actions)
+    return num_envs * steps / (time.perf_counter() - begin)
+
+
+if __name__ == "__main__":
+    print("{:,.0f} env-steps/sec".format(measure()))
+    print("{:,.0f} env-steps/sec with pixels".format(measure(num_envs=256, steps=200, pixels=True)))
@@ -0,0 +1,138 @@
+"""The things which happen in a match, passed from the game logic to the rest.
+
+Events are small integers (EVENT_HIT and so on), emitted into an EventQueue:
+fixed-size lists allocated once, so emitting one is a few stores and a count,
+and clearing a queue with nothing in it is free. Each event can carry a
+payload - the side it happened on, a value and a detail, as listed by its
+kind below - for the sinks which need more than what happened. GameState.step
+leaves its events in GameState.events, cleared each step.
+
+A front end collects each step's events into an EventBus, which hands the
+whole frame's queue to each of its sinks (the audio, say) once a frame and
+then clears it. A sink can ask whether an event happened at all this frame
+(event in queue) rather than reacting to every one, so a hundred balls hitting
+paddles in one frame are one hit sound, not a hundred. The sound, the sparkles
+and telemetry are all sinks. Headless runs have no bus, so nothing is
+dispatched at all.
+"""
+
+from itertools import islice
+
+# The kinds of event, and their payloads (a side, a value and a detail):
+#   hit      the side of the paddle, and where on it the ball hit as the value,
+#            from -1 at the top to 1 at the bottom (an array, for a set of balls)
+#   score    the side which scored, and the points as the value
+#   pickup   the type of pickup collected, as the detail
+#   finish   the frames the match lasted
+#   spawn    the type of pickup which appeared, as the detail
+#   expire   the type of pickup whose condition finished, as the detail
+#   speed    the ball's new speed
+#   sparkle  the frame the ball sparkled on
+EVENT_HIT = 0
+EVENT_SCORE = 1
+EVENT_PICKUP = 2
+EVENT_FINISH = 3
+EVENT_SPAWN = 4
+EVENT_EXPIRE = 5
+EVENT_SPEED = 6
+EVENT_SPARKLE = 7
+EVENT_NAMES = (
+    "hit",
+    "score",
+    "pickup",
+    "finish",
+    "spawn",
+    "expire",
+    "speed",
+    "sparkle",
+)
+NO_EVENTS = (0,) * len(EVENT_NAMES)
+
+STEP_EVENT_CAPACITY = 16  # A step emits a handful at most
+FRAME_EVENT_CAPACITY = 256  # Room for the steps of a frame which is behind
+
+
+class EventQueue:
+    """A fixed-size queue of events and their payloads, in the order they
+    happened, with a count of each kind.
+
+    Once full, further events are only counted (counted in dropped)."""
+
+    def __init__(self, capacity=STEP_EVENT_CAPACITY):
+        """Allocate room for capacity events."""
+        self.kinds = [0] * capacity
+        self.sides = [None] * capacity
+        self.values = [None] * capacity
+        self.details = [None] * capacity
+        self.counts = list(NO_EVENTS)
+        self.length = 0
+        self.dropped = 0
+
+    def emit(self, kind, side=None, value=None, detail=None):
+        """Add an event, with its payload."""
+        self.counts[kind] += 1
+        i = self.length
+        if i < len(self.kinds):
+            self.kinds[i] = kind
+            self.sides[i] = side
+            self.values[i] = value
+            self.details[i] = detail
+            self.length = i + 1
+        else:
+            self.dropped += 1
+
+    def extend(self, events):
+        """Add the events of another queue."""
+        for kind, side, value, detail in events.items():
+            self.emit(kind, side, value, detail)
+
+    def clear(self):
+        """Empty the queue, without allocating anything."""
+        if self.length:
+            self.counts[:] = NO_EVENTS
+            self.length = 0
+            self.dropped = 0
+
+    def count(self, kind):
+        """The number of events of the given kind."""
+        return self.counts[kind]
+
+    def items(self):
+        """Return an iterator of (kind, side, value, detail) for each event."""
+        return islice(
+            zip(self.kinds, self.sides, self.values, self.details), self.length
+        )
+
+    def __contains__(self, kind):
+        return self.counts[kind] > 0
+
+    def __iter__(self):
+        return islice(self.kinds, self.length)
+
+    def __len__(self):
+        return self.length
+
+
+class EventBus:
+    """Collects the events of a frame, and hands them to each sink once a frame."""
+
+    def __init__(self, sinks=(), capacity=FRAME_EVENT_CAPACITY):
+        """Set up with a list of sinks, each a function taking an EventQueue."""
+        self.queue = EventQueue(capacity)
+        self.sinks = list(sinks)
+
+    def subscribe(self, sink):
+        """Add a sink, a function taking an EventQueue."""
+        self.sinks.append(sink)
+
+    def collect(self, events):
+        """Add the events of a step to this frame's."""
+        if len(events):
+            self.queue.extend(events)
+
+    def dispatch(self):
+        """Hand the frame's events to each sink, if there were any, and clear them."""
+        if self.queue.length:
+            for sink in self.sinks:
+                sink(self.queue)
+            self.queue.clear()
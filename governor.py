@@ -0,0 +1,149 @@
+"""Keeping to the frame budget on a busy machine.
+
+The simulation runs at a fixed tick rate whatever the frame rate (see
+pong.py), so a slow machine only makes the game look worse, not play slower -
+as long as there is time left for the ticks. The FrameGovernor measures how
+long each frame's update and draw take, and when they run over the budget (the
+time between frames) it turns down the optional work a step at a time, in the
+order of DETAIL_LEVELS:
+
+    0  everything
+    1  half as many sparkles
+    2  no sparkles at all, nor drawing the ones left
+    3  drawing every other frame
+    4  drawing every third frame
+
+Detail comes back a step at a time once there has been plenty of time to
+spare for a while, and more slowly than it went, so the governor doesn't
+flip between two levels.
+
+    python3 governor.py
+
+runs the governor over some made up frame times and prints what it does.
+"""
+
+from collections import namedtuple
+import time
+
+# sparkle_interval: frames between sparkles (0 for none); draw_sparkles: whether
+# to draw them; render_every: draw every this many frames
+Detail = namedtuple("Detail", "sparkle_interval draw_sparkles render_every")
+DETAIL_LEVELS = (
+    Detail(2, True, 1),
+    Detail(4, True, 1),
+    Detail(0, False, 1),
+    Detail(0, False, 2),
+    Detail(0, False, 3),
+)
+
+GOVERNOR_WINDOW = 30  # Frames averaged over before deciding anything
+STEP_DOWN = 0.9  # Drop detail when the frames take more than this of the budget
+STEP_UP = 0.5  # Consider restoring it when they take less than this
+STEP_UP_WINDOWS = 4  # Windows in a row under STEP_UP before restoring a step
+
+
+class FrameGovernor:
+    """Turns optional detail down and up to keep frames within their budget."""
+
+    def __init__(self, budget, on_change=None):
+        """Start at full detail, with budget the seconds each frame has.
+
+        on_change(detail) is called with the new Detail whenever it changes."""
+
+        self.budget = budget
+        self.on_change = on_change
+        self.level = 0
+        self.work = 0.0  # Seconds spent on this frame so far
+        self.window = 0.0  # Seconds spent over the frames of this window
+        self.frames = 0
+        self.quiet_windows = 0  # Windows in a row under STEP_UP
+
+    @property
+    def detail(self):
+        """The Detail to run at."""
+        return DETAIL_LEVELS[self.level]
+
+    def wrap(self, update, draw):
+        """Return update and draw functions (for pyxel.run) which are timed,
+        with the frame ending after each draw."""
+
+        def timed_update():
+            start = time.perf_counter()
+            update()
+            self.work += time.perf_counter() - start
+
+        def timed_draw():
+            start = time.perf_counter()
+            draw()
+            self.work += time.perf_counter() - start
+            self.end_frame()
+
+        return timed_update, timed_draw
+
+    def end_frame(self, work=None):
+        """Add up the time this frame took (work seconds, or as timed by the
+        functions from wrap) and change the detail if it is time to."""
+
+        if work is None:
+            work = self.work
+        self.work = 0.0
+        self.window += work
+        self.frames += 1
+        if self.frames < GOVERNOR_WINDOW:
+            return
+
+        load = self.window / self.frames / self.budget
+        self.window = 0.0
+        self.frames = 0
+        if load > STEP_DOWN:
+            self.quiet_windows = 0
+            self.set_level(self.level + 1)
+        elif load < STEP_UP:
+            self.quiet_windows += 1
+            if self.quiet_windows >= STEP_UP_WINDOWS:
+                self.quiet_windows = 0
+                self.set_level(self.level - 1)
+        else:
+            self.quiet_windows = 0
+
+    def set_level(self, level):
+        """Change to the given level of detail, if there is one."""
+
+        level = min(max(level, 0), len(DETAIL_LEVELS) - 1)
+        if level != self.level:
+            self.level = level
+            if self.on_change:
+                self.on_change(self.detail)
+
+
+def check_governor(budget=1 / 60):
+    """Run the governor over a quiet spell, a busy spell and another quiet
+    spell, printing each change of detail."""
+
+    def report(detail):
+        print("  frame {:>4}: level {} {}".format(frame, governor.level, detail))
+
+    governor = FrameGovernor(budget, report)
+    frame = 0
+    for name, frames, full_cost in (
+        ("quiet", 300, 0.3),
+        ("busy", 600, 1.6),
+        ("quiet", 1200, 0.3),
+    ):
+        print(name)
+        for _ in range(frames):
+            detail = governor.detail
+            drawn = frame % detail.render_every == 0
+            # Sparkles cost a quarter of a frame, and drawing half the rest
+            cost = full_cost * (
+                0.5
+                + 0.25 * (2 / detail.sparkle_interval if detail.sparkle_interval else 0)
+                + 0.25 * drawn
+            )
+            governor.end_frame(cost * budget)
+            frame += 1
+    return governor.level
+
+
+if __name__ == "__main__":
+    check_governor()
@@ -0,0 +1,351 @@
+"""Multi-ball party mode.
+
+BallSet stands in for the single Ball with a whole set of balls kept in NumPy
+arrays, which move, bounce and hit paddles and pickups all at once. Every ball
+shares the same size and bounce, so the giant ball and bounce pickups affect
+them all together.
+
+MultiBallState is a GameState played with a BallSet. A ball which reaches a
+side scores a point and is served again from the middle, without stopping the
+game, and each frame's points are added up into a score event for each side.
+
+>>> state = MultiBallState(balls=1000)
+>>> state.step()
+
+"""
+
+import struct
+import numpy as np
+
+from engine import (
+    GameState,
+    EVENT_HIT,
+    EVENT_SCORE,
+    EVENT_SPEED,
+    COL_BALL,
+    WIDTH,
+    HEIGHT,
+    DIMENSIONS,
+    BALL_INITIAL_VELOCITY,
+    BALL_SIDE,
+    SPEED_PERIOD,
+    SPEED_AMOUNT,
+    pack_generator,
+    unpack_generator,
+)
+from objects import SPIN, BOUNCE, BOUNCE_FRICTION, GIANT_SIDE_CHANGE
+
+MULTIBALL_COUNT = 1000
+
+# Added to GameState.save_state's layout by MultiBallState: number of balls,
+# win condition (-1 for none), ball width, height, bounce status, collector.
+# This is followed by the ball generator's state and the x, y, x_vol and y_vol
+# arrays.
+MULTIBALL_FORMAT = struct.Struct("<Iqqqqq")
+
+
+class BallSet:
+    """A set of balls, moved and displayed together."""
+
+    events = None  # An EventQueue to emit hits into, if any
+
+    def __init__(
+        self,
+        count,
+        coordinates,
+        colour,
+        width,
+        height,
+        initial_velocity,
+        dimensions,
+        rng,
+    ):
+        """Allocate the ball arrays. Directions are drawn from a generator seeded from rng."""
+        self.count = count
+        self.coordinates = coordinates
+        self.initial_velocity = initial_velocity
+        self.colour = colour
+        self.width = width
+        self.height = height
+        self.dimensions = dimensions
+        self.generator = np.random.default_rng(rng.getrandbits(64))
+
+        self.x = np.zeros(count)
+        self.y = np.zeros(count)
+        self.x_vol = np.zeros(count)
+        self.y_vol = np.zeros(count)
+
+        self.bounce_status = 0
+        self.collector = 0  # The ball which last collected a pickup
+
+        self.reset()
+
+    def reset(self, mask=None):
+        """Serve the masked balls (all of them by default) from the middle of the board.
+
+        Each heads left or right at random, at a random angle."""
+        if mask is None:
+            mask = np.ones(self.count, dtype=bool)
+        count = np.count_nonzero(mask)
+        self.x[mask] = self.coordinates[0]
+        self.y[mask] = self.coordinates[1]
+        self.x_vol[mask] = self.initial_velocity * self.generator.choice((-1, 1), count)
+        self.y_vol[mask] = self.initial_velocity * self.generator.uniform(-1, 1, count)
+
+    def update(self):
+        """Update position of the balls and check if any are hitting the side of board.
+
+        Returns masks of the balls scoring for the left and right players."""
+        width, height = self.dimensions
+
+        self.x += self.x_vol
+        self.y += self.y_vol
+
+        if self.bounce_status:
+            self.y_vol += BOUNCE
+
+        r_scores = self.x < 0  # Hit left side so right scores
+        l_scores = self.x + self.width > width  # Hit right side so left scores
+
+        top = self.y < 0
+        self.y[top] = -self.y[top]
+        self.y_vol[top] = -self.y_vol[top]
+
+        bottom = self.y + self.height > height
+        self.y[bottom] = 2 * height - self.y[bottom] - 2 * self.height
+        self.y_vol[bottom] = -self.y_vol[bottom]
+        if self.bounce_status:
+            self.y_vol[bottom] += BOUNCE_FRICTION
+
+        return l_scores, r_scores
+
+    def check_collision(self, paddles):
+        """Rebound any balls hitting a paddle, with spin. Returns the number of hits."""
+        hits = 0
+        for paddle in paddles:
+            hit = ~(
+                (self.x + self.width < paddle.x)
+                | (paddle.x + paddle.width < self.x)
+                | (self.y + self.height < paddle.y)
+                | (paddle.y + paddle.height < self.y)
+            )
+            if not hit.any():
+                continue
+            hits += int(np.count_nonzero(hit))
+
+            # As in Ball.spin_ball
+            paddle_centre = paddle.height / 2
+            hit_position = self.y[hit] + self.height / 2 - paddle.y
+            hit_position_normalised = (hit_position - paddle_centre) / paddle_centre
+            self.y_vol[hit] += hit_position_normalised * SPIN
+            if self.events is not None:
+                side = "l" if paddle.x < self.dimensions[0] / 2 else "r"
+                self.events.emit(EVENT_HIT, side, hit_position_normalised)
+
+            self.x_vol[hit] = -self.x_vol[hit]
+            ball_center = self.x[hit] + self.width / 2
+            paddle_center = paddle.x + paddle.width / 2
+            self.x[hit] = np.where(
+                ball_center > paddle_center,
+                paddle.x + paddle.width,
+                paddle.x - self.width,
+            )
+        return hits
+
+    def check_pickups(self, pickups, frame_count):
+        """Collect the first pickup touched by any ball. Returns True if one was.
+
+        The ball which collected it is left in self.collector."""
+        for pickup in pickups.pickups:
+            touching = ~(
+                (pickup.x + pickup.width < self.x)
+                | (self.x + self.width < pickup.x)
+                | (pickup.y + pickup.height < self.y)
+                | (self.y + self.height < pickup.y)
+            )
+            if touching.any():
+                self.collector = touching.argmax()
+                pickups.collect(pickup, frame_count)
+                return True
+        return False
+
+    def speed_up(self, amount):
+        """Add the given amount to the speed of every ball, in the direction it's going."""
+        self.x_vol += amount * np.where(self.x_vol >= 0, 1, -1)
+        self.y_vol += amount * np.where(self.y_vol >= 0, 1, -1)
+
+    def draw(self, pixels):
+        """Display the balls by writing straight into a 2d array of pixels."""
+        height, width = pixels.shape
+        x = np.floor(self.x).astype(np.int64)
+        y = np.floor(self.y).astype(np.int64)
+        for x_offset in range(self.width):
+            for y_offset in range(self.height):
+                pixel_x = x + x_offset
+                pixel_y = y + y_offset
+                visible = (
+                    (pixel_x >= 0) & (pixel_x < width) & (pixel_y >= 0) & (pixel_y < height)
+                )
+                pixels[pixel_y[visible], pixel_x[visible]] = self.colour
+
+    def bounce_on(self):
+        """Turn the bounce on."""
+        self.bounce_status += 1
+
+    def bounce_off(self):
+        """Turn the bounce off."""
+        self.bounce_status -= 1
+
+    def giant_on(self):
+        """Enlarge the balls."""
+        self.height += GIANT_SIDE_CHANGE
+        self.width += GIANT_SIDE_CHANGE
+        self.x -= GIANT_SIDE_CHANGE // 2
+        self.y -= GIANT_SIDE_CHANGE // 2
+
+    def giant_off(self):
+        """Shrink the balls."""
+        self.height -= GIANT_SIDE_CHANGE
+        self.width -= GIANT_SIDE_CHANGE
+        self.x += GIANT_SIDE_CHANGE // 2
+        self.y += GIANT_SIDE_CHANGE // 2
+
+
+class MultiBallState(GameState):
+    """A match played with many balls at once.
+
+    The game finishes when a player reaches win_condition points, or never if
+    it is None."""
+
+    def __init__(self, balls=MULTIBALL_COUNT, seed=None, win_condition=None):
+        """Set up the board with the given number of balls."""
+        self.ball_count = balls
+        self.win_condition = win_condition
+        super().__init__(seed)
+
+    def create_ball(self):
+        """Create the set of balls."""
+        return BallSet(
+            self.ball_count,
+            coordinates=(WIDTH // 2, HEIGHT // 2),
+            colour=COL_BALL,
+            width=BALL_SIDE,
+            height=BALL_SIDE,
+            initial_velocity=BALL_INITIAL_VELOCITY,
+            dimensions=DIMENSIONS,
+            rng=self.rng,
+        )
+
+    def update_ball(self):
+        """Move the balls a frame and react to whatever they end up touching."""
+
+        l_scores, r_scores = self.ball.update()
+        self.score_balls(l_scores, r_scores)
+        self.check_speed()
+        self.ball.check_collision([self.l_paddle, self.r_paddle])
+        self.pickups.check_pickup(self.frame_count)
+        self.ball.check_pickups(self.pickups, self.frame_count)
+
+    def update_swept(self, frames):
+        """Move the balls the given number of frames, a frame at a time.
+
+        Unlike GameState, the balls aren't swept. Instead frame_count counts
+        through the frames (and is put back for step to add them as usual), so
+        speed-ups, pickups and conditions happen on the same frames as they
+        would stepping one frame at a time, and the balls stop on the frame
+        the match finishes."""
+
+        first_frame = self.frame_count
+        for frame in range(first_frame, first_frame + frames):
+            if self.finish:
+                break
+            self.frame_count = frame
+            self.update_ball()
+        self.frame_count = first_frame
+
+    def check_speed(self):
+        """Adds velocity to the balls periodically."""
+
+        if self.frame_count > self.speed_up:
+            self.speed_up += SPEED_PERIOD
+            self.ball.speed_up(SPEED_AMOUNT)
+            self.events.emit(EVENT_SPEED, value=np.max(np.abs(self.ball.x_vol)))
+
+    def score_balls(self, l_scores, r_scores):
+        """Add up the points scored this frame, and serve the scoring balls again."""
+
+        l_points = int(np.count_nonzero(l_scores))
+        r_points = int(np.count_nonzero(r_scores))
+        if not (l_points or r_points):
+            return
+
+        for side, points in (("l", l_points), ("r", r_points)):
+            if points:
+                self.events.emit(EVENT_SCORE, side, points)
+        self.l_score += l_points
+        self.r_score += r_points
+        self.ball.reset(l_scores | r_scores)
+
+        if self.win_condition is not None and not self.finish:
+            if self.l_score >= self.win_condition or self.r_score >= self.win_condition:
+                self.win_event()
+
+    def last_hit_side(self):
+        """The side of the paddle which last hit the ball that collected a pickup."""
+
+        return "l" if self.ball.x_vol[self.ball.collector] > 0 else "r"
+
+    #############
+    # Snapshots #
+    #############
+
+    def save_state(self):
+        """Return everything about the match as bytes, for load_state: the
+        single ball layout (see GameState.save_state) followed by the balls."""
+
+        ball = self.ball
+        parts = [
+            super().save_state(),
+            MULTIBALL_FORMAT.pack(
+                ball.count,
+                -1 if self.win_condition is None else self.win_condition,
+                ball.width,
+                ball.height,
+                ball.bounce_status,
+                ball.collector,
+            ),
+            pack_generator(ball.generator),
+        ]
+        for array in (ball.x, ball.y, ball.x_vol, ball.y_vol):
+            parts.append(array.tobytes())
+        return b"".join(parts)
+
+    def load_state(self, data):
+        """Put the match back as it was when save_state returned data,
+        returning the number of bytes read."""
+
+        offset = super().load_state(data)
+        ball = self.ball
+        (
+            count,
+            win_condition,
+            ball.width,
+            ball.height,
+            ball.bounce_status,
+            ball.collector,
+        ) = MULTIBALL_FORMAT.unpack_from(data, offset)
+        offset += MULTIBALL_FORMAT.size
+        self.ball_count = ball.count = count
+        self.win_condition = None if win_condition < 0 else win_condition
+        offset = unpack_generator(ball.generator, data, offset)
+        for name in ("x", "y", "x_vol", "y_vol"):
+            setattr(ball, name, np.frombuffer(data, np.float64, count, offset).copy())
+            offset += count * 8
+        return offset
+
+    def save_ball(self):
+        """The balls are saved after the single ball layout, so its ball is blank."""
+        return (0.0,) * 6 + (0, 0)
+
+    def load_ball(self, values):
+        """The balls are loaded by load_state."""
@@ -4,28 +4,102 @@
 # Music and sound effectss #
 ###########################
 
+The music is a song made of sections, each of which plays a list of patterns
+(drum strings or notes) on each of the music channels, one after another and
+looping. The Sequencer compiles each pattern into a pyxel sound at the
+section's speed (and shifted by some octaves) the first time it is needed,
+and keeps the compiled sounds in a least recently used cache, so all of the
+song's sections are compiled up front and changing section while the game
+runs is just playing sounds which are already there.
+
+The sounds and the compiled sections are saved in a pyxel resource file, the
+sound bank, and loaded from it in one go the next time.
 """
 
+import argparse
+from collections import namedtuple, OrderedDict
+import glob
+import hashlib
+import os
 import pyxel
+from events import EVENT_HIT, EVENT_SCORE, EVENT_PICKUP, EVENT_FINISH
+
+# The sounds and the song built into a pyxel resource file, to load at startup
+# without building them again. The bank is named after a hash of this file's
+# source (and the pyxel version which wrote it), so changing any sound or the
+# song makes a new one, whatever the file's modification time says.
+SOUND_BANK_DIRECTORY = os.path.dirname(os.path.abspath(__file__))
+SOUND_BANK_NAME = "sounds-{}.pyxres"
+
+SFX_CHANNEL = 0
+MUSIC_CHANNELS = (1, 2, 3)
+PATTERN_SOUNDS = range(16, 64)  # The sounds compiled patterns are kept in
+
+# A section of a song plays each channel's list of (pattern name, octaves to
+# shift it by) in turn, looping, at the given speed. Channels loop on their
+# own, so a shorter one repeats under a longer one.
+Section = namedtuple("Section", "speed channels")
+
+# The sections of the song, and the ball speed from which each is played
+SONG = {
+    "normal": Section(
+        speed=30,
+        channels=([("drums", 0)], [("harmony", 0)], []),
+    ),
+    "fast": Section(
+        speed=22,
+        channels=([("drums_fast", 0)], [("harmony", 0)], [("melody", 1)]),
+    ),
+}
+SECTION_SPEEDS = (("normal", 0), ("fast", 0.75))
 
 
 class Music:
     """A class to contain music and sound effectss."""
 
-    def __init__(self):
-        """Define sound and music."""
+    def __init__(self, bank=None):
+        """Define sound and music.
+
+        The sounds and every section of the song, compiled, are loaded from the
+        bank file for this version of music.py (by default the one next to it)
+        if there is one, otherwise they are built here, before the game starts,
+        and the bank saved (if it can be) for next time."""
+
+        if bank is None:
+            bank = self.bank_path()
+        sections = list(SONG.values())
+        if os.path.exists(bank):
+            pyxel.load(bank, image=False, tilemap=False)
+            self.sequencer = Sequencer(lambda: self.definitions()["patterns"])
+            self.sequencer.restore(sections)
+        else:
+            definitions = self.definitions()
+            self.build_sounds(definitions["sounds"])
+            self.sequencer = Sequencer(definitions["patterns"])
+            self.sequencer.store(sections)
+            self.save_bank(bank)
+        self.section = None  # The section playing, if any
+
+    @staticmethod
+    def definitions():
+        """Return the arguments to pyxel's Sound.set for each sound effect, by
+        number, and for each pattern of the song, by name, as a dict of
+        "sounds" and "patterns"."""
+
+        sounds = {}
+        patterns = {}
 
         #################
         # Sound effectss #
         #################
 
         # Score
-        pyxel.sound(0).set(
+        sounds[0] = dict(
             notes="c3e3g3c4c4", tones="s", volumes="4", effects=("n" * 4 + "f"), speed=7
         )
 
         # Finish
-        pyxel.sound(1).set(
+        sounds[1] = dict(
             notes="f3 b2 f2 b1  f1 f1 f1 f1",
             tones="p",
             volumes=("4" * 4 + "4321"),
@@ -34,21 +108,21 @@ class Music:
         )
 
         # Hit
-        pyxel.sound(2).set(notes="c3", tones="p", volumes="4", effects=("n"), speed=7)
+        sounds[2] = dict(notes="c3", tones="p", volumes="4", effects=("n"), speed=7)
 
         # Pickup
-        pyxel.sound(3).set(notes="a2", tones="s", volumes="4", effects="f", speed=40)
+        sounds[3] = dict(notes="a2", tones="s", volumes="4", effects="f", speed=40)
 
         #########
         # Music #
         #########
 
-        speed = 30
-
         # Drums
         drum_sound = "b_s_bbs_" "b_s_bbsH" "b_s_bbs_" "b_s_bbsb"
+        patterns["drums"] = Music.convert_drums(drum_sound)
 
-        pyxel.sound(10).set(**self.convert_drums(drum_sound, speed=speed))
+        drum_sound_fast = "bhshbbsh" "bhshbbsH" "bhshbbsh" "bhshbsbb"
+        patterns["drums_fast"] = Music.convert_drums(drum_sound_fast)
 
         # Harmony
         harmony = (
@@ -58,58 +132,124 @@ class Music:
             "e1 e1 g1 b1 r  e1 g1 b1"
         )
 
-        pyxel.sound(11).set(
-            notes=harmony, tones="t", volumes=("4"), effects=("f"), speed=speed
-        )
+        patterns["harmony"] = dict(notes=harmony, tones="t", volumes="4", effects="f")
+        patterns["melody"] = dict(notes=harmony, tones="s", volumes="2", effects="n")
+
+        return {"sounds": sounds, "patterns": patterns}
+
+    ##############
+    # Sound bank #
+    ##############
+
+    @staticmethod
+    def source_key():
+        """Return a hash of this file's source and the pyxel version, the bank's key."""
+        with open(__file__, "rb") as file:
+            source = file.read()
+        return hashlib.sha256(source + pyxel.VERSION.encode()).hexdigest()[:16]
+
+    @staticmethod
+    def bank_path(directory=SOUND_BANK_DIRECTORY):
+        """Return the name of the bank file for this version of music.py."""
+        return os.path.join(directory, SOUND_BANK_NAME.format(Music.source_key()))
+
+    @staticmethod
+    def build_sounds(definitions):
+        """Set up the sounds by having pyxel read their definitions."""
+        for snd, arguments in definitions.items():
+            pyxel.sound(snd).set(**arguments)
+
+    @staticmethod
+    def save_bank(filename):
+        """Save pyxel's sounds and musics to a bank file, replacing the banks
+        of other versions of music.py in the same directory. Returns whether
+        it could, which it can't somewhere read only.
+
+        The bank is written under another name and then renamed, so a game
+        stopped while writing can't leave half a bank to be loaded."""
+
+        directory = os.path.dirname(filename)
+        if not os.access(directory, os.W_OK):
+            return False  # Somewhere read only, so build them every time
+        for old in glob.glob(os.path.join(directory, SOUND_BANK_NAME.format("*"))):
+            os.remove(old)
+        pyxel.save(filename + ".new", image=False, tilemap=False)
+        os.replace(filename + ".new", filename)
+        return True
 
     def sfx_score(self):
         """Play scoring sound."""
-        pyxel.play(ch=0, snd=0)
+        pyxel.play(ch=SFX_CHANNEL, snd=0)
 
     def sfx_finish(self):
         """Play finish sound."""
-        pyxel.play(ch=0, snd=1)
+        pyxel.play(ch=SFX_CHANNEL, snd=1)
 
     def sfx_hit(self):
         """Play sound for when ball hits paddle."""
-        pyxel.play(ch=0, snd=2)
+        pyxel.play(ch=SFX_CHANNEL, snd=2)
 
     def sfx_pickup(self):
-        pyxel.play(ch=0, snd=3)
-
-    def start_music(self):
-        """Start all music tracks (channels 1 - 3)."""
-        pyxel.play(ch=1, snd=10, loop=True)
-        pyxel.play(ch=2, snd=11, loop=True)
+        pyxel.play(ch=SFX_CHANNEL, snd=3)
+
+    def play_events(self, events):
+        """Play the sound effects for a frame's events (an EventQueue).
+
+        Only one sound plays on the effects channel at a time, so however many
+        events there were, only the sound for the most important is played."""
+        if EVENT_FINISH in events:
+            self.stop_music()
+            self.sfx_finish()
+        elif EVENT_SCORE in events:
+            self.sfx_score()
+        elif EVENT_PICKUP in events:
+            self.sfx_pickup()
+        elif EVENT_HIT in events:
+            self.sfx_hit()
+
+    def start_music(self, section=SECTION_SPEEDS[0][0]):
+        """Start the given section of the song (the first, by default)."""
+        self.section = section
+        self.sequencer.play(SONG[section])
 
     def stop_music(self):
         """Stop all music tracks (channels 1 - 3)."""
-        for ch in range(1, 4):
+        self.section = None
+        for ch in MUSIC_CHANNELS:
             pyxel.stop(ch=ch)
 
+    def follow_speed(self, speed):
+        """Change to the section of the song for the ball's speed, if the music
+        is playing and it isn't already."""
+        if self.section is None:
+            return
+        section = self.section
+        for name, from_speed in SECTION_SPEEDS:
+            if speed >= from_speed:
+                section = name
+        if section != self.section:
+            self.start_music(section)
+
     @staticmethod
     def standardise_length(sounds):
         """For a list of sound numbers, loop the shorter ones to fit the longer one."""
         max_length = max(len(pyxel.sound(snd).notes) for snd in sounds)
         for snd in sounds:
-            multiple = len(pyxel.sound(snd).notes) / max_length
-            if int(multiple) != multiple:
+            if max_length % len(pyxel.sound(snd).notes):
                 raise ValueError("One of the sounds does not loop within the longest sound.")
-        
-        for snd in sounds:
-            multiple = len(pyxel.sound(snd).notes) / max_length
-            pyxel.sound(snd).notes = pyxel.sound(snd).notes * int(multiple)
-            
 
+        for snd in sounds:
+            notes = pyxel.sound(snd).notes
+            multiple = max_length // len(notes)
+            notes.from_list(notes.to_list() * multiple)
 
     @staticmethod
     def octave_shift(snd, octaves=1):
         """Shift the notess of the given sound by the given amount of octaves."""
 
         notes_shift = 12 * octaves
-        pyxel.sound(snd).notes = [
-            i + notes_shift if i != -1 else -1 for i in pyxel.sound(snd).notes
-        ]
+        notes = pyxel.sound(snd).notes
+        notes.from_list([i + notes_shift if i != -1 else -1 for i in notes.to_list()])
 
     @staticmethod
     def convert_drums(drum_string, speed=20):
@@ -150,25 +290,123 @@ class Music:
         return output
 
 
+class Sequencer:
+    """Compiles patterns into pyxel sounds, and plays sections of songs with them."""
+
+    def __init__(self, patterns, sounds=PATTERN_SOUNDS):
+        """Set up with a dict of pattern name: arguments to Sound.set (without
+        a speed), or a function returning one when a pattern is first compiled,
+        compiling into the given range of sound numbers."""
+        self.patterns = patterns
+        self.free = list(sounds)
+        self.compiled = OrderedDict()  # (name, octaves, speed): sound, oldest use first
+        self.compiles = 0
+
+    def compile(self, name, octaves, speed):
+        """Return the number of a sound playing the named pattern at the given
+        speed, shifted by the given octaves, compiling it if it isn't cached.
+
+        When there are no sounds left, the least recently used is reused."""
+
+        key = (name, octaves, speed)
+        snd = self.compiled.get(key)
+        if snd is not None:
+            self.compiled.move_to_end(key)
+            return snd
+
+        if self.free:
+            snd = self.free.pop(0)
+        else:
+            _, snd = self.compiled.popitem(last=False)
+        if callable(self.patterns):
+            self.patterns = self.patterns()
+        pyxel.sound(snd).set(**{**self.patterns[name], "speed": speed})
+        if octaves:
+            Music.octave_shift(snd, octaves)
+        self.compiled[key] = snd
+        self.compiles += 1
+        return snd
+
+    def prepare(self, section):
+        """Compile a section, returning the list of sounds for each channel."""
+        return [
+            [self.compile(name, octaves, section.speed) for name, octaves in channel]
+            for channel in section.channels
+        ]
+
+    def store(self, sections):
+        """Compile a list of sections into pyxel's musics, one each in order,
+        so they are saved along with the sounds."""
+        for number, section in enumerate(sections):
+            channels = [[] for _ in range(pyxel.NUM_CHANNELS)]
+            for ch, sounds in zip(MUSIC_CHANNELS, self.prepare(section)):
+                channels[ch] = sounds
+            pyxel.music(number).set(*channels)
+
+    def restore(self, sections):
+        """Take back the sections compiled by store from pyxel's musics, once
+        they have been loaded, without compiling anything."""
+        for number, section in enumerate(sections):
+            snds_list = pyxel.music(number).snds_list
+            for ch, channel in zip(MUSIC_CHANNELS, section.channels):
+                for (name, octaves), snd in zip(channel, snds_list[ch]):
+                    self.compiled[(name, octaves, section.speed)] = snd
+                    if snd in self.free:
+                        self.free.remove(snd)
+
+    def play(self, section):
+        """Start playing a section on the music channels, looping."""
+        for ch, sounds in zip(MUSIC_CHANNELS, self.prepare(section)):
+            if sounds:
+                pyxel.play(ch=ch, snd=sounds, loop=True)
+            else:
+                pyxel.stop(ch=ch)
+
+
 if __name__ == "__main__":
-    pyxel.init(50, 50)
-    music = Music()
-
-    def controls():
-        if pyxel.btnp(pyxel.KEY_1):
-            music.sfx_hit()
-        if pyxel.btnp(pyxel.KEY_2):
-            music.sfx_score()
-        if pyxel.btnp(pyxel.KEY_3):
-            music.sfx_finish()
-        if pyxel.btnp(pyxel.KEY_4):
-            music.sfx_pickup()
-        if pyxel.btnp(pyxel.KEY_S):
-            music.start_music()
-        if pyxel.btnp(pyxel.KEY_F):
-            music.stop_music()
-
-        if pyxel.btnp(pyxel.KEY_Q):
-            pyxel.quit()
-
-    pyxel.run(controls, lambda: None)
+    parser = argparse.ArgumentParser(description="Try out the sounds and music.")
+    parser.add_argument(
+        "--compile",
+        action="store_true",
+        help="just build the sound bank, for a quick start next time",
+    )
+    args = parser.parse_args()
+
+    if args.compile:
+        os.environ.setdefault("SDL_VIDEODRIVER", "dummy")
+        os.environ.setdefault("SDL_AUDIODRIVER", "dummy")
+        pyxel.init(50, 50)
+        bank = Music.bank_path()
+        if os.path.exists(bank):
+            os.remove(bank)
+        music = Music(bank)
+        definitions = music.definitions()
+        print(
+            "Saved {} sounds and {} compiled patterns to {}.".format(
+                len(definitions["sounds"]), len(music.sequencer.compiled), bank
+            )
+        )
+    else:
+        pyxel.init(50, 50)
+        music = Music()
+
+        def controls():
+            if pyxel.btnp(pyxel.KEY_1):
+                music.sfx_hit()
+            if pyxel.btnp(pyxel.KEY_2):
+                music.sfx_score()
+            if pyxel.btnp(pyxel.KEY_3):
+                music.sfx_finish()
+            if pyxel.btnp(pyxel.KEY_4):
+                music.sfx_pickup()
+            if pyxel.btnp(pyxel.KEY_S):
+                music.start_music()
+            if pyxel.btnp(pyxel.KEY_D):
+                music.start_music("fast")
+            if pyxel.btnp(pyxel.KEY_F):
+                music.stop_music()
+
+            if pyxel.btnp(pyxel.KEY_Q):
+                pyxel.quit()
+
+        pyxel.run(controls, lambda: None)
@@ -0,0 +1,314 @@
+"""Online two player pong, with rollback.
+
+Each machine runs the whole game, and they only send each other their
+controls. Rather than wait for the other player's controls to arrive every
+frame (which feels awful at 60 fps), a RollbackSession carries straight on,
+guessing that the other player is still holding down whatever they held down
+last. When their real controls arrive, and the guess was wrong, the game is
+put back to a snapshot (see GameState.save_state) from just before the first
+wrong frame and quickly played forward again with the right controls.
+
+Your own controls can also be delayed by a few frames (input_delay), which
+gives them time to reach the other machine before they are needed, so fewer
+rollbacks are necessary.
+
+Controls travel over UDP (UdpTransport). Each packet repeats every control the
+other machine hasn't acknowledged yet, so lost packets don't matter. A
+LoopbackLink stands in for two machines and a lossy network, and
+check_loopback uses one to check both ends end up playing the same match:
+
+    python3 netplay.py
+
+"""
+
+from random import Random
+import socket
+import struct
+
+from engine import GameState, INPUT_L_UP, INPUT_L_DOWN, INPUT_R_UP, INPUT_R_DOWN
+from replay import state_hash
+
+INPUT_DELAY = 2
+MAX_ROLLBACK = 10
+
+# Controls for one paddle
+CONTROL_UP = 1
+CONTROL_DOWN = 2
+
+# First frame, frame acknowledged, number of controls; followed by a byte of
+# controls for each frame from the first.
+PACKET_FORMAT = struct.Struct("<iiB")
+MAX_PACKET_CONTROLS = 255
+
+
+def combine_controls(side, local, remote):
+    """Turn each player's paddle controls into GameState.step inputs."""
+
+    if side == "l":
+        left, right = local, remote
+    else:
+        left, right = remote, local
+    inputs = 0
+    if left & CONTROL_UP:
+        inputs |= INPUT_L_UP
+    if left & CONTROL_DOWN:
+        inputs |= INPUT_L_DOWN
+    if right & CONTROL_UP:
+        inputs |= INPUT_R_UP
+    if right & CONTROL_DOWN:
+        inputs |= INPUT_R_DOWN
+    return inputs
+
+
+###########
+# Session #
+###########
+
+
+class RollbackSession:
+    """One end of an online match, playing the paddle on the given side ("l" or "r")."""
+
+    def __init__(
+        self,
+        state,
+        side,
+        transport,
+        input_delay=INPUT_DELAY,
+        max_rollback=MAX_ROLLBACK,
+    ):
+        """Start a session for a fresh GameState, which must be set up
+        (seeded) the same way at both ends."""
+
+        self.state = state
+        self.side = side
+        self.transport = transport
+        self.input_delay = input_delay
+        self.max_rollback = max_rollback
+
+        self.frame = 0  # The next frame to simulate
+        self.local_controls = {frame: 0 for frame in range(input_delay)}
+        self.local_frame = input_delay - 1  # Our controls are known up to this frame
+        self.remote_controls = {}
+        self.remote_used = {}  # The remote controls each frame was simulated with
+        self.snapshots = {}  # The state before each frame which may need redoing
+
+        self.confirmed = -1  # Remote controls are known for every frame up to this
+        self.acknowledged = -1  # The other end has our controls up to this frame
+        self.rollback_to = None
+        self.rollbacks = 0
+
+    def advance(self, controls):
+        """Play the next frame with this player's controls (CONTROL_* flags).
+
+        Returns False, without playing a frame, if the other player is too
+        far behind to guess their controls any longer."""
+
+        self.update()
+        if self.frame - self.confirmed > self.max_rollback:
+            return False
+
+        self.local_frame = self.frame + self.input_delay
+        self.local_controls[self.local_frame] = controls
+        self.send()
+        self.simulate(self.frame)
+        self.frame += 1
+        self.forget()
+        return True
+
+    def update(self):
+        """Receive the other player's controls, redo any frames guessed wrong,
+        and send them our controls."""
+
+        for packet in self.transport.receive():
+            self.receive(packet)
+        if self.rollback_to is not None:
+            self.resimulate()
+        self.send()
+
+    def simulate(self, frame):
+        """Snapshot the state, then step it with the controls for the frame."""
+
+        self.snapshots[frame] = self.state.save_state()
+        remote = self.predict(frame)
+        self.remote_used[frame] = remote
+        local = self.local_controls.get(frame, 0)
+        self.state.step(combine_controls(self.side, local, remote))
+
+    def predict(self, frame):
+        """The remote controls for the frame, or a guess if they aren't known yet."""
+
+        if frame in self.remote_controls:
+            return self.remote_controls[frame]
+        return self.remote_controls.get(self.confirmed, 0)
+
+    def resimulate(self):
+        """Go back to the first frame guessed wrong and play forward again."""
+
+        frame = self.rollback_to
+        self.rollback_to = None
+        self.rollbacks += 1
+        self.state.load_state(self.snapshots[frame])
+        for redo in range(frame, self.frame):
+            self.simulate(redo)
+
+    def receive(self, packet):
+        """Take in a packet of the other player's controls."""
+
+        first, acknowledged, count = PACKET_FORMAT.unpack_from(packet)
+        controls = packet[PACKET_FORMAT.size : PACKET_FORMAT.size + count]
+        self.acknowledged = max(self.acknowledged, acknowledged)
+
+        for frame, control in enumerate(controls, start=first):
+            if frame in self.remote_controls:
+                continue
+            self.remote_controls[frame] = control
+            if frame in self.remote_used and self.remote_used[frame] != control:
+                if self.rollback_to is None or frame < self.rollback_to:
+                    self.rollback_to = frame
+
+        while self.confirmed + 1 in self.remote_controls:
+            self.confirmed += 1
+
+    def send(self):
+        """Send the other player every control of ours they haven't acknowledged."""
+
+        first = self.acknowledged + 1
+        last = min(self.local_frame, first + MAX_PACKET_CONTROLS - 1)
+        controls = bytes(self.local_controls[frame] for frame in range(first, last + 1))
+        self.transport.send(PACKET_FORMAT.pack(first, self.confirmed, len(controls)) + controls)
+
+    def forget(self):
+        """Drop snapshots and controls which can no longer be needed."""
+
+        oldest = min(self.confirmed, self.acknowledged, self.frame - self.max_rollback - 1)
+        for frame in [frame for frame in self.snapshots if frame <= self.confirmed]:
+            del self.snapshots[frame]
+        for table in (self.local_controls, self.remote_controls, self.remote_used):
+            for frame in [frame for frame in table if frame < oldest]:
+                del table[frame]
+
+
+##############
+# Transports #
+##############
+
+
+class UdpTransport:
+    """Sends and receives packets to and from one other machine over UDP."""
+
+    def __init__(self, local_port, remote_address):
+        """Listen on the local port, and send to the remote (host, port)."""
+        self.remote_address = remote_address
+        self.socket = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self.socket.bind(("", local_port))
+        self.socket.setblocking(False)
+
+    def send(self, data):
+        """Send a packet."""
+        try:
+            self.socket.sendto(data, self.remote_address)
+        except OSError:
+            pass  # Packets can go missing anyway
+
+    def receive(self):
+        """Return every packet waiting to be read."""
+        packets = []
+        while True:
+            try:
+                packets.append(self.socket.recv(2048))
+            except (BlockingIOError, ConnectionError):
+                return packets
+
+
+class LoopbackLink:
+    """Two connected ends in memory, with a network that can lose, delay and
+    reorder packets.
+
+    Each end counts the times it is asked to receive as its clock, and a
+    packet arrives delay (plus up to jitter) receives after it was sent."""
+
+    def __init__(self, loss=0.0, delay=0, jitter=0, seed=None):
+        """Set up the link and its two ends."""
+        self.loss = loss
+        self.delay = delay
+        self.jitter = jitter
+        self.rng = Random(seed)
+        self.ends = (LoopbackEnd(self), LoopbackEnd(self))
+        self.ends[0].other = self.ends[1]
+        self.ends[1].other = self.ends[0]
+
+
+class LoopbackEnd:
+    """One end of a LoopbackLink."""
+
+    def __init__(self, link):
+        """Start with nothing in transit."""
+        self.link = link
+        self.other = None
+        self.clock = 0
+        self.inbox = []
+
+    def send(self, data):
+        """Send a packet to the other end, unless the link loses it."""
+        link = self.link
+        if link.rng.random() < link.loss:
+            return
+        arrival = self.clock + link.delay + link.rng.randint(0, link.jitter)
+        self.other.inbox.append((arrival, data))
+
+    def receive(self):
+        """Return the packets which have arrived."""
+        self.clock += 1
+        arrived = [data for arrival, data in self.inbox if arrival <= self.clock]
+        self.inbox = [(arrival, data) for arrival, data in self.inbox if arrival > self.clock]
+        return arrived
+
+
+###############################
+# Checking over a bad network #
+###############################
+
+
+def play_loopback(frames=3000, loss=0.2, delay=4, jitter=3, seed=0):
+    """Play a match between two sessions over a bad LoopbackLink, with random
+    controls, until both have every control for the frames played. Returns
+    the two sessions."""
+
+    link = LoopbackLink(loss=loss, delay=delay, jitter=jitter, seed=seed)
+    players = Random(seed)
+    sessions = [
+        RollbackSession(GameState(seed=seed), side, end)
+        for side, end in zip(("l", "r"), link.ends)
+    ]
+    controls = [0, 0]
+
+    while any(session.frame < frames for session in sessions):
+        for i, session in enumerate(sessions):
+            if session.frame < frames:
+                if players.random() < 0.1:
+                    controls[i] = players.choice((0, CONTROL_UP, CONTROL_DOWN))
+                session.advance(controls[i])
+            else:
+                session.update()
+
+    # Let the last controls arrive
+    while any(session.confirmed < frames - 1 for session in sessions):
+        for session in sessions:
+            session.update()
+    return sessions
+
+
+def check_loopback(frames=3000, loss=0.2, delay=4, jitter=3, seed=0):
+    """Play a match with play_loopback, and raise AssertionError unless both
+    ends end up in the same state. Returns the number of rollbacks."""
+
+    sessions = play_loopback(frames, loss, delay, jitter, seed)
+    hashes = {state_hash(session.state) for session in sessions}
+    if len(hashes) != 1:
+        raise AssertionError("The two ends of the match have different states.")
+    return sum(session.rollbacks for session in sessions)
+
+
+if __name__ == "__main__":
+    rollbacks = check_loopback()
+    print("Both ends agree, after {} rollbacks.".format(rollbacks))
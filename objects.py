@@ -2,19 +2,24 @@
 Define the paddle and the ball objects.
 """
 
-import pyxel
-from utilities import is_overlap, random_direction
+import random
+from utilities import is_overlap, sweep_overlap, random_direction, Rect
+from events import EVENT_HIT
 
 SPIN = 0.4
 BOUNCE = 0.03
 BOUNCE_FRICTION = 0.1
 GIANT_SIDE_CHANGE = 5
 
+# The most hits resolved in one sweep, in case the ball gets wedged.
+MAX_SWEEP_HITS = 16
+
 
 class Paddle:
     """Class for the paddles.
 
-    Controls the movement and display of the paddles."""
+    Controls the movement and display of the paddles. Drawing is left to the
+    caller so that the paddle can be simulated without a window."""
 
     def __init__(
         self,
@@ -22,14 +27,10 @@ class Paddle:
         colour,
         width,
         height,
-        control_up,
-        control_down,
         move_speed,
         dimensions,
     ):
         """Set up key paddle variables."""
-        self.control_up = control_up
-        self.control_down = control_down
         self.move_speed = move_speed
         self.colour = colour
         self.x = coordinates[0]
@@ -38,21 +39,23 @@ class Paddle:
         self.height = height
         self.dimensions = dimensions
 
-    def update(self):
-        """Move the paddle up and down."""
-        if pyxel.btn(self.control_up):
-            self.y -= self.move_speed
-        elif pyxel.btn(self.control_down):
-            self.y += self.move_speed
+    def update(self, up, down, frames=1):
+        """Move the paddle up and down given the state of its two controls.
+
+        Moves as far as it would over the given number of frames."""
+        if up:
+            self.y -= self.move_speed * frames
+        elif down:
+            self.y += self.move_speed * frames
 
         if self.y < 0:
             self.y = 0
         elif self.y + self.height > self.dimensions[1]:
             self.y = self.dimensions[1] - self.height
 
-    def display(self):
-        """Display the paddle as a rect."""
-        pyxel.rect(
+    def display(self, rect):
+        """Display the paddle as a rect using the given drawing function."""
+        rect(
             x=self.x,
             y=self.y,
             w=self.width,
@@ -66,10 +69,19 @@ class Ball:
 
     Moves and displays the ball."""
 
+    events = None  # An EventQueue to emit hits into, if any
+
     def __init__(
-        self, coordinates, colour, width, height, initial_velocity, dimensions
+        self,
+        coordinates,
+        colour,
+        width,
+        height,
+        initial_velocity,
+        dimensions,
+        rng=random,
     ):
-        """Store initial variables."""
+        """Store initial variables. Directions are drawn from rng."""
         self.initial_variables = dict(
             coordinates=coordinates,
             initial_velocity=initial_velocity,
@@ -78,6 +90,7 @@ class Ball:
         self.colour = colour
         self.width = width
         self.height = height
+        self.rng = rng
 
         self.reset()
         self.dimensions = dimensions
@@ -109,24 +122,110 @@ class Ball:
                 self.y_vol = -self.y_vol
 
     def check_collision(self, paddles):
-        """Check if the ball is hitting a paddle and react accordingly."""
+        """Check if the ball is hitting a paddle and react accordingly.
+
+        Paddles can be all the paddles, or just those near the ball."""
         for paddle in paddles:
             if not is_overlap(self, paddle):
                 continue
 
-            self.spin_ball(paddle)
+            self.rebound(paddle)
+            return True
+        return False
 
-            self.x_vol = -self.x_vol
+    def rebound(self, paddle):
+        """Send the ball back the way it came off the paddle, with spin."""
+
+        self.spin_ball(paddle)
+
+        self.x_vol = -self.x_vol
+
+        ball_center = self.x + self.width / 2
+        paddle_center = paddle.x + paddle.width / 2
+
+        if ball_center > paddle_center:
+            self.x = paddle.x + paddle.width
+        else:
+            self.x = paddle.x - self.width
+
+    def sweep(self, paddles, frames=1):
+        """Move the ball over the given number of frames, resolving every hit on the way.
+
+        Unlike update followed by check_collision, which only look at where the
+        ball ends up, this finds the moment the ball first touches a wall,
+        paddle or side and reacts there before carrying on with the rest of the
+        move. A fast ball (or a long step) can't pass through a paddle.
+
+        Paddles can be all the paddles, or just those near the ball's path.
+
+        Returns a tuple of the scoring side ("l", "r" or None, as for update)
+        and whether a paddle was hit. The straight segments travelled are left
+        in self.path as (Rect, dx, dy) for checking pickups against.
+        """
+
+        width, height = self.dimensions
+        total_frames = frames
+        outcome = None
+        hit = False
+        self.path = []
+
+        for _ in range(MAX_SWEEP_HITS):
+            dx = self.x_vol * frames
+            dy = self.y_vol * frames
+
+            # Everything touched during the move, as (fraction of the move, what, paddle)
+            touches = [(1.0, None, None)]
+
+            for paddle in paddles:
+                # Only hit a paddle while heading towards it.
+                ball_center = self.x + self.width / 2
+                paddle_center = paddle.x + paddle.width / 2
+                if (dx > 0) != (ball_center < paddle_center):
+                    continue
+                time = sweep_overlap(self, dx, dy, paddle)
+                if time is not None:
+                    touches.append((time, "paddle", paddle))
+
+            if dx < 0 and self.x + dx < 0:
+                touches.append((-self.x / dx, "r", None))
+            elif dx > 0 and self.x + self.width + dx > width:
+                touches.append(((width - self.width - self.x) / dx, "l", None))
+
+            if dy < 0 and self.y + dy < 0:
+                touches.append((-self.y / dy, "top", None))
+            elif dy > 0 and self.y + self.height + dy > height:
+                touches.append(((height - self.height - self.y) / dy, "bottom", None))
+
+            time, event, paddle = min(touches, key=lambda touch: touch[0])
+            self.path.append(
+                (Rect(self.x, self.y, self.width, self.height), dx * time, dy * time)
+            )
+            self.x += dx * time
+            self.y += dy * time
+            frames *= 1 - time
+
+            if event is None:
+                break
+            elif event == "paddle":
+                self.rebound(paddle)
+                hit = True
+            elif event == "top":
+                self.y = 0
+                self.y_vol = -self.y_vol
+            elif event == "bottom":
+                self.y = height - self.height
+                if self.bounce_status:
+                    self.y_vol = -self.y_vol + BOUNCE_FRICTION
+                else:
+                    self.y_vol = -self.y_vol
+            else:
+                outcome = event
+                break
 
-            ball_center = self.x + self.width / 2
-            paddle_center = paddle.x + paddle.width / 2
+        if self.bounce_status:
+            self.y_vol += BOUNCE * total_frames
 
-            if ball_center > paddle_center:
-                self.x = paddle.x + paddle.width
-            else:
-                self.x = paddle.x - self.width
-            return True
-        return False
+        return outcome, hit
 
     def spin_ball(self, paddle):
         """Adds or substracts y velocity based on where the ball hit the paddle."""
@@ -139,10 +238,13 @@ class Ball:
         spin = hit_position_normalised * SPIN
 
         self.y_vol += spin
+        if self.events is not None:
+            side = "l" if self.x_vol < 0 else "r"
+            self.events.emit(EVENT_HIT, side, hit_position_normalised)
 
-    def display(self):
-        """Display the ball."""
-        pyxel.rect(
+    def display(self, rect):
+        """Display the ball using the given drawing function."""
+        rect(
             x=self.x,
             y=self.y,
             w=self.width,
@@ -154,8 +256,8 @@ class Ball:
         """Reset to the middle of the board."""
         self.x = self.initial_variables["coordinates"][0]
         self.y = self.initial_variables["coordinates"][1]
-        self.x_vol = self.initial_variables["initial_velocity"] * random_direction()
-        self.y_vol = self.initial_variables["initial_velocity"] * random_direction()
+        self.x_vol = self.initial_variables["initial_velocity"] * random_direction(self.rng)
+        self.y_vol = self.initial_variables["initial_velocity"] * random_direction(self.rng)
 
     def bounce_on(self):
         """Turn the bounce on."""
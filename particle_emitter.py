@@ -1,36 +1,166 @@
-"""Class for sparkling the ball."""
-import pyxel
-from random import randint
+"""Class for sparkling the ball.
+
+Particles are kept in a fixed-size ring of preallocated NumPy arrays rather
+than a list of dicts. Emitting a particle writes into the next slot
+(overwriting the oldest particle if the ring is full), and particles past
+their lifetime are simply left out when moving and drawing.
+
+The game only says when the ball sparkles (with an EVENT_SPARKLE each frame the
+sparkle pickup is on), and a front end passes those to sparkle_events, so
+headless matches never make a particle.
+"""
+import numpy as np
+
+from events import EVENT_SPARKLE
+
+PARTICLE_CAPACITY = 4096
+PARTICLE_LIFETIME = 20
+SPARKLE_INTERVAL = 2  # Frames between sparkles
+SPARKLE_SEED = 0  # For emitters not given a Random, so they sparkle the same every run
 
 
 class ParticleEmitter:
-    def __init__(self, ball):
+    def __init__(self, ball, capacity=PARTICLE_CAPACITY, gravity=0.0, rng=None):
+        """Allocate the particle arrays. Gravity is added to each particle's
+        y velocity every frame, and sparkles are scattered by a generator
+        seeded from rng (such as the game's Random), or from SPARKLE_SEED if
+        there isn't one."""
         self.ball = ball
-        self.particles = []
         self.status = 0
+        self.gravity = gravity
+        self.interval = SPARKLE_INTERVAL  # Or 0 for no sparkles, even when on
+
+        self.capacity = capacity
+        self.x = np.zeros(capacity)
+        self.y = np.zeros(capacity)
+        self.x_vol = np.zeros(capacity)
+        self.y_vol = np.zeros(capacity)
+        self.colour = np.zeros(capacity, dtype=np.uint8)
+        self.zero_frame = np.full(capacity, -PARTICLE_LIFETIME, dtype=np.int64)
+        self.next = 0
+        self.last_emit = -PARTICLE_LIFETIME
+        if rng is None:
+            seed = np.random.SeedSequence(SPARKLE_SEED)
+        else:
+            seed = rng.getrandbits(64)
+        self.generator = np.random.default_rng(seed)
+
+    def emit(self, x, y, colour, frame_count, x_vol=0.0, y_vol=0.0):
+        """Add a particle in the next slot of the ring."""
+        i = self.next
+        self.x[i] = x
+        self.y[i] = y
+        self.x_vol[i] = x_vol
+        self.y_vol[i] = y_vol
+        self.colour[i] = colour
+        self.zero_frame[i] = frame_count
+        self.next = (i + 1) % self.capacity
+        self.last_emit = frame_count
+
+    def emit_many(self, x, y, colour, frame_count):
+        """Add a particle for each of the given arrays of positions and colours."""
+        count = min(len(x), self.capacity)
+        slots = (self.next + np.arange(count)) % self.capacity
+        self.x[slots] = x[:count]
+        self.y[slots] = y[:count]
+        self.x_vol[slots] = 0.0
+        self.y_vol[slots] = 0.0
+        self.colour[slots] = colour[:count]
+        self.zero_frame[slots] = frame_count
+        self.next = (self.next + count) % self.capacity
+        self.last_emit = frame_count
+
+    def sparkle_events(self, events):
+        """Create the sparkles for a frame's events (an EventQueue), each on
+        the frame it was emitted."""
+        if EVENT_SPARKLE in events:
+            for kind, _, frame_count, _ in events.items():
+                if kind == EVENT_SPARKLE:
+                    self.sparkle(frame_count)
+
+    def sparkle(self, frame_count):
+        """Create the sparkles, every interval frames."""
+        if self.interval and frame_count % self.interval == 0:
+            if np.ndim(self.ball.x):
+                self.sparkle_many(frame_count)
+                return
 
-    def sparkle(self):
-        """Create the sparkles."""
-        if (pyxel.frame_count % 2 == 0) and self.status:
             center_x = self.ball.x + self.ball.width // 2
             center_y = self.ball.y + self.ball.height // 2
 
-            self.particles.append(
-                {
-                    "zero_frame": pyxel.frame_count,
-                    "x": randint(int(center_x) - 4, int(center_x) + 4),
-                    "y": randint(int(center_y) - 4, int(center_y) + 4),
-                    "color": randint(8, 14),
-                }
+            x, y, colour = self.generator.integers((-4, -4, 8), (5, 5, 15))
+            self.emit(
+                x=int(center_x) + int(x),
+                y=int(center_y) + int(y),
+                colour=int(colour),
+                frame_count=frame_count,
             )
 
-    def display(self):
-        """Sparkle the sparkles and disappear them over time."""
-        for idx, particle in enumerate(self.particles):
-            if pyxel.frame_count - particle["zero_frame"] >= 20:
-                del self.particles[idx]
-            else:
-                pyxel.pset(particle["x"], particle["y"], particle["color"])
+    def sparkle_many(self, frame_count):
+        """Create a sparkle around every ball of a set of balls (see multiball.BallSet)."""
+        count = len(self.ball.x)
+        center_x = np.floor(self.ball.x + self.ball.width // 2)
+        center_y = np.floor(self.ball.y + self.ball.height // 2)
+        self.emit_many(
+            x=center_x + self.generator.integers(-4, 5, count),
+            y=center_y + self.generator.integers(-4, 5, count),
+            colour=self.generator.integers(8, 15, count),
+            frame_count=frame_count,
+        )
+
+    def window(self, frame_count):
+        """Return the slots, oldest first, from the oldest live particle to the
+        newest. Particles are emitted in turn around the ring, so every live
+        particle is in here (and nothing before it matters)."""
+        if frame_count - self.last_emit >= PARTICLE_LIFETIME:
+            return np.arange(0)
+        ages = (self.next - 1 - np.flatnonzero(self.alive(frame_count))) % self.capacity
+        count = int(ages.max()) + 1 if len(ages) else 0
+        return (self.next - count + np.arange(count)) % self.capacity
+
+    def alive(self, frame_count):
+        """Return a mask of the particles which haven't yet disappeared."""
+        return frame_count - self.zero_frame < PARTICLE_LIFETIME
+
+    def move(self, frame_count, frames=1):
+        """Move the live particles by their velocity, and apply gravity."""
+        if frame_count - self.last_emit >= PARTICLE_LIFETIME:
+            return  # Nothing left alive
+        alive = self.alive(frame_count)
+        if not alive.any():
+            return
+        self.x[alive] += self.x_vol[alive] * frames
+        self.y[alive] += self.y_vol[alive] * frames
+        if self.gravity:
+            self.y_vol[alive] += self.gravity * frames
+
+    def display(self, pset, frame_count):
+        """Sparkle the sparkles one at a time with the given drawing function."""
+        for i in np.flatnonzero(self.alive(frame_count)):
+            pset(self.x[i], self.y[i], self.colour[i])
+
+    def draw(self, pixels, frame_count):
+        """Sparkle the sparkles by writing straight into a 2d array of pixels."""
+        height, width = pixels.shape
+        x = np.floor(self.x).astype(np.int64)
+        y = np.floor(self.y).astype(np.int64)
+        visible = (
+            self.alive(frame_count) & (x >= 0) & (x < width) & (y >= 0) & (y < height)
+        )
+        pixels[y[visible], x[visible]] = self.colour[visible]
+
+    def bounds(self, frame_count):
+        """Return the (x, y, width, height) of the pixels the live particles
+        cover, or None if there are none."""
+        if frame_count - self.last_emit >= PARTICLE_LIFETIME:
+            return None
+        alive = self.alive(frame_count)
+        if not alive.any():
+            return None
+        x = np.floor(self.x[alive])
+        y = np.floor(self.y[alive])
+        left, top = int(x.min()), int(y.min())
+        return left, top, int(x.max()) - left + 1, int(y.max()) - top + 1
 
     def turn_on(self):
         """Turn the sparkles on."""
@@ -11,12 +11,20 @@ The module exposes the effects of pickups in three ways:
 3. PickupType(exit=function): the function which is triggered when the condition finishes
                               (usually to revert the state to normal)
 
+If an enter function returns something (other than None), it is passed to the matching
+exit function when that condition finishes - for example which paddle it applied to.
+
+Active conditions are kept by an EffectScheduler, in a heap ordered by the frame they end
+on, so finishing conditions costs nothing until one is actually due.
+
 """
 
-from collections import namedtuple
-from random import randint, choice
-import pyxel
-from utilities import is_overlap
+from collections import namedtuple, Counter
+import heapq
+import random
+from utilities import is_overlap, sweep_overlap, Rect
+from spatial_grid import SpatialGrid
+from events import EVENT_PICKUP, EVENT_SPAWN, EVENT_EXPIRE
 
 
 PICKUP_INTERVAL = (300, 900)
@@ -29,79 +37,173 @@ Pickup = namedtuple("Point", "x y width height pickup_type")
 # Define a convenience container to hold a pickup type. Enter and exit need to be functions.
 PickupType = namedtuple("PickupType", "colour enter exit", defaults=[None, None])
 
+# What can happen to a pickup, as counted by telemetry, and the events for each
+PICKUP_EVENTS = ("spawned", "collected", "expired")
+SPAWNED, COLLECTED, EXPIRED = range(len(PICKUP_EVENTS))
+PICKUP_EVENT_KINDS = {
+    EVENT_SPAWN: SPAWNED,
+    EVENT_PICKUP: COLLECTED,
+    EVENT_EXPIRE: EXPIRED,
+}
+
+
+class EffectScheduler:
+    """Keeps track of active conditions and when they end.
+
+    Conditions are kept in a heap of (end frame, order, condition, token), so
+    the next to end is always at the front, and a count of each active
+    condition is kept so checking whether one is active is a lookup.
+    """
+
+    def __init__(self):
+        """Start with nothing scheduled."""
+        self.heap = []
+        self.counts = Counter()
+        self.scheduled = 0  # Breaks ties between conditions ending together, oldest first
+
+    def schedule(self, condition, end_frame, token=None):
+        """Make the condition active until the given frame."""
+        heapq.heappush(self.heap, (end_frame, self.scheduled, condition, token))
+        self.scheduled += 1
+        self.counts[condition] += 1
+
+    def expire(self, frame_count):
+        """Remove and return the (condition, token) pairs that have ended by frame_count."""
+        ended = []
+        while self.heap and frame_count > self.heap[0][0]:
+            _, _, condition, token = heapq.heappop(self.heap)
+            self.counts[condition] -= 1
+            ended.append((condition, token))
+        return ended
+
+    def is_active(self, condition):
+        """Whether the condition is currently active."""
+        return self.counts[condition] > 0
+
+    def __len__(self):
+        """The number of active conditions."""
+        return len(self.heap)
+
 
 class Pickups:
     """A class for keeping track of displaying pickups, then tracking
     the condition of the pickups when they take effect."""
 
-    def __init__(self, pickup_types, music, left, right, top, bottom):
-        """Initiate with given types, and dimensions of the board where pickups are allowed."""
+    events = None  # An EventQueue to emit what happens to pickups into, if any
+
+    def __init__(
+        self, pickup_types, left, right, top, bottom, frame_count=0, rng=random
+    ):
+        """Initiate with given types, and dimensions of the board where pickups are allowed.
+
+        Pickup timing, placement and type are drawn from rng."""
         self.left = left
         self.right = right
         self.top = top
         self.bottom = bottom
+        self.rng = rng
 
-        self.music = music
-
-        self.next_pickup = pyxel.frame_count + randint(*PICKUP_INTERVAL)
+        self.next_pickup = frame_count + self.rng.randint(*PICKUP_INTERVAL)
 
         self.pickup_types = pickup_types
         self.pickups = []
-        self.active_conditions = []
+        self.grid = SpatialGrid()
+        self.active_conditions = EffectScheduler()
 
-    def check_pickup(self):
+    def check_pickup(self, frame_count):
         """Checks whether to create a pickup, and also checks for the end of all active conditions."""
 
-        if pyxel.frame_count > self.next_pickup:
+        if frame_count > self.next_pickup:
             self.create_pickup()
-            self.next_pickup = pyxel.frame_count + randint(*PICKUP_INTERVAL)
-
-        for i, (condition, end_frame) in enumerate(self.active_conditions.copy()):
-            if pyxel.frame_count > end_frame:
-                del self.active_conditions[i]
-
-                exit_function = self.pickup_types[condition].exit
-                if exit_function:
+            self.next_pickup = frame_count + self.rng.randint(*PICKUP_INTERVAL)
+
+        for condition, token in self.active_conditions.expire(frame_count):
+            if self.events is not None:
+                self.events.emit(EVENT_EXPIRE, detail=condition)
+            exit_function = self.pickup_types[condition].exit
+            if exit_function:
+                if token is None:
                     exit_function()
+                else:
+                    exit_function(token)
 
     def is_condition_active(self, condition):
         """Convenience function to see whether a condition is active."""
 
-        conditions = {c for c, _ in self.active_conditions}
-        return condition in conditions
+        return self.active_conditions.is_active(condition)
 
     def create_pickup(self):
         """Create a random pickup on the board."""
 
-        x = randint(self.left, self.right - PICKUP_WIDTH)
-        y = randint(self.top, self.bottom - PICKUP_WIDTH)
-        pickup_type = choice(list(self.pickup_types.keys()))
+        x = self.rng.randint(self.left, self.right - PICKUP_WIDTH)
+        y = self.rng.randint(self.top, self.bottom - PICKUP_WIDTH)
+        pickup_type = self.rng.choice(list(self.pickup_types.keys()))
         pickup = Pickup(
             x=x, y=y, width=PICKUP_WIDTH, height=PICKUP_WIDTH, pickup_type=pickup_type
         )
         self.pickups.append(pickup)
+        self.grid.add(pickup)
+        if self.events is not None:
+            self.events.emit(EVENT_SPAWN, detail=pickup_type)
 
-    def check_collision(self, ball):
-        """Check whether the ball has hit a pickup."""
+    def check_collision(self, ball, frame_count):
+        """Check whether the ball has hit a pickup. Returns True if it has."""
 
-        for i, pickup in enumerate(self.pickups.copy()):
+        for pickup in self.grid.near(ball):
             if is_overlap(pickup, ball):
-                self.music.sfx_pickup()
-                del self.pickups[i]
-                self.active_conditions.append(
-                    (pickup.pickup_type, pyxel.frame_count + PICKUP_LENGTH)
-                )
-
-                enter_function = self.pickup_types[pickup.pickup_type].enter
-                if enter_function:
-                    enter_function()
+                self.collect(pickup, frame_count)
+                return True
+        return False
+
+    def check_sweep(self, ball, frame_count):
+        """Check whether the ball hit a pickup anywhere along its last sweep.
+
+        The pickup touched first along ball.path (see Ball.sweep) is collected.
+        Returns True if one was."""
+
+        first = None
+        for start, dx, dy in ball.path:
+            path_box = Rect(
+                min(start.x, start.x + dx),
+                min(start.y, start.y + dy),
+                start.width + abs(dx),
+                start.height + abs(dy),
+            )
+            for pickup in self.grid.near(path_box):
+                time = sweep_overlap(start, dx, dy, pickup)
+                if time is not None and (first is None or time < first[0]):
+                    first = (time, pickup)
+            if first:
                 break
 
-    def display(self):
-        """Display all pickups."""
+        if first is None:
+            return False
+
+        self.collect(first[1], frame_count)
+        return True
+
+    def collect(self, pickup, frame_count):
+        """Take the pickup off the board and start its condition."""
+
+        self.pickups.remove(pickup)
+        self.grid.remove(pickup)
+        if self.events is not None:
+            self.events.emit(EVENT_PICKUP, detail=pickup.pickup_type)
+
+        token = None
+        enter_function = self.pickup_types[pickup.pickup_type].enter
+        if enter_function:
+            token = enter_function()
+
+        self.active_conditions.schedule(
+            pickup.pickup_type, frame_count + PICKUP_LENGTH, token
+        )
+
+    def display(self, rect):
+        """Display all pickups using the given drawing function."""
 
         for pickup in self.pickups:
-            pyxel.rect(
+            rect(
                 x=pickup.x,
                 y=pickup.y,
                 w=pickup.width,
@@ -8,51 +8,115 @@ Controls are the arrow keys ↑ & ↓ or w & s
 
 Q: Quit the game
 R: Restart the game
+F5: Save the game as it is now
+F9: Go back to the saved game
+
+Run with --balls 1000 (or any number) for multi-ball party mode, or with
+--record DIRECTORY to save a recording of each match (see replay.py).
+
+To play online, each player runs with --online l or --online r (their side),
+--peer HOST:PORT of the other player, and the same --seed (see netplay.py).
+Either set of keys moves your paddle.
+
+Run with --cpu l or --cpu r to have the computer play that side, and
+--difficulty easy, medium or hard (see ai.py).
+
+Run with --capture FILE.pongcap to capture the game as it's drawn, to turn
+into a GIF (see capture.py).
+
+Run with --telemetry FILE.pongtel to count what happens in every match
+played, for gameplay analytics (see telemetry.py).
+
+When frames take too long, sparkles and then drawing are cut back until they
+don't (see governor.py); run with --full-detail to stop this.
+
+Run with --profile FILE.csv to time each part of every frame (see
+profiler.py). F3 flips between the update and draw timings and hides them,
+and the times are saved to the file on quitting.
 
 Created by Marcus Croucher in 2018. Updated in 2023.
 """
 
+import argparse
+import os
+import random
+from random import Random
+import time
+import numpy as np
 import pyxel
-from particle_emitter import ParticleEmitter
-from objects import Paddle, Ball
-from pickups import Pickups, PickupType
 from music import Music
-from utilities import sign
+from engine import (
+    GameState,
+    WIDTH,
+    HEIGHT,
+    PADDLE_SIDE,
+    PADDLE_WIDTH,
+    WIN_CONDITION,
+    INPUT_L_UP,
+    INPUT_L_DOWN,
+    INPUT_R_UP,
+    INPUT_R_DOWN,
+    EVENT_SCORE,
+    EVENT_FINISH,
+)
+from multiball import MultiBallState
+from replay import Recorder, RECORDING_EXTENSION
+from netplay import (
+    RollbackSession,
+    UdpTransport,
+    CONTROL_UP,
+    CONTROL_DOWN,
+    INPUT_DELAY,
+)
+from ai import PaddleAI, DIFFICULTIES
+from utilities import lerp
+from renderer import Renderer
+from events import EventBus
+from capture import Capture
+from telemetry import Telemetry, TelemetryWriter
+from governor import FrameGovernor, DETAIL_LEVELS
+from profiler import Profiler, UPDATE_STAGES
 
 #############
 # Constants #
 #############
 
 COL_BACKGROUND = 5
-COL_PADDLE = 6
-COL_PADDLE_SLOW = 8
-COL_BALL = 9
 COL_SCORE = 13
 COL_FINISH = 13
 COL_FINISH_TEXT = 14
 
-WIDTH = 80
-HEIGHT = 50
-DIMENSIONS = WIDTH, HEIGHT
-
-PADDLE_HEIGHT = 10
-PADDLE_HEIGHT_EXPANDED = 15
-PADDLE_WIDTH = 2
-PADDLE_SIDE = 2
-PADDLE_MOVE_SPEED = 1
-PADDLE_MOVE_SPEED_SLOW = 0.5
-
-
-BALL_INITIAL_VELOCITY = 0.4
-BALL_SIDE = 2
-
-WIN_CONDITION = 5
-
 TEXT_FINISH = ["The winner is:", "", "(Q)UIT", "(R)ESTART"]
 HEIGHT_FINISH = 6
 
-SPEED_PERIOD = 150
-SPEED_AMOUNT = 0.07
+TICK_RATE = 60  # Simulation steps per second
+RENDER_FPS = 60  # Frames drawn per second
+MAX_TICKS_PER_UPDATE = 8  # When further behind than this, slow down rather than catch up
+
+CONTROLS = (
+    (pyxel.KEY_W, INPUT_L_UP),
+    (pyxel.KEY_S, INPUT_L_DOWN),
+    (pyxel.KEY_UP, INPUT_R_UP),
+    (pyxel.KEY_DOWN, INPUT_R_DOWN),
+)
+
+ONLINE_CONTROLS = (
+    (pyxel.KEY_W, CONTROL_UP),
+    (pyxel.KEY_S, CONTROL_DOWN),
+    (pyxel.KEY_UP, CONTROL_UP),
+    (pyxel.KEY_DOWN, CONTROL_DOWN),
+)
+NETPLAY_PORT = 7000
+
+# Stages of drawing a frame timed when profiling, beside profiler.UPDATE_STAGES
+DRAW_STAGES = ("score", "restore", "particles", "sprites", "balls")
+PROFILE_PAGES = (
+    ("update",) + tuple(stage for stage, _ in UPDATE_STAGES),
+    ("draw",) + DRAW_STAGES,
+)
+PROFILE_REFRESH = 30  # Frames between updates of the timings shown
+COL_PROFILE = 0
+COL_PROFILE_TEXT = 7
 
 
 ###################
@@ -61,228 +125,415 @@ SPEED_AMOUNT = 0.07
 
 
 class Pong:
-    """The class that sets up and runs the game."""
-
-    def __init__(self):
-        """Initiate pyxel, set up initial game variables, and run."""
-
-        pyxel.init(WIDTH, HEIGHT, title="Pong!", display_scale=8, fps=60)
+    """The class that sets up and runs the game.
+
+    The game itself is simulated by engine.GameState - this class feeds it the
+    keyboard, passes its events on (see events.py) and draws it.
+
+    The simulation is stepped tick_rate times a second of real time however
+    often pyxel calls update and draw (render_fps times a second, or less on a
+    slow machine), and moving objects are drawn part of the way between their
+    last two positions to keep them smooth."""
+
+    def __init__(
+        self,
+        tick_rate=TICK_RATE,
+        render_fps=RENDER_FPS,
+        balls=1,
+        record_to=None,
+        online=None,
+        cpu=None,
+        profile_to=None,
+        capture_to=None,
+        telemetry_to=None,
+        governed=True,
+    ):
+        """Initiate pyxel, set up initial game variables, and run.
+
+        With more than one ball the game is played in multi-ball mode. If
+        record_to is a directory, a recording of each match is saved there.
+
+        To play online, online is (side, seed, local port, (peer host, peer
+        port), input delay), and both players need the same seed.
+
+        For the computer to play one side, cpu is (side, difficulty).
+
+        If profile_to is a filename, each part of every frame is timed and the
+        times saved there on quitting. If capture_to is a filename, every frame
+        drawn is captured to it (see capture.py). If telemetry_to is a
+        filename, what happens in each match is counted and added to it now
+        and then (see telemetry.py).
+
+        Unless governed is False, sparkles and drawing are cut back while
+        frames take too long (see governor.py)."""
+
+        if record_to and balls > 1:
+            raise ValueError("Multi-ball matches can't be recorded.")
+        if online and (balls > 1 or record_to):
+            raise ValueError("Online matches are single ball, and can't be recorded.")
+        if cpu and (balls > 1 or online):
+            raise ValueError("The computer only plays single ball, offline matches.")
+        if online and telemetry_to:
+            raise ValueError("Online matches can't be counted, as rollbacks replay frames.")
+
+        pyxel.init(WIDTH, HEIGHT, title="Pong!", display_scale=8, fps=render_fps)
+        self.balls = balls
+        self.record_to = record_to
+        self.recorder = None
+        self.saved_state = None
+        self.online = online
+        self.session = None
+        self.cpu = cpu
+        self.cpu_player = None
+        if online:
+            _, _, port, peer, _ = online
+            self.transport = UdpTransport(port, peer)
+        screen = np.ctypeslib.as_array(pyxel.screen.data_ptr())
+        self.pixels = screen.reshape(HEIGHT, WIDTH)
+        self.renderer = Renderer(WIDTH, HEIGHT, self.pixels)
+        self.tick_length = 1 / tick_rate
         self.music = Music()
+        self.bus = EventBus(
+            [self.music.play_events, self.sparkle_events, self.save_finished]
+        )
+        self.capture = None
+        if capture_to:
+            palette = pyxel.colors.to_list()
+            self.capture = Capture(capture_to, WIDTH, HEIGHT, render_fps, palette)
+        self.telemetry = None
+        self.telemetry_writer = None
+        if telemetry_to:
+            self.telemetry = Telemetry()
+            self.telemetry_writer = TelemetryWriter(self.telemetry, telemetry_to)
+            self.bus.subscribe(self.telemetry.count_events)
+        self.profile_to = profile_to
+        self.profiler = None
+        if profile_to:
+            self.start_profiling()
+        self.detail = DETAIL_LEVELS[0]
         self.reset_game()
-        pyxel.run(self.update, self.draw)
+
+        update, draw = self.update, self.draw
+        if self.profiler:
+            update = self.profiler.timed("update", self.update)
+            draw = self.draw_profiled
+        if governed:
+            governor = FrameGovernor(1 / render_fps, self.set_detail)
+            update, draw = governor.wrap(update, draw)
+        pyxel.run(update, draw)
 
     def reset_game(self):
         """Reset score and position."""
 
-        self.l_score = 0
-        self.r_score = 0
-        self.finish = False
+        self.save_recording()
+        seed = random.randrange(2**32)
+        if self.online:
+            side, seed, _, _, input_delay = self.online
+            self.state = GameState(seed=seed)
+            self.session = RollbackSession(
+                self.state, side, self.transport, input_delay=input_delay
+            )
+        elif self.balls > 1:
+            self.state = MultiBallState(
+                self.balls, seed=seed, win_condition=WIN_CONDITION * self.balls
+            )
+        else:
+            self.state = GameState(seed=seed)
+            if self.record_to:
+                self.recorder = Recorder(self.state)
+            if self.cpu:
+                side, difficulty = self.cpu
+                self.cpu_player = PaddleAI.with_difficulty(
+                    self.state.paddle(side),
+                    self.state.ball,
+                    difficulty,
+                    Random(f"{seed}/cpu"),
+                )
+        self.accumulator = 0.0
+        self.last_time = time.perf_counter()
+        self.remember_positions()
+        self.renderer.invalidate()
         self.music.start_music()
-
-        self.l_paddle = Paddle(
-            coordinates=(PADDLE_SIDE, (HEIGHT - PADDLE_HEIGHT) // 2),
-            colour=COL_PADDLE,
-            width=PADDLE_WIDTH,
-            height=PADDLE_HEIGHT,
-            control_up=pyxel.KEY_W,
-            control_down=pyxel.KEY_S,
-            move_speed=PADDLE_MOVE_SPEED,
-            dimensions=DIMENSIONS,
-        )
-
-        self.r_paddle = Paddle(
-            coordinates=(
-                WIDTH - PADDLE_SIDE - PADDLE_WIDTH,
-                (HEIGHT - PADDLE_HEIGHT) // 2,
-            ),
-            colour=COL_PADDLE,
-            width=PADDLE_WIDTH,
-            height=PADDLE_HEIGHT,
-            control_up=pyxel.KEY_UP,
-            control_down=pyxel.KEY_DOWN,
-            move_speed=PADDLE_MOVE_SPEED,
-            dimensions=DIMENSIONS,
-        )
-
-        self.ball = Ball(
-            coordinates=(WIDTH // 2, HEIGHT // 2),
-            colour=COL_BALL,
-            width=BALL_SIDE,
-            height=BALL_SIDE,
-            initial_velocity=BALL_INITIAL_VELOCITY,
-            dimensions=DIMENSIONS,
-        )
-
-        self.sparkler = ParticleEmitter(self.ball)
-
-        pickup_types = {
-            "sparkle": PickupType(14, self.sparkler.turn_on, self.sparkler.turn_off),
-            "expand": PickupType(12, self.expand_paddle, self.contract_paddle),
-            "slow": PickupType(8, self.slow_paddle, self.speed_paddle),
-            "bounce": PickupType(11, self.ball.bounce_on, self.ball.bounce_off),
-            "giantball": PickupType(10, self.ball.giant_on, self.ball.giant_off),
-        }
-        self.expand_stack = []
-        self.speed_stack = []
-        pickup_side_buffer = PADDLE_WIDTH + PADDLE_SIDE + 2
-        self.pickups = Pickups(
-            pickup_types, self.music, pickup_side_buffer, WIDTH - pickup_side_buffer, 0, HEIGHT
-        )
-
-        self.reset_after_score()
-
-    def reset_after_score(self):
-        """Reset paddles and ball."""
-        self.start = pyxel.frame_count + 50
-        self.speed_up = self.start + SPEED_PERIOD
-        self.ball.reset()
+        self.state.sparkler.interval = self.detail.sparkle_interval
+        if self.profiler:
+            self.profiler.instrument_state(self.state)
+            self.profiler.instrument(self.state.sparkler, "particles", "draw")
+            self.profiler.instrument(self.state.ball, "balls", "draw")
 
     ##############
     # Game logic #
     ##############
 
     def update(self):
-        """Update logic of game. Updates the paddles, ball, and checks for scoring/win condition."""
-
-        self.l_paddle.update()
-        self.r_paddle.update()
-        self.sparkler.sparkle()
-
-        if pyxel.frame_count > self.start and not self.finish:
-            outcome = self.ball.update()
-            if outcome:
-                self.score(outcome)
-            self.check_speed()
-            if self.ball.check_collision([self.l_paddle, self.r_paddle]):
-                self.music.sfx_hit()
-            self.pickups.check_pickup()
-            self.pickups.check_collision(self.ball)
+        """Read the controls, advance the game by the ticks due since the last
+        update and hand their events to the sinks."""
+
+        inputs = 0
+        for key, flag in ONLINE_CONTROLS if self.session else CONTROLS:
+            if pyxel.btn(key):
+                inputs |= flag
+
+        now = time.perf_counter()
+        self.accumulator += now - self.last_time
+        self.last_time = now
+
+        ticks = 0
+        while self.accumulator >= self.tick_length:
+            if ticks == MAX_TICKS_PER_UPDATE:
+                self.accumulator = 0.0
+                break
+            self.remember_positions()
+            if self.cpu_player:
+                inputs = self.cpu_inputs(inputs)
+            if self.session:
+                if not self.session.advance(inputs):
+                    self.accumulator = 0.0  # Wait for the other player
+                    break
+            elif self.recorder:
+                self.recorder.step(inputs)
+            else:
+                self.state.step(inputs)
+            if EVENT_SCORE in self.state.events:
+                self.remember_positions()  # Don't slide the ball back to the middle
+            self.bus.collect(self.state.events)
+            self.accumulator -= self.tick_length
+            ticks += 1
+        self.bus.dispatch()
+        self.music.follow_speed(np.max(np.abs(self.state.ball.x_vol)))
 
         if pyxel.btn(pyxel.KEY_Q):
+            self.save_recording()
+            if self.profiler:
+                self.profiler.save(self.profile_to)
+            if self.capture:
+                self.capture.close()
+            if self.telemetry_writer:
+                self.telemetry_writer.close()
             pyxel.quit()
 
-        if pyxel.btnp(pyxel.KEY_R):
-            self.reset_game()
-
-    def check_speed(self):
-        """Adds velocity to the ball periodically."""
-
-        if pyxel.frame_count > self.speed_up:
-            self.speed_up += SPEED_PERIOD
-            self.ball.x_vol += SPEED_AMOUNT * sign(self.ball.x_vol)
-            self.ball.y_vol += SPEED_AMOUNT * sign(self.ball.y_vol)
-
-    def score(self, outcome):
-        """Adds to the score if the ball hits the side. Check win condition."""
-
-        self.music.sfx_score()
-        if outcome == "l":
-            self.l_score += 1
-        elif outcome == "r":
-            self.r_score += 1
-
-        if self.l_score >= WIN_CONDITION or self.r_score >= WIN_CONDITION:
-            self.win_event()
-
-        self.reset_after_score()
+        if self.profiler and pyxel.btnp(pyxel.KEY_F3):
+            self.next_profile_page()
 
-    def win_event(self):
-        """What happens when someone wins the game!"""
+        if self.session:
+            return  # Restarting or loading would leave the other player behind
 
-        self.finish = True
-        self.music.stop_music()
-        self.music.sfx_finish()
+        if pyxel.btnp(pyxel.KEY_R):
+            self.reset_game()
 
-    ######################
-    # Pickup controllers #
-    ######################
+        if pyxel.btnp(pyxel.KEY_F5):
+            self.saved_state = self.save_state()
+        if pyxel.btnp(pyxel.KEY_F9) and self.saved_state:
+            self.load_state(self.saved_state)
 
-    def expand_paddle(self):
-        """Expand the pandle temporarily."""
+    def cpu_inputs(self, inputs):
+        """Replace the computer's side of the inputs with its controls."""
 
-        if self.ball.x_vol > 0:
-            paddle = self.l_paddle
+        side, _ = self.cpu
+        if side == "l":
+            up_flag, down_flag = INPUT_L_UP, INPUT_L_DOWN
         else:
-            paddle = self.r_paddle
-
-        paddle.height = PADDLE_HEIGHT_EXPANDED
-        paddle.y -= (PADDLE_HEIGHT_EXPANDED - PADDLE_HEIGHT) // 2
-        self.expand_stack.append(paddle)
-
-    def contract_paddle(self):
-        """Revert paddle side to normal."""
+            up_flag, down_flag = INPUT_R_UP, INPUT_R_DOWN
+        up, down = self.cpu_player.controls()
+        inputs &= ~(up_flag | down_flag)
+        if up:
+            inputs |= up_flag
+        elif down:
+            inputs |= down_flag
+        return inputs
+
+    def save_state(self):
+        """Return a snapshot of the game as it is now, for load_state."""
+
+        return self.state.save_state()
+
+    def load_state(self, data):
+        """Put the game back to a snapshot from save_state.
+
+        The match is no longer the one being recorded, so recording stops."""
+
+        was_finished = self.state.finish
+        self.state.load_state(data)
+        self.recorder = None
+        self.remember_positions()
+        self.renderer.invalidate()
+        if was_finished and not self.state.finish:
+            self.music.start_music()
+        elif self.state.finish and not was_finished:
+            self.music.stop_music()
+
+    def save_recording(self):
+        """Save the recording of the current match, if it is being recorded."""
+
+        if not self.recorder:
+            return
+        recording = self.recorder.finish()
+        self.recorder = None
+        filename = "{}-{}{}".format(
+            time.strftime("%Y%m%d-%H%M%S"), recording.seed, RECORDING_EXTENSION
+        )
+        os.makedirs(self.record_to, exist_ok=True)
+        recording.save(os.path.join(self.record_to, filename))
 
-        paddle = self.expand_stack.pop(0)
-        if paddle not in self.expand_stack:
-            paddle.height = PADDLE_HEIGHT
-            paddle.y += (PADDLE_HEIGHT_EXPANDED - PADDLE_HEIGHT) // 2
+    def remember_positions(self):
+        """Keep the current positions of the moving objects to draw from."""
 
-    def slow_paddle(self):
-        """Slow the pandle temporarily."""
+        state = self.state
+        self.previous = (state.ball.x, state.ball.y, state.l_paddle.y, state.r_paddle.y)
 
-        if self.ball.x_vol > 0:
-            paddle = self.l_paddle
-        else:
-            paddle = self.r_paddle
+    def sparkle_events(self, events):
+        """Sparkle the ball of the current match for a frame's events."""
 
-        paddle.move_speed = PADDLE_MOVE_SPEED_SLOW
-        paddle.colour = COL_PADDLE_SLOW
-        self.speed_stack.append(paddle)
+        self.state.sparkler.sparkle_events(events)
 
-    def speed_paddle(self):
-        """Speed the paddle back up to normal speed."""
+    def save_finished(self, events):
+        """Save the recording of a match as soon as it finishes."""
 
-        paddle = self.speed_stack.pop(0)
-        if paddle not in self.speed_stack:
-            paddle.move_speed = PADDLE_MOVE_SPEED
-            paddle.colour = COL_PADDLE
+        if EVENT_FINISH in events:
+            self.save_recording()
 
     ##############
     # Draw logic #
     ##############
 
-    def draw(self):
-        """Draw the paddles and ball OR the end screen."""
+    def set_detail(self, detail):
+        """Change how much optional work to do, to a governor.Detail."""
 
-        if self.finish:
-            self.draw_end_screen()
+        self.detail = detail
+        self.state.sparkler.interval = detail.sparkle_interval
+
+    def draw(self):
+        """Draw the paddles and ball OR the end screen, capturing it if asked.
+
+        When the governor says to draw only every few frames, the screen is
+        left as it is on the frames between."""
+
+        if pyxel.frame_count % self.detail.render_every == 0:
+            if self.state.finish:
+                self.draw_end_screen()
+            else:
+                self.draw_board()
+        if self.capture:
+            self.capture.add(self.pixels)
+
+    def draw_board(self):
+        """Draw the paddles and ball.
+
+        Only what has changed since the last frame is drawn (see renderer.py)."""
+
+        state = self.state
+        # How far between the last two ticks we are
+        alpha = min(self.accumulator / self.tick_length, 1)
+        ball_x, ball_y, l_paddle_y, r_paddle_y = self.previous
+
+        scores = (state.l_score, state.r_score)
+        self.renderer.set_background(scores, self.draw_background)
+        sprites = [
+            self.sprite(key, paddle, paddle.x, lerp(previous_y, paddle.y, alpha))
+            for key, paddle, previous_y in (
+                ("l_paddle", state.l_paddle, l_paddle_y),
+                ("r_paddle", state.r_paddle, r_paddle_y),
+            )
+        ]
+        for pickup in state.pickups.pickups:
+            colour = state.pickups.pickup_types[pickup.pickup_type].colour
+            sprites.append(
+                (id(pickup), pickup.x, pickup.y, pickup.width, pickup.height, colour)
+            )
+        if self.balls > 1:
+            self.renderer.invalidate()  # The balls are everywhere
         else:
-            pyxel.cls(COL_BACKGROUND)
-            self.sparkler.display()
-            self.l_paddle.display()
-            self.r_paddle.display()
-            self.pickups.display()
-            self.ball.display()
-            self.draw_score()
+            sprites.append(
+                self.sprite(
+                    "ball",
+                    state.ball,
+                    lerp(ball_x, state.ball.x, alpha),
+                    lerp(ball_y, state.ball.y, alpha),
+                )
+            )
+
+        sparkler = state.sparkler if self.detail.draw_sparkles else None
+        self.renderer.draw(sprites, sparkler, state.frame_count)
+        if self.balls > 1:
+            state.ball.draw(self.pixels)
+
+    @staticmethod
+    def sprite(key, obj, x, y):
+        """A paddle or ball to draw at the given position rather than its own."""
 
-    def draw_score(self):
-        """Draw the score at the top."""
+        return key, x, y, obj.width, obj.height, obj.colour
 
-        l_score = "{:01}".format(self.l_score)
-        r_score = "{:01}".format(self.r_score)
+    def draw_background(self, image, top):
+        """Draw the background with the score at the top onto an image."""
+
+        image.rect(0, top, WIDTH, HEIGHT, COL_BACKGROUND)
 
         buffer = PADDLE_SIDE + PADDLE_WIDTH + 2
         r_x_position = WIDTH - pyxel.FONT_WIDTH - buffer
 
-        pyxel.text(x=buffer, y=2, s=l_score, col=COL_SCORE)
-        pyxel.text(x=r_x_position, y=2, s=r_score, col=COL_SCORE)
+        image.text(buffer, top + 2, str(self.state.l_score), COL_SCORE)
+        image.text(r_x_position, top + 2, str(self.state.r_score), COL_SCORE)
 
     def draw_end_screen(self):
         """Draw the final screen with the winner!"""
 
-        pyxel.cls(col=COL_FINISH)
-
-        display_text = TEXT_FINISH[:]
-
-        if self.l_score >= WIN_CONDITION:
+        if self.state.l_score > self.state.r_score:
             winner = "The LEFT player!"
         else:
             winner = "The RIGHT player!"
+        self.renderer.show_end_screen(
+            winner, lambda image, top: self.draw_end_layer(image, top, winner)
+        )
+
+    def draw_end_layer(self, image, top, winner):
+        """Draw the final screen onto an image."""
+
+        image.rect(0, top, WIDTH, HEIGHT, COL_FINISH)
+
+        display_text = TEXT_FINISH[:]
         display_text.insert(1, winner)
         for i, text in enumerate(display_text):
             y_offset = (pyxel.FONT_HEIGHT + 2) * i
             text_x = self.center_text(text, WIDTH)
-            pyxel.text(text_x, HEIGHT_FINISH + y_offset, text, COL_FINISH_TEXT)
+            image.text(text_x, top + HEIGHT_FINISH + y_offset, text, COL_FINISH_TEXT)
+
+    #############
+    # Profiling #
+    #############
+
+    def start_profiling(self):
+        """Time the parts of the game which last from one match to the next.
+
+        The parts of each match are timed as it is set up, in reset_game."""
+
+        self.profiler = Profiler([stage for page in PROFILE_PAGES for stage in page])
+        renderer = self.renderer
+        self.profiler.instrument(renderer, "score", "set_background", "show_end_screen")
+        self.profiler.instrument(renderer, "restore", "restore")
+        self.profiler.instrument(renderer, "sprites", "draw_sprite")
+        self.timed_draw = self.profiler.timed("draw", self.draw)
+        self.profile_page = 0
+        self.profile_lines = None
+
+    def next_profile_page(self):
+        """Show the next page of timings, or none after the last."""
+
+        self.profile_page = (self.profile_page + 1) % (len(PROFILE_PAGES) + 1)
+        self.profile_lines = None
+        self.renderer.invalidate()  # Uncover what the timings were over
+
+    def draw_profiled(self):
+        """Draw the frame, timing it, then the timings over the top."""
+
+        self.timed_draw()
+        if self.profile_page < len(PROFILE_PAGES):
+            profiler = self.profiler
+            if self.profile_lines is None or profiler.frame % PROFILE_REFRESH == 0:
+                self.profile_lines = profiler.table(PROFILE_PAGES[self.profile_page])
+            height = len(self.profile_lines) * pyxel.FONT_HEIGHT + 1
+            pyxel.rect(0, 0, WIDTH, height, COL_PROFILE)
+            for i, line in enumerate(self.profile_lines):
+                pyxel.text(0, 1 + i * pyxel.FONT_HEIGHT, line, COL_PROFILE_TEXT)
+        self.profiler.end_frame()
 
     @staticmethod
     def center_text(text, page_width, char_width=pyxel.FONT_WIDTH):
@@ -293,4 +544,72 @@ class Pong:
 
 
 if __name__ == "__main__":
-    Pong()
+    parser = argparse.ArgumentParser(description="The classic game of pong.")
+    parser.add_argument(
+        "--balls", type=int, default=1, help="number of balls, for multi-ball mode"
+    )
+    parser.add_argument(
+        "--record", metavar="DIRECTORY", help="save a recording of each match here"
+    )
+    parser.add_argument(
+        "--online", choices=("l", "r"), help="play online, on this side of the board"
+    )
+    parser.add_argument(
+        "--peer", metavar="HOST:PORT", help="the other player, when playing online"
+    )
+    parser.add_argument(
+        "--port", type=int, default=NETPLAY_PORT, help="port to play online from"
+    )
+    parser.add_argument(
+        "--seed", type=int, default=0, help="match seed, the same for both players"
+    )
+    parser.add_argument(
+        "--input-delay",
+        type=int,
+        default=INPUT_DELAY,
+        help="frames to delay your own controls by, to save rollbacks",
+    )
+    parser.add_argument(
+        "--cpu", choices=("l", "r"), help="have the computer play this side"
+    )
+    parser.add_argument(
+        "--difficulty",
+        choices=list(DIFFICULTIES),
+        default="medium",
+        help="how well the computer plays",
+    )
+    parser.add_argument(
+        "--profile", metavar="CSV", help="time each part of every frame, saved here"
+    )
+    parser.add_argument(
+        "--full-detail",
+        action="store_true",
+        help="never cut back sparkles or drawing when frames take too long",
+    )
+    parser.add_argument(
+        "--capture", metavar="FILE", help="capture the game to this file, as it's drawn"
+    )
+    parser.add_argument(
+        "--telemetry",
+        metavar="FILE",
+        help="count what happens in every match, adding it to this file",
+    )
+    args = parser.parse_args()
+
+    online = None
+    if args.online:
+        if not args.peer:
+            parser.error("--online needs --peer")
+        host, _, port = args.peer.rpartition(":")
+        online = (args.online, args.seed, args.port, (host, int(port)), args.input_delay)
+    cpu = (args.cpu, args.difficulty) if args.cpu else None
+    Pong(
+        balls=args.balls,
+        record_to=args.record,
+        online=online,
+        cpu=cpu,
+        profile_to=args.profile,
+        capture_to=args.capture,
+        telemetry_to=args.telemetry,
+        governed=not args.full_detail,
+    )
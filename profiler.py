@@ -0,0 +1,180 @@
+"""Timing each stage of a frame.
+
+A Profiler times how long each stage of the game (moving the paddles, the
+sparkles, the ball, collisions, pickups, drawing...) takes each frame with
+perf_counter_ns, and keeps the last PROFILE_FRAMES frames in a preallocated
+ring buffer, so that slow frames can be pinned on whichever part of the game
+caused them.
+
+Stages are timed by wrapping the methods which make them up on the objects
+themselves (see Profiler.instrument), so nothing changes and nothing is
+slower when the game isn't being profiled. The time of a stage in a frame is
+the total over every call to its methods that frame, so a frame which runs
+three ticks counts all three.
+
+    python3 pong.py --profile times.csv
+
+shows the median and 99th percentile time of each stage (in microseconds)
+over the game, with F3 to flip between them and hide them, and saves every
+frame's times to times.csv on quitting (with Q).
+
+    python3 profiler.py
+
+profiles headless matches and prints the same table.
+
+Requires numpy.
+"""
+
+from random import Random
+from time import perf_counter_ns
+import numpy as np
+
+from engine import GameState
+from batch import tracking_inputs
+
+PROFILE_FRAMES = 600  # Frames kept in the ring buffer
+PERCENTILES = (50, 99)
+
+# Stages of the game's update, and the methods of GameState's parts they are
+# made up of, as (stage, [(attribute, [method names])])
+UPDATE_STAGES = (
+    (
+        "paddles",
+        [("l_paddle", ["update"]), ("r_paddle", ["update"]), ("paddles", ["move"])],
+    ),
+    ("sparkle", [("sparkler", ["sparkle", "move"])]),
+    ("ball", [("ball", ["update", "sweep"])]),
+    ("speed", [("", ["check_speed"])]),
+    ("collide", [("ball", ["check_collision"])]),
+    (
+        "pickups",
+        [
+            ("pickups", ["check_pickup", "check_collision", "check_sweep"]),
+            ("ball", ["check_pickups"]),
+        ],
+    ),
+)
+
+
+class Profiler:
+    """Times the named stages of each frame, keeping the last few hundred."""
+
+    def __init__(self, stages, frames=PROFILE_FRAMES):
+        """Set up the ring buffer for the given stage names."""
+
+        self.stages = list(stages)
+        self.index = {stage: i for i, stage in enumerate(self.stages)}
+        self.samples = np.zeros((frames, len(self.stages)), dtype=np.int64)
+        self.totals = [0] * len(self.stages)  # This frame's times so far
+        self.zeros = [0] * len(self.stages)
+        self.frame = 0
+
+    def timed(self, stage, function):
+        """Return function, adding the time each call takes to the stage."""
+
+        totals = self.totals
+        index = self.index[stage]
+
+        def timed_function(*args, **kwargs):
+            start = perf_counter_ns()
+            result = function(*args, **kwargs)
+            totals[index] += perf_counter_ns() - start
+            return result
+
+        return timed_function
+
+    def instrument(self, obj, stage, *names):
+        """Time the named methods of obj (those it has) as part of the stage."""
+
+        for name in names:
+            method = getattr(obj, name, None)
+            if method is not None:
+                setattr(obj, name, self.timed(stage, method))
+
+    def instrument_state(self, state):
+        """Time the UPDATE_STAGES of a GameState (or MultiBallState)."""
+
+        for stage, parts in UPDATE_STAGES:
+            for attribute, names in parts:
+                obj = getattr(state, attribute) if attribute else state
+                self.instrument(obj, stage, *names)
+
+    def end_frame(self):
+        """Store this frame's times and start on the next."""
+
+        self.samples[self.frame % len(self.samples)] = self.totals
+        self.totals[:] = self.zeros
+        self.frame += 1
+
+    ###########
+    # Results #
+    ###########
+
+    def recorded(self):
+        """Return the frame numbers and times of the frames kept, oldest first."""
+
+        capacity = len(self.samples)
+        frames = np.arange(max(self.frame - capacity, 0), self.frame)
+        return frames, self.samples[frames % capacity]
+
+    def percentiles(self):
+        """Return an array of the PERCENTILES of each stage, in nanoseconds."""
+
+        _, samples = self.recorded()
+        if not len(samples):
+            return np.zeros((len(PERCENTILES), len(self.stages)))
+        return np.percentile(samples, PERCENTILES, axis=0)
+
+    def table(self, stages=None):
+        """Return lines of text giving the percentiles of the stages (all of
+        them by default), in microseconds."""
+
+        percentiles = self.percentiles() / 1000
+        row = "{:<8}" + "{:>6}" * len(PERCENTILES)
+        lines = [row.format("us", *(f"p{p}" for p in PERCENTILES))]
+        for stage in stages or self.stages:
+            values = percentiles[:, self.index[stage]]
+            lines.append(row.format(stage, *(round(value) for value in values)))
+        return lines
+
+    def save(self, filename):
+        """Save the times of the frames kept to a CSV file, in nanoseconds."""
+
+        frames, samples = self.recorded()
+        np.savetxt(
+            filename,
+            np.column_stack((frames, samples)),
+            fmt="%d",
+            delimiter=",",
+            header=",".join(["frame"] + self.stages),
+            comments="",
+        )
+
+
+def profile_matches(matches=20, seed=0):
+    """Profile headless matches between paddles which follow the ball.
+
+    Returns the Profiler."""
+
+    profiler = Profiler(["step"] + [stage for stage, _ in UPDATE_STAGES])
+    rng = Random(seed)
+    for _ in range(matches):
+        state = GameState(seed=rng.getrandbits(64))
+        profiler.instrument_state(state)
+        profiler.instrument(state, "step", "step")
+        while not state.finish:
+            inputs = tracking_inputs(
+                state.ball.y,
+                state.l_paddle.y,
+                state.l_paddle.height,
+                state.r_paddle.y,
+                state.r_paddle.height,
+            )
+            state.step(int(inputs))
+            state.sparkler.sparkle_events(state.events)
+            profiler.end_frame()
+    return profiler
+
+
+if __name__ == "__main__":
+    print("\n".join(profile_matches().table()))
@@ -0,0 +1,134 @@
+"""Drawing the game without redrawing what hasn't changed.
+
+Pyxel keeps the screen from one frame to the next, so there is no need to
+clear it and draw everything again every frame. Renderer keeps the parts of
+the screen which rarely change (the background with the score, and the end
+screen) as layers in an image bank, drawn only when they change. Each frame
+it works out which rectangles of the screen have changed - where the moving
+objects were and now are, and the area covered by sparkles - puts the
+background layer back over just those, and redraws only the objects touching
+them.
+
+The layers sit one above the other in the image bank, so a board can be up to
+256 pixels wide and 128 high.
+"""
+
+from math import floor, ceil
+import pyxel
+from utilities import is_overlap, Rect
+
+RENDER_BANK = 2  # The image bank the layers are kept in
+
+
+class Renderer:
+    """Draws frames, only redrawing the rectangles which have changed."""
+
+    def __init__(self, width, height, pixels, bank=RENDER_BANK):
+        """Set up for a board of the given size, with pixels a 2d array of the screen."""
+        self.width = width
+        self.height = height
+        self.pixels = pixels
+        self.bank = bank
+        self.image = pyxel.image(bank)
+
+        self.layer_key = None  # What the background layer shows
+        self.end_key = None  # What the end screen layer shows
+        self.drawn = {}  # Sprite key -> (rectangle covered, how it was drawn)
+        self.particle_bounds = None
+        self.full = True  # Whether the whole screen needs drawing
+        self.showing_end = False
+
+    def invalidate(self):
+        """Draw the whole screen again next frame."""
+        self.full = True
+        self.showing_end = False
+
+    def cover(self, x, y, width, height):
+        """The whole pixels a rectangle drawn at a fractional position can touch."""
+        left = floor(x)
+        top = floor(y)
+        return Rect(left, top, ceil(x + width) - left + 1, ceil(y + height) - top + 1)
+
+    @staticmethod
+    def draw_sprite(x, y, width, height, colour):
+        """Draw a sprite onto the screen."""
+        pyxel.rect(x, y, width, height, colour)
+
+    def restore(self, rect):
+        """Put the background layer back over a rectangle of the screen."""
+        left = max(rect.x, 0)
+        top = max(rect.y, 0)
+        right = min(rect.x + rect.width, self.width)
+        bottom = min(rect.y + rect.height, self.height)
+        if right > left and bottom > top:
+            pyxel.blt(left, top, self.bank, left, top, right - left, bottom - top)
+
+    ##########
+    # Layers #
+    ##########
+
+    def set_background(self, key, draw):
+        """Make sure the background layer is up to date.
+
+        Key is whatever decides what it looks like (the score), and draw(image,
+        top) draws it onto the image bank with its top edge at top, only when
+        the key changes."""
+        if key != self.layer_key:
+            draw(self.image, 0)
+            self.layer_key = key
+            self.full = True
+
+    def show_end_screen(self, key, draw):
+        """Show the end screen, drawing its layer with draw(image, top) if the
+        key has changed. The screen is only copied when it first appears."""
+        if key != self.end_key:
+            draw(self.image, self.height)
+            self.end_key = key
+            self.showing_end = False
+        if not self.showing_end:
+            pyxel.blt(0, 0, self.bank, 0, self.height, self.width, self.height)
+            self.showing_end = True
+        self.full = True  # Whatever comes next draws over all of it
+
+    ##########
+    # Frames #
+    ##########
+
+    def draw(self, sprites, sparkler, frame_count):
+        """Draw a frame over the background layer.
+
+        Sprites is a list of (key, x, y, width, height, colour) rectangles in
+        drawing order, and the keys say which sprite is which from one frame
+        to the next. The sparkler's particles are drawn under them, unless
+        sparkler is None."""
+
+        new = {
+            key: (self.cover(x, y, width, height), (x, y, width, height, colour))
+            for key, x, y, width, height, colour in sprites
+        }
+        bounds = sparkler.bounds(frame_count) if sparkler else None
+
+        if self.full:
+            dirty = [Rect(0, 0, self.width, self.height)]
+        else:
+            dirty = []
+            for key in self.drawn.keys() | new.keys():
+                old = self.drawn.get(key)
+                now = new.get(key)
+                if old is None or now is None or old[1] != now[1]:
+                    dirty += [drawn[0] for drawn in (old, now) if drawn]
+            dirty += [Rect(*rect) for rect in (self.particle_bounds, bounds) if rect]
+
+        for rect in dirty:
+            self.restore(rect)
+        if bounds:
+            sparkler.draw(self.pixels, frame_count)
+        for cover, (x, y, width, height, colour) in new.values():
+            if self.full or any(is_overlap(cover, rect) for rect in dirty):
+                self.draw_sprite(x, y, width, height, colour)
+                dirty.append(cover)  # So any sprite drawn over it is redrawn too
+
+        self.drawn = new
+        self.particle_bounds = bounds
+        self.full = False
+        self.showing_end = False
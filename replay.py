@@ -0,0 +1,266 @@
+"""Recording and replaying matches.
+
+A match is fully determined by its seed (see engine.GameState) and the
+controls held down each step, so that is all a recording keeps. The controls
+are four bits a step, which hardly ever change from one step to the next, so
+they are stored run-length encoded as (controls, number of steps) pairs.
+
+Alongside these, a recording keeps a hash of the final state of the match.
+Replaying re-runs the match headless as fast as the CPU allows and checks
+the hash still matches, which catches any change to the physics that alters
+the outcome of a recorded match:
+
+    python3 replay.py recordings/*.pongrec
+
+"""
+
+import argparse
+import hashlib
+import struct
+import sys
+import time
+
+from engine import GameState
+
+RECORDING_MAGIC = b"PONGREC1"
+RECORDING_EXTENSION = ".pongrec"
+
+# seed, frames per step, swept, total steps, number of runs, final state hash
+HEADER_FORMAT = "<8sQB?QQ16s"
+
+
+################
+# State hashes #
+################
+
+
+def state_hash(state):
+    """Return a 16 byte hash of everything that matters in a GameState.
+
+    Sparkles and colours are left out, as they don't change the game."""
+
+    ball = state.ball
+    values = [
+        state.frame_count,
+        state.start,
+        state.speed_up,
+        state.l_score,
+        state.r_score,
+        state.finish,
+        ball.x,
+        ball.y,
+        ball.x_vol,
+        ball.y_vol,
+        ball.width,
+        ball.height,
+        ball.bounce_status,
+        state.pickups.next_pickup,
+    ]
+    for paddle in (state.l_paddle, state.r_paddle):
+        values += [paddle.y, paddle.height, paddle.move_speed]
+    for pickup in state.pickups.pickups:
+        values += [pickup.x, pickup.y, pickup.pickup_type]
+    for end_frame, _, condition, token in sorted(state.pickups.active_conditions.heap):
+        values += [end_frame, condition, token]
+
+    # Numbers are hashed by value, so 40 and 40.0 hash the same.
+    digest = hashlib.blake2b(digest_size=16)
+    for value in values:
+        if isinstance(value, (int, float)):
+            digest.update(struct.pack("<d", value))
+        else:
+            digest.update(repr(value).encode())
+        digest.update(b"|")
+    return digest.digest()
+
+
+##############
+# Input logs #
+##############
+
+
+class InputLog:
+    """The controls held down each step of a match, run-length encoded."""
+
+    def __init__(self, runs=None):
+        """Start a log, optionally from a list of [controls, steps] runs."""
+        self.runs = runs if runs is not None else []
+
+    def record(self, inputs):
+        """Add one step's controls to the end of the log."""
+        if self.runs and self.runs[-1][0] == inputs:
+            self.runs[-1][1] += 1
+        else:
+            self.runs.append([inputs, 1])
+
+    def __iter__(self):
+        """Iterate over the controls of every step."""
+        for inputs, steps in self.runs:
+            for _ in range(steps):
+                yield inputs
+
+    def __len__(self):
+        """The number of steps logged."""
+        return sum(steps for _, steps in self.runs)
+
+    def to_bytes(self):
+        """Encode the runs as a controls byte followed by a varint step count."""
+        data = bytearray()
+        for inputs, steps in self.runs:
+            data.append(inputs)
+            while steps >= 0x80:
+                data.append((steps & 0x7F) | 0x80)
+                steps >>= 7
+            data.append(steps)
+        return bytes(data)
+
+    @classmethod
+    def from_bytes(cls, data, run_count):
+        """Decode run_count runs from the start of data, as written by to_bytes."""
+        runs = []
+        position = 0
+        for _ in range(run_count):
+            inputs = data[position]
+            position += 1
+            steps = 0
+            shift = 0
+            while True:
+                byte = data[position]
+                position += 1
+                steps |= (byte & 0x7F) << shift
+                shift += 7
+                if not byte & 0x80:
+                    break
+            runs.append([inputs, steps])
+        return cls(runs)
+
+
+##############
+# Recordings #
+##############
+
+
+class Recording:
+    """Everything needed to replay a match: its seed, how it was stepped,
+    the controls each step, and the hash of its final state."""
+
+    def __init__(self, seed, frames=1, swept=False, inputs=None, final_hash=None):
+        """Set up a recording of a match played with the given seed and step size."""
+        self.seed = seed
+        self.frames = frames
+        self.swept = swept
+        self.inputs = inputs if inputs is not None else InputLog()
+        self.final_hash = final_hash
+
+    def new_state(self):
+        """Return a fresh GameState set up as the recorded match was."""
+        return GameState(seed=self.seed, swept=self.swept)
+
+    def to_bytes(self):
+        """Encode the recording."""
+        header = struct.pack(
+            HEADER_FORMAT,
+            RECORDING_MAGIC,
+            self.seed,
+            self.frames,
+            self.swept,
+            len(self.inputs),
+            len(self.inputs.runs),
+            self.final_hash or bytes(16),
+        )
+        return header + self.inputs.to_bytes()
+
+    @classmethod
+    def from_bytes(cls, data):
+        """Decode a recording written by to_bytes."""
+        header_size = struct.calcsize(HEADER_FORMAT)
+        magic, seed, frames, swept, steps, run_count, final_hash = struct.unpack(
+            HEADER_FORMAT, data[:header_size]
+        )
+        if magic != RECORDING_MAGIC:
+            raise ValueError("Not a pong recording.")
+        inputs = InputLog.from_bytes(data[header_size:], run_count)
+        if len(inputs) != steps:
+            raise ValueError("Recording is corrupt: the input log is the wrong length.")
+        return cls(seed, frames, swept, inputs, final_hash)
+
+    def save(self, filename):
+        """Write the recording to a file."""
+        with open(filename, "wb") as file:
+            file.write(self.to_bytes())
+
+    @classmethod
+    def load(cls, filename):
+        """Read a recording from a file."""
+        with open(filename, "rb") as file:
+            return cls.from_bytes(file.read())
+
+
+class Recorder:
+    """Steps a GameState while recording its controls.
+
+    Use recorder.step in place of state.step, then finish() to get the
+    recording once the match is over."""
+
+    def __init__(self, state, frames=1):
+        """Record the given state, which needs to have been given a seed."""
+        if state.seed is None:
+            raise ValueError("Only a seeded match can be recorded.")
+        self.state = state
+        self.recording = Recording(state.seed, frames, state.swept)
+
+    def step(self, inputs=0):
+        """Step the state, recording the controls."""
+        self.recording.inputs.record(inputs)
+        self.state.step(inputs, self.recording.frames)
+
+    def finish(self):
+        """Return the recording, with the hash of the state as it is now."""
+        self.recording.final_hash = state_hash(self.state)
+        return self.recording
+
+
+def replay(recording):
+    """Play a recording back headless and return the final state."""
+
+    state = recording.new_state()
+    frames = recording.frames
+    for inputs, steps in recording.inputs.runs:
+        for _ in range(steps):
+            state.step(inputs, frames)
+    return state
+
+
+def verify(recording):
+    """Replay a recording and return whether it ends in the recorded state."""
+
+    return state_hash(replay(recording)) == recording.final_hash
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Replay recorded matches and check they still end the same way."
+    )
+    parser.add_argument("recordings", nargs="+", help="recording files")
+    args = parser.parse_args()
+
+    failures = 0
+    total_frames = 0
+    begin = time.perf_counter()
+    for filename in args.recordings:
+        recording = Recording.load(filename)
+        state = replay(recording)
+        total_frames += state.frame_count
+        if state_hash(state) != recording.final_hash:
+            failures += 1
+            print("MISMATCH", filename)
+    elapsed = time.perf_counter() - begin
+
+    print(
+        "{} of {} recordings replayed identically, at {:,.0f} frames/sec.".format(
+            len(args.recordings) - failures,
+            len(args.recordings),
+            total_frames / elapsed if elapsed else 0,
+        )
+    )
+    sys.exit(1 if failures else 0)
@@ -0,0 +1,418 @@
+"""A headless server hosting many matches of pong at once.
+
+Every match is a slot in one batch.BatchGame, so a single step advances all
+of them, and they all tick together on one asyncio loop. Players and
+spectators connect over TCP and choose a match to play in or watch.
+
+After each tick the server sends each match's viewers only what changed:
+ball, paddles, scores and the finish flag are compared for every match in one
+go as a (matches x fields) array, and a frame carries a bit mask of the
+changed fields followed by just their values. The pickups are sent as a whole
+list, but only on ticks where they change. Anyone joining gets a full frame
+first.
+
+    python3 server.py --matches 500 --port 7001
+
+MatchClient is a simple client, and check_clients uses it to connect players
+and spectators to a local server and check the spectators see the same
+matches as the server:
+
+    python3 server.py --check
+
+Requires numpy.
+"""
+
+import argparse
+import asyncio
+from random import Random
+import struct
+import time
+import numpy as np
+
+from batch import BatchGame, LEFT, RIGHT
+from netplay import CONTROL_UP, CONTROL_DOWN
+
+#############
+# Constants #
+#############
+
+MATCH_COUNT = 256
+TICK_RATE = 60
+MAX_TICKS_BEHIND = 8  # When further behind than this, slow down rather than catch up
+RESTART_DELAY = 180  # Ticks a finished match shows its result before restarting
+SERVER_PORT = 7001
+MAX_WRITE_BUFFER = 64 * 1024  # Clients further behind than this are dropped
+
+# Client messages: kind, match, value
+MESSAGE_FORMAT = struct.Struct("<BIB")
+MESSAGE_PLAY = 1  # Value is the side, LEFT or RIGHT
+MESSAGE_WATCH = 2
+MESSAGE_CONTROLS = 3  # Value is netplay.CONTROL_* flags
+
+# Server frames: length, then frame number and changed field mask, then a
+# float32 for each changed field, then the pickups if they changed.
+LENGTH_FORMAT = struct.Struct("<H")
+FRAME_FORMAT = struct.Struct("<IH")
+PICKUP_FORMAT = struct.Struct("<BBB")  # x, y, type
+
+FRAME_FIELDS = (
+    "ball_x",
+    "ball_y",
+    "ball_width",
+    "ball_height",
+    "l_y",
+    "r_y",
+    "l_height",
+    "r_height",
+    "l_score",
+    "r_score",
+    "finish",
+)
+PICKUPS_CHANGED = 1 << len(FRAME_FIELDS)
+FULL_FRAME = PICKUPS_CHANGED | (PICKUPS_CHANGED - 1)
+
+
+##################
+# Frame encoding #
+##################
+
+
+def encode_frame(frame, mask, values, pickups=()):
+    """Encode a frame: values are the float32 values of the fields in the
+    mask, in order, and pickups is a list of (x, y, type)."""
+
+    data = FRAME_FORMAT.pack(frame, mask) + values.tobytes()
+    if mask & PICKUPS_CHANGED:
+        data += bytes([len(pickups)])
+        data += b"".join(PICKUP_FORMAT.pack(*pickup) for pickup in pickups)
+    return LENGTH_FORMAT.pack(len(data)) + data
+
+
+def decode_frame(data, fields, pickups):
+    """Apply a frame (without its length) to a dict of fields and a list of
+    pickups, and return the frame number."""
+
+    frame, mask = FRAME_FORMAT.unpack_from(data)
+    position = FRAME_FORMAT.size
+    for k, name in enumerate(FRAME_FIELDS):
+        if mask & (1 << k):
+            (fields[name],) = struct.unpack_from("<f", data, position)
+            position += 4
+    if mask & PICKUPS_CHANGED:
+        count = data[position]
+        position += 1
+        pickups[:] = [
+            PICKUP_FORMAT.unpack_from(data, position + i * PICKUP_FORMAT.size)
+            for i in range(count)
+        ]
+    return frame
+
+
+##########
+# Server #
+##########
+
+
+class MatchServer:
+    """Runs a batch of matches and streams them to their players and spectators."""
+
+    def __init__(self, matches=MATCH_COUNT, tick_rate=TICK_RATE, seeds=None):
+        """Set up the matches, which start ticking once run or serve is called."""
+
+        self.batch = BatchGame(matches, seeds)
+        self.tick_length = 1 / tick_rate
+        self.ticks = 0
+        self.busy = 0.0  # Seconds spent ticking, to compare with the time available
+        self.restart_at = np.full(matches, -1, dtype=np.int64)
+
+        # Controls held by each match's players, indexed by [match, side]
+        self.controls = np.zeros((matches, 2), dtype=np.int64)
+        self.players = [[None, None] for _ in range(matches)]
+        self.viewers = [set() for _ in range(matches)]  # Writers, players included
+        self.watched = np.zeros(matches, dtype=bool)
+        self.joining = set()  # Writers waiting for a full frame
+
+        # Fields as they are now, and as they were last sent
+        self.fields = np.zeros((matches, len(FRAME_FIELDS)), dtype="<f4")
+        self.sent = np.full_like(self.fields, np.nan)
+        self.sent_pickups = self.pickup_arrays()
+        self.bits = np.uint16(1) << np.arange(len(FRAME_FIELDS), dtype=np.uint16)
+
+    def pickup_arrays(self):
+        """Copies of the pickup slots of every match."""
+        batch = self.batch
+        return tuple(
+            array.copy()
+            for array in (
+                batch.pickup_alive,
+                batch.pickup_x,
+                batch.pickup_y,
+                batch.pickup_type,
+            )
+        )
+
+    def pickups(self, match):
+        """The (x, y, type) of each pickup on the board of a match."""
+        batch = self.batch
+        return [
+            (
+                int(batch.pickup_x[match, slot]),
+                int(batch.pickup_y[match, slot]),
+                int(batch.pickup_type[match, slot]),
+            )
+            for slot in np.flatnonzero(batch.pickup_alive[match])
+        ]
+
+    #################
+    # Running ticks #
+    #################
+
+    def tick(self):
+        """Step every match, restart any which have been finished long enough,
+        and send the changes to everyone watching."""
+
+        batch = self.batch
+        batch.step(self.controls[:, LEFT] | (self.controls[:, RIGHT] << 2))
+
+        self.restart_at[batch.finish & (self.restart_at < 0)] = self.ticks + RESTART_DELAY
+        restart = self.restart_at == self.ticks
+        if restart.any():
+            batch.reset(restart)
+            self.restart_at[restart] = -1
+
+        self.ticks += 1
+        self.broadcast()
+
+    def broadcast(self):
+        """Send each watched match's changes to its viewers, and full frames to
+        anyone who has just joined."""
+
+        batch = self.batch
+        fields = self.fields
+        fields[:, 0] = batch.x
+        fields[:, 1] = batch.y
+        fields[:, 2] = batch.width
+        fields[:, 3] = batch.height
+        fields[:, 4] = batch.paddle_y[LEFT]
+        fields[:, 5] = batch.paddle_y[RIGHT]
+        fields[:, 6] = batch.paddle_height[LEFT]
+        fields[:, 7] = batch.paddle_height[RIGHT]
+        fields[:, 8] = batch.l_score
+        fields[:, 9] = batch.r_score
+        fields[:, 10] = batch.finish
+
+        pickups = self.pickup_arrays()
+        pickups_changed = np.zeros(batch.n, dtype=bool)
+        for now, sent in zip(pickups, self.sent_pickups):
+            pickups_changed |= (now != sent).any(axis=1)
+
+        changed = fields != self.sent
+        masks = (changed * self.bits).sum(axis=1, dtype=np.uint16)
+        masks[pickups_changed] |= PICKUPS_CHANGED
+
+        frames = batch.frame
+        for match in np.flatnonzero((masks != 0) & self.watched):
+            mask = int(masks[match])
+            frame = encode_frame(
+                frames[match],
+                mask,
+                fields[match, changed[match]],
+                self.pickups(match) if mask & PICKUPS_CHANGED else (),
+            )
+            for writer in self.viewers[match] - self.joining:
+                self.send(writer, frame)
+
+        for writer in self.joining:
+            match = writer.match
+            frame = encode_frame(frames[match], FULL_FRAME, fields[match], self.pickups(match))
+            self.send(writer, frame)
+        self.joining.clear()
+
+        self.sent[:] = fields
+        self.sent_pickups = pickups
+
+    def send(self, writer, frame):
+        """Send a frame, dropping the client if it can't keep up."""
+        if writer.transport.get_write_buffer_size() > MAX_WRITE_BUFFER:
+            writer.close()
+        elif not writer.is_closing():
+            writer.write(frame)
+
+    async def run(self, ticks=None):
+        """Tick the matches at the tick rate, forever or for the given number of ticks."""
+
+        loop = asyncio.get_running_loop()
+        next_tick = loop.time()
+        count = 0
+        while ticks is None or count < ticks:
+            begin = time.perf_counter()
+            self.tick()
+            self.busy += time.perf_counter() - begin
+            count += 1
+            next_tick += self.tick_length
+            now = loop.time()
+            if now - next_tick > MAX_TICKS_BEHIND * self.tick_length:
+                next_tick = now
+            await asyncio.sleep(max(0.0, next_tick - now))
+
+    async def serve(self, host="", port=SERVER_PORT):
+        """Accept clients and run the matches forever."""
+
+        server = await asyncio.start_server(self.handle_client, host, port)
+        async with server:
+            await self.run()
+
+    ###########
+    # Clients #
+    ###########
+
+    async def handle_client(self, reader, writer):
+        """Join a client to the match it asks for, then take its controls until it leaves."""
+
+        match = side = None
+        try:
+            kind, match, value = MESSAGE_FORMAT.unpack(
+                await reader.readexactly(MESSAGE_FORMAT.size)
+            )
+            if not 0 <= match < self.batch.n:
+                return
+            if kind == MESSAGE_PLAY:
+                if value not in (LEFT, RIGHT) or self.players[match][value]:
+                    return
+                side = value
+                self.players[match][side] = writer
+            elif kind != MESSAGE_WATCH:
+                return
+
+            writer.match = match
+            self.viewers[match].add(writer)
+            self.watched[match] = True
+            self.joining.add(writer)
+
+            while True:
+                kind, _, value = MESSAGE_FORMAT.unpack(
+                    await reader.readexactly(MESSAGE_FORMAT.size)
+                )
+                if kind == MESSAGE_CONTROLS and side is not None:
+                    self.controls[match, side] = value & (CONTROL_UP | CONTROL_DOWN)
+        except (asyncio.IncompleteReadError, ConnectionError):
+            pass
+        finally:
+            if match is not None and 0 <= match < self.batch.n:
+                self.viewers[match].discard(writer)
+                self.watched[match] = bool(self.viewers[match])
+                if side is not None:
+                    self.players[match][side] = None
+                    self.controls[match, side] = 0
+            self.joining.discard(writer)
+            writer.close()
+
+
+class MatchClient:
+    """Plays or watches one match on a MatchServer, keeping the latest state of it."""
+
+    def __init__(self, reader, writer):
+        """Use connect to create a client."""
+        self.reader = reader
+        self.writer = writer
+        self.frame = None
+        self.fields = dict.fromkeys(FRAME_FIELDS, 0.0)
+        self.pickups = []
+
+    @classmethod
+    async def connect(cls, host, port, match, side=None):
+        """Connect to a server, to play the given side of a match (LEFT or
+        RIGHT), or to watch it if side is None."""
+        reader, writer = await asyncio.open_connection(host, port)
+        if side is None:
+            writer.write(MESSAGE_FORMAT.pack(MESSAGE_WATCH, match, 0))
+        else:
+            writer.write(MESSAGE_FORMAT.pack(MESSAGE_PLAY, match, side))
+        return cls(reader, writer)
+
+    def send_controls(self, controls):
+        """Send the controls (netplay.CONTROL_* flags) held down now."""
+        self.writer.write(MESSAGE_FORMAT.pack(MESSAGE_CONTROLS, 0, controls))
+
+    async def receive(self):
+        """Wait for the next frame and apply it."""
+        (length,) = LENGTH_FORMAT.unpack(await self.reader.readexactly(LENGTH_FORMAT.size))
+        self.frame = decode_frame(await self.reader.readexactly(length), self.fields, self.pickups)
+
+    async def close(self):
+        """Leave the match."""
+        self.writer.close()
+        await self.writer.wait_closed()
+
+
+###############################
+# Checking with local clients #
+###############################
+
+
+async def check_clients(matches=200, ticks=600, port=0):
+    """Run a server with a player and a spectator on every match, and raise
+    AssertionError unless every spectator ends up seeing its match exactly as
+    the server has it. Returns the time the server spent on each tick, in seconds."""
+
+    host = "127.0.0.1"
+    server = MatchServer(matches, tick_rate=1000, seeds=range(matches))
+    listener = await asyncio.start_server(server.handle_client, host, port)
+    port = listener.sockets[0].getsockname()[1]
+
+    players = [await MatchClient.connect(host, port, match, LEFT) for match in range(matches)]
+    spectators = [await MatchClient.connect(host, port, match) for match in range(matches)]
+    clients = players + spectators
+    await asyncio.sleep(0.1)  # Let everyone join
+
+    async def listen(client):
+        try:
+            while True:
+                await client.receive()
+        except (asyncio.IncompleteReadError, ConnectionError):
+            pass
+
+    listeners = [asyncio.create_task(listen(client)) for client in clients]
+
+    async def press_keys():
+        rng = Random(0)
+        while True:
+            for client in players:
+                client.send_controls(rng.choice((0, CONTROL_UP, CONTROL_DOWN)))
+            await asyncio.sleep(0.02)
+
+    presser = asyncio.create_task(press_keys())
+    await server.run(ticks)
+    presser.cancel()
+    await asyncio.sleep(0.2)  # Let the last frames arrive
+
+    # Frames where nothing changed aren't sent, so only the fields are compared.
+    for match, spectator in enumerate(spectators):
+        seen = np.array([spectator.fields[name] for name in FRAME_FIELDS], dtype=np.float32)
+        if (seen != server.fields[match]).any() or spectator.pickups != server.pickups(match):
+            raise AssertionError(f"Match {match}: spectator sees a different match")
+
+    for task in listeners:
+        task.cancel()
+    for client in clients:
+        await client.close()
+    listener.close()
+    await listener.wait_closed()
+    return server.busy / ticks
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Host many matches of pong at once.")
+    parser.add_argument("--matches", type=int, default=MATCH_COUNT, help="number of matches")
+    parser.add_argument("--port", type=int, default=SERVER_PORT, help="port to listen on")
+    parser.add_argument(
+        "--check", action="store_true", help="check local clients see the right matches"
+    )
+    args = parser.parse_args()
+
+    if args.check:
+        tick_time = asyncio.run(check_clients())
+        print("Spectators agree with the server.")
+        print("{:.2f} ms per tick with clients on every match.".format(tick_time * 1000))
+    else:
+        asyncio.run(MatchServer(args.matches).serve(port=args.port))
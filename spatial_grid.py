@@ -0,0 +1,87 @@
+"""A uniform grid for finding which objects are near each other.
+
+Rather than testing an object against everything on the board, objects are
+filed under each grid cell their rectangle covers, and only the objects
+sharing a cell with the one being tested need a proper overlap test.
+
+Objects need the attributes x, y, width and height, as for utilities.is_overlap.
+"""
+
+from math import floor
+
+GRID_CELL_SIZE = 8
+
+
+class SpatialGrid:
+    """Files objects by the grid cells they cover."""
+
+    def __init__(self, cell_size=GRID_CELL_SIZE):
+        """Start with an empty grid of the given cell size."""
+        self.cell_size = cell_size
+        self.cells = {}  # (column, row) -> {id(obj): obj}
+        self.entries = {}  # id(obj) -> (order added, obj, cell range)
+        self.added = 0
+
+    def cell_range(self, obj):
+        """Return the first and last columns and rows the object's rectangle touches."""
+        size = self.cell_size
+        return (
+            floor(obj.x / size),
+            floor((obj.x + obj.width) / size),
+            floor(obj.y / size),
+            floor((obj.y + obj.height) / size),
+        )
+
+    @staticmethod
+    def cells_in(cell_range):
+        """Return the (column, row) of every cell in a cell range."""
+        left, right, top, bottom = cell_range
+        return [
+            (column, row)
+            for column in range(left, right + 1)
+            for row in range(top, bottom + 1)
+        ]
+
+    def add(self, obj):
+        """Add an object to the grid."""
+        cell_range = self.cell_range(obj)
+        for cell in self.cells_in(cell_range):
+            self.cells.setdefault(cell, {})[id(obj)] = obj
+        self.entries[id(obj)] = (self.added, obj, cell_range)
+        self.added += 1
+
+    def remove(self, obj):
+        """Take an object out of the grid."""
+        _, _, cell_range = self.entries.pop(id(obj))
+        for cell in self.cells_in(cell_range):
+            del self.cells[cell][id(obj)]
+            if not self.cells[cell]:
+                del self.cells[cell]
+
+    def move(self, obj):
+        """Refile an object after it has moved or changed size."""
+        order, _, old_range = self.entries[id(obj)]
+        cell_range = self.cell_range(obj)
+        if cell_range == old_range:
+            return
+        self.remove(obj)
+        for cell in self.cells_in(cell_range):
+            self.cells.setdefault(cell, {})[id(obj)] = obj
+        self.entries[id(obj)] = (order, obj, cell_range)
+
+    def near(self, rect):
+        """Return the objects sharing a cell with the rectangle, in the order they were added.
+
+        These are the only objects which can overlap it."""
+        found = {}
+        for cell in self.cells_in(self.cell_range(rect)):
+            objects = self.cells.get(cell)
+            if objects:
+                found.update(objects)
+        if len(found) < 2:
+            return list(found.values())
+        return sorted(found.values(), key=lambda obj: self.entries[id(obj)][0])
+
+    def __len__(self):
+        """The number of objects in the grid."""
+        return len(self.entries)
@@ -0,0 +1,442 @@
+"""Tournaments and parameter sweeps of headless matches, on every core.
+
+Each combination of the constants given with --set is played between every
+pair of bot policies, --matches times with different seeds, as separate
+processes. As matches finish their results are appended to a columnar
+results file, a block of rows at a time, so a sweep can run for as long as it
+likes without holding its results in memory, and a later sweep with the same
+settings can add to the same file:
+
+    python3 sweep.py --set SPIN=0.2,0.4,0.6 --set PICKUP_INTERVAL=100:150,300:900 \\
+        --policies track,lazy --matches 20 --out results.pongcol
+
+Constants can be any of SWEEPABLE, and tuples (PICKUP_INTERVAL) are written
+low:high. A sweep prints a summary at the end, or read_results reads a
+results file back (optionally only some of its columns) as NumPy arrays.
+
+Requires numpy.
+"""
+
+import argparse
+from concurrent.futures import ProcessPoolExecutor, wait, FIRST_COMPLETED
+import functools
+import itertools
+import json
+import os
+from random import Random
+import struct
+import numpy as np
+
+import engine
+import objects
+import pickups
+import ai
+from engine import (
+    GameState,
+    INPUT_L_UP,
+    INPUT_L_DOWN,
+    INPUT_R_UP,
+    INPUT_R_DOWN,
+    EVENT_HIT,
+    EVENT_SCORE,
+)
+
+#############
+# Constants #
+#############
+
+SWEEPABLE = (
+    "SPIN",
+    "BOUNCE",
+    "BOUNCE_FRICTION",
+    "GIANT_SIDE_CHANGE",
+    "SPEED_PERIOD",
+    "SPEED_AMOUNT",
+    "BALL_INITIAL_VELOCITY",
+    "PADDLE_HEIGHT",
+    "PADDLE_HEIGHT_EXPANDED",
+    "PADDLE_WIDTH",
+    "PADDLE_SIDE",
+    "PADDLE_MOVE_SPEED",
+    "PADDLE_MOVE_SPEED_SLOW",
+    "PICKUP_INTERVAL",
+    "PICKUP_LENGTH",
+)
+# Every module with its own copy of the constants
+CONSTANT_MODULES = (engine, objects, pickups, ai)
+DEFAULT_CONSTANTS = {
+    name: getattr(module, name)
+    for module in CONSTANT_MODULES
+    for name in SWEEPABLE
+    if hasattr(module, name)
+}
+
+MAX_MATCH_FRAMES = 60 * 60 * 10  # Ten minutes of play
+BLOCK_ROWS = 256  # Rows buffered before they are appended to the results file
+POLICY_NAME_LENGTH = 16
+
+COLUMNS_MAGIC = b"PONGCOL1"
+BLOCK_FORMAT = struct.Struct("<I")  # Rows in the block
+
+RESULT_COLUMNS = [
+    ("left", "S{}".format(POLICY_NAME_LENGTH)),
+    ("right", "S{}".format(POLICY_NAME_LENGTH)),
+    ("seed", "<i8"),
+    ("l_score", "<i8"),
+    ("r_score", "<i8"),
+    ("winner", "<i1"),  # 0 left, 1 right, -1 if the match ran out of time
+    ("frames", "<i8"),
+    ("hits", "<i8"),
+    ("points", "<i8"),
+    ("mean_rally", "<f8"),  # Paddle hits per point
+    ("longest_rally", "<i8"),
+]
+
+
+###############
+# Bot players #
+###############
+
+
+def idle(state, paddle, rng):
+    """Never moves."""
+    return False, False
+
+
+def track(state, paddle, rng):
+    """Follows the ball."""
+    ball_y = state.ball.y
+    up = ball_y < paddle.y + 2
+    down = not up and ball_y > paddle.y + paddle.height - 2
+    return up, down
+
+
+def lazy(state, paddle, rng):
+    """Follows the ball when it is coming its way, and otherwise drifts back
+    to the middle, sometimes dozing off."""
+    coming = (state.ball.x_vol < 0) == (paddle.x < state.ball.x)
+    if rng.random() < 0.1:
+        return False, False
+    if coming:
+        return track(state, paddle, rng)
+    middle = (engine.HEIGHT - paddle.height) / 2
+    return paddle.y > middle + 1, paddle.y < middle - 1
+
+
+POLICIES = {"idle": idle, "track": track, "lazy": lazy}
+BOTS = list(POLICIES) + list(ai.DIFFICULTIES)  # The rest predict the ball (see ai.py)
+
+
+def make_bot(name, state, paddle, rng):
+    """Return a function giving a bot's (up, down) controls each frame."""
+
+    if name in ai.DIFFICULTIES:
+        return ai.PaddleAI.with_difficulty(paddle, state.ball, name, rng).controls
+    return functools.partial(POLICIES[name], state, paddle, rng)
+
+
+###############
+# The matches #
+###############
+
+
+def set_constants(constants):
+    """Set the given constants (name -> value) everywhere they are used, and
+    the rest back to their defaults."""
+
+    values = dict(DEFAULT_CONSTANTS, **constants)
+    for module in CONSTANT_MODULES:
+        for name, value in values.items():
+            if hasattr(module, name):
+                setattr(module, name, value)
+
+
+def play_match(task):
+    """Play one match, given (constants, left policy, right policy, seed), and
+    return its row of results."""
+
+    constants, left, right, seed = task
+    set_constants(constants)
+    state = GameState(seed=seed)
+    bots_rng = Random(f"{seed}/bots")
+    l_bot = make_bot(left, state, state.l_paddle, bots_rng)
+    r_bot = make_bot(right, state, state.r_paddle, bots_rng)
+
+    hits = 0
+    rallies = []
+    rally = 0
+    while not state.finish and state.frame_count < MAX_MATCH_FRAMES:
+        l_up, l_down = l_bot()
+        r_up, r_down = r_bot()
+        state.step(
+            (INPUT_L_UP if l_up else 0)
+            | (INPUT_L_DOWN if l_down else 0)
+            | (INPUT_R_UP if r_up else 0)
+            | (INPUT_R_DOWN if r_down else 0)
+        )
+        for event in state.events:
+            if event == EVENT_HIT:
+                hits += 1
+                rally += 1
+            elif event == EVENT_SCORE:
+                rallies.append(rally)
+                rally = 0
+
+    if not state.finish:
+        winner = -1
+    else:
+        winner = 0 if state.l_score > state.r_score else 1
+    row = dict(constant_columns(constants))
+    row.update(
+        left=left,
+        right=right,
+        seed=seed,
+        l_score=state.l_score,
+        r_score=state.r_score,
+        winner=winner,
+        frames=state.frame_count,
+        hits=hits,
+        points=len(rallies),
+        mean_rally=sum(rallies) / len(rallies) if rallies else 0.0,
+        longest_rally=max(rallies, default=0),
+    )
+    return row
+
+
+def constant_columns(constants):
+    """The results columns for some constants, with tuples split into _low and _high."""
+    for name, value in constants.items():
+        if isinstance(value, tuple):
+            yield name + "_low", value[0]
+            yield name + "_high", value[1]
+        else:
+            yield name, value
+
+
+def sweep_tasks(grid, policies, matches):
+    """Every (constants, left, right, seed) of a sweep.
+
+    Grid maps constant names to the list of values to try."""
+
+    names = list(grid)
+    for values in itertools.product(*(grid[name] for name in names)):
+        constants = dict(zip(names, values))
+        for left, right in itertools.product(policies, repeat=2):
+            for seed in range(matches):
+                yield constants, left, right, seed
+
+
+def run_sweep(grid, policies, matches, filename, workers=None):
+    """Play every match of a sweep across a pool of processes, appending the
+    results to a file as they come in. Returns the number of matches played."""
+
+    first_values = {name: values[0] for name, values in grid.items()}
+    columns = [(name, "<f8") for name, _ in constant_columns(first_values)]
+    columns += RESULT_COLUMNS
+
+    workers = workers or os.cpu_count()
+    played = 0
+    with ResultsWriter(filename, columns) as writer:
+        with ProcessPoolExecutor(workers) as executor:
+            # Only a few matches are queued up at once, so huge sweeps don't
+            # fill memory with waiting tasks.
+            pending = set()
+            for task in sweep_tasks(grid, policies, matches):
+                pending.add(executor.submit(play_match, task))
+                if len(pending) >= workers * 4:
+                    done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                    for future in done:
+                        writer.append(future.result())
+                    played += len(done)
+            for future in wait(pending).done:
+                writer.append(future.result())
+            played += len(pending)
+    return played
+
+
+################
+# Results file #
+################
+
+
+class ResultsWriter:
+    """Appends rows to a columnar results file.
+
+    The file starts with its magic, then the length of a JSON list of
+    [column name, dtype], then that list. After that come blocks of rows: the
+    number of rows, then all of the first column's values, then all of the
+    second's, and so on."""
+
+    def __init__(self, filename, columns):
+        """Open the file to append to, writing its header if it is new. An
+        existing file must have the same columns."""
+        self.columns = [(name, np.dtype(dtype)) for name, dtype in columns]
+        self.rows = []
+        header = json.dumps([[name, dtype.str] for name, dtype in self.columns]).encode()
+
+        if os.path.exists(filename) and os.path.getsize(filename):
+            existing, _ = read_header(filename)
+            if existing != [(name, dtype) for name, dtype in self.columns]:
+                raise ValueError("The results file has different columns.")
+            self.file = open(filename, "ab")
+        else:
+            self.file = open(filename, "wb")
+            self.file.write(COLUMNS_MAGIC + struct.pack("<I", len(header)) + header)
+
+    def append(self, row):
+        """Add a row (a dict of column name -> value), writing a block once
+        enough are waiting."""
+        self.rows.append(row)
+        if len(self.rows) >= BLOCK_ROWS:
+            self.flush()
+
+    def flush(self):
+        """Write the waiting rows as a block."""
+        if not self.rows:
+            return
+        data = [BLOCK_FORMAT.pack(len(self.rows))]
+        for name, dtype in self.columns:
+            data.append(np.array([row[name] for row in self.rows], dtype=dtype).tobytes())
+        self.file.write(b"".join(data))
+        self.file.flush()
+        self.rows = []
+
+    def close(self):
+        """Write any waiting rows and close the file."""
+        self.flush()
+        self.file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+def read_header(filename):
+    """Return the [(name, dtype)] of a results file's columns, and the size of its header."""
+
+    with open(filename, "rb") as file:
+        magic = file.read(len(COLUMNS_MAGIC))
+        if magic != COLUMNS_MAGIC:
+            raise ValueError("Not a results file.")
+        (length,) = struct.unpack("<I", file.read(4))
+        columns = [(name, np.dtype(dtype)) for name, dtype in json.loads(file.read(length))]
+    return columns, len(COLUMNS_MAGIC) + 4 + length
+
+
+def read_results(filename, names=None):
+    """Read a results file into a dict of column name -> array.
+
+    Only the named columns are read (all of them by default), skipping over
+    the rest. A block cut short, by a sweep being stopped while writing, is
+    ignored."""
+
+    columns, position = read_header(filename)
+    if names is None:
+        names = [name for name, _ in columns]
+    parts = {name: [] for name in names}
+    size = os.path.getsize(filename)
+
+    with open(filename, "rb") as file:
+        file.seek(position)
+        while position + BLOCK_FORMAT.size <= size:
+            (rows,) = BLOCK_FORMAT.unpack(file.read(BLOCK_FORMAT.size))
+            position += BLOCK_FORMAT.size
+            if position + rows * sum(dtype.itemsize for _, dtype in columns) > size:
+                break
+            for name, dtype in columns:
+                length = rows * dtype.itemsize
+                if name in parts:
+                    file.seek(position)
+                    parts[name].append(np.frombuffer(file.read(length), dtype=dtype))
+                position += length
+            file.seek(position)
+
+    return {
+        name: np.concatenate(arrays) if arrays else np.zeros(0, dtype=dict(columns)[name])
+        for name, arrays in parts.items()
+    }
+
+
+def summarise(filename):
+    """Print win rates, rallies and match lengths for each pairing of policies."""
+
+    results = read_results(filename, ["left", "right", "winner", "mean_rally", "frames"])
+    pairs = sorted(set(zip(results["left"], results["right"])))
+    print(
+        "{:>16} {:>16} {:>8} {:>9} {:>7} {:>8}".format(
+            "left", "right", "matches", "left wins", "rally", "frames"
+        )
+    )
+    for left, right in pairs:
+        pair = (results["left"] == left) & (results["right"] == right)
+        finished = pair & (results["winner"] >= 0)
+        print(
+            "{:>16} {:>16} {:>8} {:>9.0%} {:>7.1f} {:>8.0f}".format(
+                left.decode(),
+                right.decode(),
+                int(pair.sum()),
+                (results["winner"][finished] == 0).mean() if finished.any() else 0,
+                results["mean_rally"][pair].mean(),
+                results["frames"][pair].mean(),
+            )
+        )
+
+
+def parse_values(text):
+    """Parse a comma separated list of values, with low:high for tuples."""
+
+    values = []
+    for item in text.split(","):
+        if ":" in item:
+            values.append(tuple(int(part) for part in item.split(":")))
+        else:
+            number = float(item)
+            values.append(int(number) if number.is_integer() and "." not in item else number)
+    return values
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Sweep constants and bots over many headless matches."
+    )
+    parser.add_argument(
+        "--set",
+        action="append",
+        default=[],
+        metavar="NAME=VALUES",
+        help="a constant and the comma separated values to try, e.g. SPIN=0.2,0.4",
+    )
+    parser.add_argument(
+        "--policies",
+        default="track",
+        help="comma separated bots, from: " + ", ".join(BOTS),
+    )
+    parser.add_argument(
+        "--matches", type=int, default=10, help="matches per setting and pairing"
+    )
+    parser.add_argument(
+        "--workers", type=int, help="processes to use (default: every core)"
+    )
+    parser.add_argument(
+        "--out", default="results.pongcol", help="results file to append to"
+    )
+    args = parser.parse_args()
+
+    grid = {}
+    for setting in args.set:
+        name, _, values = setting.partition("=")
+        if name not in SWEEPABLE:
+            parser.error(
+                "{} can't be swept; choose from {}".format(name, ", ".join(SWEEPABLE))
+            )
+        grid[name] = parse_values(values)
+    policies = args.policies.split(",")
+    for policy in policies:
+        if policy not in BOTS:
+            parser.error("There is no {} bot".format(policy))
+
+    played = run_sweep(grid, policies, args.matches, args.out, args.workers)
+    print("Played {} matches into {}.".format(played, args.out))
+    summarise(args.out)
@@ -0,0 +1,338 @@
+"""Counting what happens in matches, for gameplay analytics.
+
+Telemetry keeps counters and histograms of what happens over many matches -
+how long rallies last, how fast the ball gets, where on the paddles it hits,
+what happens to each type of pickup and who scores - in fixed-size NumPy
+arrays which are added to in place as things happen. It counts the events a
+match emits (see events.py), as a sink of the front end's EventBus, so the
+game logic knows nothing about it. Nothing is allocated per event and nothing
+is done on frames when nothing happens.
+
+A TelemetryWriter appends what has been counted since its last flush to a
+file every FLUSH_INTERVAL seconds, from a background thread. The file starts
+with its magic, the length of a JSON list of [array name, shape] and that
+list, followed by records of the time and the arrays' counts since the record
+before, so the file only ever grows and a kiosk's file can be read while the
+game is running.
+
+    python3 pong.py --telemetry kiosk.pongtel
+
+counts every match played, and
+
+    python3 telemetry.py kiosk.pongtel
+
+prints a summary.
+
+Requires numpy.
+"""
+
+import argparse
+import json
+import os
+import struct
+import threading
+import time
+import numpy as np
+
+from events import EVENT_HIT, EVENT_SCORE, EVENT_FINISH, EVENT_SPEED
+from pickups import PICKUP_EVENTS, PICKUP_EVENT_KINDS
+
+TELEMETRY_MAGIC = b"PONGTEL1"
+RECORD_FORMAT = struct.Struct("<d")  # Unix time of the flush
+FLUSH_INTERVAL = 60  # Seconds between flushes
+
+PICKUP_NAMES = ("sparkle", "expand", "slow", "bounce", "giantball")
+SIDES = ("l", "r")
+
+MAX_RALLY = 63  # Longer rallies are counted in the last bin
+SPEED_BIN = 0.05  # Ball speed in pixels a frame
+SPEED_BINS = 40
+HIT_BINS = 16  # Across the paddle, from the top edge to the bottom
+COUNTERS = ("matches", "frames", "hits")
+MATCHES, FRAMES, HITS = range(len(COUNTERS))
+
+
+class Telemetry:
+    """Counters and histograms of what happens in matches."""
+
+    def __init__(self):
+        """Start with everything at zero."""
+
+        self.counters = np.zeros(len(COUNTERS), dtype=np.int64)
+        self.points = np.zeros(len(SIDES), dtype=np.int64)
+        self.rally_lengths = np.zeros(MAX_RALLY + 1, dtype=np.int64)
+        self.ball_speeds = np.zeros(SPEED_BINS, dtype=np.int64)
+        self.hit_positions = np.zeros((len(SIDES), HIT_BINS), dtype=np.int64)
+        self.pickups = np.zeros((len(PICKUP_NAMES), len(PICKUP_EVENTS)), dtype=np.int64)
+        self.pickup_index = {name: i for i, name in enumerate(PICKUP_NAMES)}
+        self.rally = 0  # Hits since the last serve
+
+    def arrays(self):
+        """Return a dict of the arrays by name, in the order they are saved."""
+        return {
+            "counters": self.counters,
+            "points": self.points,
+            "rally_lengths": self.rally_lengths,
+            "ball_speeds": self.ball_speeds,
+            "hit_positions": self.hit_positions,
+            "pickups": self.pickups,
+        }
+
+    ##########
+    # Events #
+    ##########
+
+    def count_events(self, events):
+        """Count a frame's events (an EventQueue), from their payloads."""
+        for kind, side, value, detail in events.items():
+            if kind == EVENT_HIT:
+                if np.ndim(value):
+                    self.hits(side, value)
+                else:
+                    self.hit(side, value)
+            elif kind == EVENT_SCORE:
+                self.score(side, value)
+            elif kind == EVENT_SPEED:
+                self.speed(value)
+            elif kind == EVENT_FINISH:
+                self.finish(value)
+            elif kind in PICKUP_EVENT_KINDS:
+                self.pickup(detail, PICKUP_EVENT_KINDS[kind])
+
+    def hit(self, side, position):
+        """The ball hit a paddle (side "l" or "r"), position being where on it,
+        from -1 at the top to 1 at the bottom."""
+        self.counters[HITS] += 1
+        self.rally += 1
+        hit_bin = int((position + 1) / 2 * HIT_BINS)
+        self.hit_positions[SIDES.index(side), min(max(hit_bin, 0), HIT_BINS - 1)] += 1
+
+    def hits(self, side, positions):
+        """Several balls hit a paddle at once, at an array of positions."""
+        self.counters[HITS] += len(positions)
+        self.rally += len(positions)
+        hit_bins = ((positions + 1) / 2 * HIT_BINS).astype(np.int64)
+        np.add.at(
+            self.hit_positions[SIDES.index(side)],
+            np.clip(hit_bins, 0, HIT_BINS - 1),
+            1,
+        )
+
+    def speed(self, speed):
+        """The ball sped up, to speed pixels a frame."""
+        self.ball_speeds[min(int(abs(speed) / SPEED_BIN), SPEED_BINS - 1)] += 1
+
+    def score(self, side, points=1):
+        """A side ("l" or "r") scored, ending the rally."""
+        self.points[SIDES.index(side)] += points
+        self.rally_lengths[min(self.rally, MAX_RALLY)] += 1
+        self.rally = 0
+
+    def pickup(self, name, event):
+        """A pickup of the named type was SPAWNED, COLLECTED or EXPIRED."""
+        index = self.pickup_index.get(name)
+        if index is not None:
+            self.pickups[index, event] += 1
+
+    def finish(self, frames):
+        """A match finished after the given number of frames."""
+        self.counters[MATCHES] += 1
+        self.counters[FRAMES] += frames
+
+
+class TelemetryWriter:
+    """Appends a Telemetry's counts to a file now and then, from a background thread."""
+
+    def __init__(self, telemetry, filename, interval=FLUSH_INTERVAL):
+        """Open the file to append to, writing its header if it is new, and
+        start flushing every interval seconds. An existing file must have been
+        written with the same arrays."""
+
+        self.telemetry = telemetry
+        self.interval = interval
+        self.flushed = {
+            name: np.zeros_like(array) for name, array in telemetry.arrays().items()
+        }
+        layout = [
+            [name, list(array.shape)] for name, array in telemetry.arrays().items()
+        ]
+
+        if os.path.exists(filename) and os.path.getsize(filename):
+            existing, _ = read_header(filename)
+            if existing != layout:
+                raise ValueError("The telemetry file has different arrays.")
+            self.file = open(filename, "ab")
+        else:
+            header = json.dumps(layout).encode()
+            self.file = open(filename, "wb")
+            self.file.write(TELEMETRY_MAGIC + struct.pack("<I", len(header)) + header)
+            self.file.flush()
+
+        self.lock = threading.Lock()
+        self.stopping = threading.Event()
+        self.thread = threading.Thread(target=self.run, daemon=True)
+        self.thread.start()
+
+    def run(self):
+        """Flush every interval until closed."""
+        while not self.stopping.wait(self.interval):
+            self.flush()
+
+    def flush(self):
+        """Append the counts since the last flush, if there are any."""
+
+        with self.lock:
+            changes = []
+            for name, array in self.telemetry.arrays().items():
+                now = array.copy()
+                changes.append(now - self.flushed[name])
+                self.flushed[name] = now
+            if not any(change.any() for change in changes):
+                return
+            data = [RECORD_FORMAT.pack(time.time())]
+            data += [change.tobytes() for change in changes]
+            self.file.write(b"".join(data))
+            self.file.flush()
+
+    def close(self):
+        """Stop the thread, flush what's left and close the file."""
+        self.stopping.set()
+        self.thread.join()
+        self.flush()
+        self.file.close()
+
+
+def read_header(filename):
+    """Return the [[name, shape]] of a telemetry file's arrays, and the size of
+    its header."""
+
+    with open(filename, "rb") as file:
+        if file.read(len(TELEMETRY_MAGIC)) != TELEMETRY_MAGIC:
+            raise ValueError("Not a telemetry file.")
+        (length,) = struct.unpack("<I", file.read(4))
+        layout = json.loads(file.read(length))
+    return layout, len(TELEMETRY_MAGIC) + 4 + length
+
+
+def read_telemetry(filename):
+    """Read a telemetry file into a dict of "time" (an array of flush times)
+    and each array's counts at each flush, one row per flush.
+
+    A record cut short, by the game stopping while writing, is ignored."""
+
+    layout, position = read_header(filename)
+    dtype = np.dtype(
+        [("time", "<f8")] + [(name, "<i8", tuple(shape)) for name, shape in layout]
+    )
+    with open(filename, "rb") as file:
+        file.seek(position)
+        data = file.read()
+    records = np.frombuffer(data[: len(data) // dtype.itemsize * dtype.itemsize], dtype)
+    return {name: records[name] for name in dtype.names}
+
+
+def summarise(filename):
+    """Print the totals of a telemetry file."""
+
+    records = read_telemetry(filename)
+    totals = {name: records[name].sum(axis=0) for name in records if name != "time"}
+    matches, frames, hits = totals["counters"]
+    rallies = totals["rally_lengths"]
+    print(
+        "{} matches, {:,} frames, {:,} hits, over {} flushes.".format(
+            matches, frames, hits, len(records["time"])
+        )
+    )
+    print("Points: left {}, right {}.".format(*totals["points"]))
+    if rallies.sum():
+        lengths = np.arange(len(rallies))
+        print(
+            "Rallies: {} played, {:.1f} hits on average, longest {}{}.".format(
+                rallies.sum(),
+                (lengths * rallies).sum() / rallies.sum(),
+                lengths[rallies > 0].max(),
+                "+" if rallies[-1] else "",
+            )
+        )
+    speeds = totals["ball_speeds"]
+    if speeds.sum():
+        fastest = (np.flatnonzero(speeds).max() + 1) * SPEED_BIN
+        print("Fastest ball: {:.2f} pixels a frame.".format(fastest))
+    for side, positions in zip(SIDES, totals["hit_positions"]):
+        print(
+            "Hits along the {} paddle, top to bottom: {}".format(
+                side, " ".join(map(str, positions))
+            )
+        )
+    for name, counts in zip(PICKUP_NAMES, totals["pickups"]):
+        events = ", ".join(
+            "{} {}".format(count, event) for event, count in zip(PICKUP_EVENTS, counts)
+        )
+        print("{:<10} {}".format(name, events))
+
+
+def check_telemetry(filename, matches=5, interval=0.05):
+    """Play some headless matches (and a multiball one) counting their events
+    into a file, checking the counts don't change how the matches play and
+    that the file adds up to what was counted."""
+
+    from engine import GameState, INPUT_L_UP, INPUT_L_DOWN, INPUT_R_UP, INPUT_R_DOWN
+    from multiball import MultiBallState
+
+    def tracking_inputs(state):
+        """Paddles following the (first) ball, missing now and then."""
+        target = np.ravel(state.ball.y)[0] + (state.frame_count // 97 % 5 - 2) * 4
+        inputs = 0
+        for paddle, up, down in (
+            (state.l_paddle, INPUT_L_UP, INPUT_L_DOWN),
+            (state.r_paddle, INPUT_R_UP, INPUT_R_DOWN),
+        ):
+            middle = paddle.y + paddle.height / 2
+            if target < middle - 1:
+                inputs |= up
+            elif target > middle + 1:
+                inputs |= down
+        return inputs
+
+    telemetry = Telemetry()
+    writer = TelemetryWriter(telemetry, filename, interval)
+    for seed in range(matches + 1):
+        states = [GameState(seed=seed), GameState(seed=seed)]
+        if seed == matches:
+            states = [MultiBallState(seed=seed, win_condition=50) for _ in range(2)]
+        while not states[0].finish:
+            inputs = tracking_inputs(states[0])
+            for state in states:
+                state.step(inputs)
+            telemetry.count_events(states[0].events)
+        first, second = (
+            (s.l_score, s.r_score, s.frame_count, np.ravel(s.ball.y).tobytes())
+            for s in states
+        )
+        if first != second:
+            raise AssertionError("Counting changed match {}.".format(seed))
+    writer.close()
+
+    records = read_telemetry(filename)
+    for name, array in telemetry.arrays().items():
+        if not (records[name].sum(axis=0) == array).all():
+            raise AssertionError("The file's {} don't add up.".format(name))
+    print("{} records add up.".format(len(records["time"])))
+    summarise(filename)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Summarise a telemetry file.")
+    parser.add_argument("filename", help="the telemetry file")
+    parser.add_argument(
+        "--check",
+        action="store_true",
+        help="play some headless matches into a new file first, checking it adds up",
+    )
+    args = parser.parse_args()
+    if args.check:
+        if os.path.exists(args.filename):
+            parser.error("--check needs a new file.")
+        check_telemetry(args.filename)
+    else:
+        summarise(args.filename)
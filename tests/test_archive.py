@@ -0,0 +1,78 @@
+"""Archives of recorded matches, and seeking into them."""
+
+import pytest
+
+from archive import ArchiveReader, write_archive
+from engine import GameState, INPUT_L_UP, INPUT_R_DOWN, INPUT_L_DOWN, INPUT_R_UP
+from replay import Recorder, replay, state_hash
+
+
+def record(seed, steps, frames=1):
+    """Record a match of a few long presses."""
+    recorder = Recorder(GameState(seed=seed), frames)
+    for step in range(steps):
+        if step // 50 % 2:
+            recorder.step(INPUT_L_UP | INPUT_R_DOWN)
+        else:
+            recorder.step(INPUT_L_DOWN | INPUT_R_UP)
+    return recorder.finish()
+
+
+def state_after(recording, steps):
+    """The recorded match as it was after the given number of steps."""
+    state = recording.new_state()
+    for inputs in list(recording.inputs)[:steps]:
+        state.step(inputs, recording.frames)
+    return state
+
+
+@pytest.fixture
+def recordings():
+    return [record(1, 2500), record(2, 0), record(3, 700, frames=4)]
+
+
+def test_empty_match_seeks_to_its_start(tmp_path, recordings):
+    filename = tmp_path / "empty.pongarc"
+    write_archive(filename, recordings, keyframe_interval=600)
+    with ArchiveReader(filename) as archive:
+        assert archive.index[1]["steps"] == 0
+        assert archive.index[1]["keyframe_count"] == 1
+        for frame in (0, 10):
+            state = archive.state_at(1, frame)
+            assert state.frame_count == 0
+            assert state_hash(state) == state_hash(GameState(seed=2))
+
+
+@pytest.mark.parametrize(
+    "position, frame",
+    [(0, 0), (0, 599), (0, 600), (0, 1234), (0, 2500), (2, 1401), (2, 2800)],
+)
+def test_seek_into_a_match(tmp_path, recordings, position, frame):
+    filename = tmp_path / "seek.pongarc"
+    write_archive(filename, recordings, keyframe_interval=600)
+    recording = recordings[position]
+    with ArchiveReader(filename) as archive:
+        state = archive.state_at(position, frame)
+    # A frame inside a step of several frames is shown as the step which reached it
+    steps = -(-frame // recording.frames)
+    assert state_hash(state) == state_hash(state_after(recording, steps))
+    if frame == 2500:
+        assert state_hash(state) == state_hash(replay(recording))
+
+
+def test_close_unmaps_the_archive(tmp_path, recordings):
+    filename = tmp_path / "close.pongarc"
+    write_archive(filename, recordings)
+    with ArchiveReader(filename) as archive:
+        mapped = archive.map
+        assert len(archive) == 3
+    assert mapped.closed
+    assert archive.map is None
+
+    archive = ArchiveReader(filename)
+    keyframes = archive.keyframes(0)
+    with pytest.raises(BufferError):
+        archive.close()
+    del keyframes
+    archive.close()
+    archive.close()  # Closing again does nothing
@@ -0,0 +1,134 @@
+"""Parity between batch.BatchGame and engine.GameState."""
+
+from random import Random
+import numpy as np
+import pytest
+
+import batch
+from batch import BatchGame, check_parity, tracking_policy, PICKUP_TYPES
+from engine import WIDTH, HEIGHT
+from pickups import Pickup, PICKUP_WIDTH
+
+
+def idle_policy(batch_game, frame):
+    """Nobody moves, so every match scores on the same frames."""
+    return np.zeros(batch_game.n, dtype=np.int64)
+
+
+def random_policy(batch_game, frame):
+    """Any combination of controls, up and down together included."""
+    return np.random.default_rng(frame).integers(0, 16, batch_game.n)
+
+
+def sluggish_policy(batch_game, frame):
+    """Follows the ball, but only reacts every fourth frame."""
+    if frame % 4:
+        return np.zeros(batch_game.n, dtype=np.int64)
+    return tracking_policy(batch_game, frame)
+
+
+def place_pickups(placements):
+    """A setup for check_parity putting (x, y, pickup type name) pickups on
+    the board of every match, in both engines."""
+
+    def setup(states, batch_game):
+        for i, state in enumerate(states):
+            for x, y, name in placements:
+                pickup = Pickup(x, y, PICKUP_WIDTH, PICKUP_WIDTH, name)
+                state.pickups.pickups.append(pickup)
+                state.pickups.grid.add(pickup)
+                batch_game.add_pickup(i, x, y, PICKUP_TYPES.index(name))
+
+    return setup
+
+
+# Where the ball is served from, so it collects these straight away
+CENTRE = (WIDTH // 2 - 1, HEIGHT // 2 - 1)
+
+
+@pytest.mark.parametrize(
+    "policy", [tracking_policy, idle_policy, random_policy, sluggish_policy]
+)
+@pytest.mark.parametrize("first_seed", [0, 1000, 2**40])
+def test_parity(policy, first_seed):
+    seeds = range(first_seed, first_seed + 8)
+    check_parity(len(seeds), 4000, seeds=seeds, policy=policy)
+
+
+def test_simultaneous_scores():
+    game = BatchGame(8, seeds=range(8))
+    most = 0
+    for frame in range(500):
+        game.step(idle_policy(game, frame))
+        most = max(most, np.count_nonzero(game.outcome))
+    assert most > 1
+    check_parity(8, 3000, policy=idle_policy)
+
+
+def test_giant_bouncing_ball():
+    setup = place_pickups([(*CENTRE, "giantball"), (*CENTRE, "bounce")])
+    check_parity(8, 3000, setup=setup)
+
+
+def test_condition_table_overflow(monkeypatch):
+    monkeypatch.setattr(batch, "MAX_CONDITIONS", 1)
+    names = ["expand", "slow", "bounce", "giantball", "expand", "slow"]
+    setup = place_pickups([(*CENTRE, name) for name in names])
+    check_parity(8, 3000, setup=setup)
+
+
+def test_condition_table_grows(monkeypatch):
+    monkeypatch.setattr(batch, "MAX_CONDITIONS", 2)
+    game = BatchGame(2, seeds=range(2))
+    for name in PICKUP_TYPES:
+        game.add_pickup(0, *CENTRE, PICKUP_TYPES.index(name))
+    for frame in range(100):
+        game.step(idle_policy(game, frame))
+    collected = len(PICKUP_TYPES) - game.pickup_alive[0].sum()
+    assert collected > 2
+    assert game.condition_alive[0].sum() == collected
+
+    # Every effect ends
+    for frame in range(100, 700):
+        game.step(idle_policy(game, frame))
+    assert not game.condition_alive.any()
+    assert not game.bounce_status.any()
+    assert (game.width == batch.BALL_SIDE).all()
+    assert (game.paddle_height == batch.PADDLE_HEIGHT).all()
+    assert (game.move_speed == batch.PADDLE_MOVE_SPEED).all()
+
+
+def test_crowded_board():
+    rng = Random(0)
+    placements = [
+        (
+            rng.randint(10, WIDTH - 10 - PICKUP_WIDTH),
+            rng.randint(0, HEIGHT - PICKUP_WIDTH),
+            rng.choice(PICKUP_TYPES),
+        )
+        for _ in range(batch.MAX_PICKUPS - 4)
+    ]
+    check_parity(8, 5000, setup=place_pickups(placements))
+
+
+def test_pickup_overflow_raises():
+    game = BatchGame(1, seeds=[0])
+    for _ in range(batch.MAX_PICKUPS):
+        game.add_pickup(0, *CENTRE, 0)
+    with pytest.raises(OverflowError):
+        game.add_pickup(0, *CENTRE, 0)
+
+
+def test_spawn_onto_full_board_is_dropped():
+    game = BatchGame(2, seeds=range(2))
+    for _ in range(batch.MAX_PICKUPS):
+        game.add_pickup(0, game.pickup_left, 0, 0)  # Out of the ball's way
+    game.start[:] = -1
+    game.next_pickup[:] = -1
+    game.step(np.zeros(2, dtype=np.int64))
+    assert game.pickups_dropped.tolist() == [1, 0]
+    assert game.pickup_alive.sum(axis=1).tolist() == [batch.MAX_PICKUPS, 1]
+    assert (game.next_pickup > 0).all()
+
+    game.reset(np.array([True, False]))
+    assert game.pickups_dropped.tolist() == [0, 0]
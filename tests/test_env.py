@@ -0,0 +1,33 @@
+"""The vectorized training environment."""
+
+import numpy as np
+import pytest
+
+from env import VectorPongEnv, ACTION_STAY, ACTION_UP, ACTION_DOWN
+
+
+def random_actions(rng, num_envs):
+    return rng.choice([ACTION_STAY, ACTION_UP, ACTION_DOWN], num_envs)
+
+
+@pytest.mark.parametrize("pixels", (False, True))
+def test_reset_with_a_seed_matches_a_fresh_env(pixels):
+    rng = np.random.default_rng(0)
+    used = VectorPongEnv(4, seed=1, pixels=pixels, max_frames=700)
+    for _ in range(1500):
+        used.step(random_actions(rng, 4))
+
+    observation, _ = used.reset(seed=7)
+    fresh = VectorPongEnv(4, seed=7, pixels=pixels, max_frames=700)
+    assert used.batch.seeds == fresh.batch.seeds
+    for name, array in fresh.observation.items():
+        assert np.array_equal(observation[name], array), name
+
+    for _ in range(3000):
+        actions = random_actions(rng, 4)
+        first = used.step(actions)
+        second = fresh.step(actions)
+        for name, array in second[0].items():
+            assert np.array_equal(first[0][name], array), name
+        for got, expected in zip(first[1:4], second[1:4]):
+            assert np.array_equal(got, expected)
@@ -0,0 +1,31 @@
+"""Queues of game events and their payloads."""
+
+from events import EventQueue, EVENT_HIT, EVENT_SCORE, EVENT_PICKUP
+
+
+def test_payloads_are_kept_in_order():
+    queue = EventQueue(4)
+    queue.emit(EVENT_HIT, "l", 0.5)
+    queue.emit(EVENT_PICKUP, detail="sparkle")
+    queue.emit(EVENT_SCORE, "r", 1)
+    assert list(queue.items()) == [
+        (EVENT_HIT, "l", 0.5, None),
+        (EVENT_PICKUP, None, None, "sparkle"),
+        (EVENT_SCORE, "r", 1, None),
+    ]
+    assert list(queue) == [EVENT_HIT, EVENT_PICKUP, EVENT_SCORE]
+
+
+def test_a_full_queue_still_counts():
+    queue = EventQueue(2)
+    for position in (-1, 0, 1):
+        queue.emit(EVENT_HIT, "l", position)
+    assert len(queue) == 2
+    assert queue.count(EVENT_HIT) == 3
+    assert queue.dropped == 1
+
+    frame = EventQueue(8)
+    frame.extend(queue)
+    assert list(frame.items()) == list(queue.items())
+    queue.clear()
+    assert len(queue) == 0 and EVENT_HIT not in queue
@@ -0,0 +1,30 @@
+"""Multi-ball matches stepped several frames at a time."""
+
+from multiball import MultiBallState
+from replay import state_hash
+
+
+def test_multi_frame_steps_match_single_frames():
+    # The match starts moving on frame START_DELAY + 1 = 51, a multiple of 3
+    stepped = MultiBallState(50, seed=3)
+    single = MultiBallState(50, seed=3)
+    conditions = 0
+    for _ in range(1500):
+        stepped.step(frames=3)
+        for _ in range(3):
+            single.step()
+        assert stepped.frame_count == single.frame_count
+        assert state_hash(stepped) == state_hash(single)
+        conditions = max(conditions, len(stepped.pickups.active_conditions))
+    assert conditions > 0  # Pickups were collected and ran out along the way
+
+
+def test_multi_frame_steps_stop_at_the_finish():
+    stepped = MultiBallState(50, seed=3, win_condition=30)
+    single = MultiBallState(50, seed=3, win_condition=30)
+    while not stepped.finish:
+        stepped.step(frames=3)
+        for _ in range(3):
+            single.step()
+    assert single.finish
+    assert state_hash(stepped) == state_hash(single)
@@ -0,0 +1,31 @@
+"""Rollback sessions playing each other over a bad network."""
+
+import pytest
+
+from netplay import LoopbackLink, check_loopback, play_loopback
+from replay import state_hash
+
+
+def test_loopback_link_loses_and_reorders():
+    link = LoopbackLink(loss=0.2, delay=2, jitter=3, seed=0)
+    sender, receiver = link.ends
+    received = []
+    for number in range(200):
+        sender.send(bytes([number]))
+        received.extend(packet[0] for packet in receiver.receive())
+    for _ in range(10):
+        received.extend(packet[0] for packet in receiver.receive())
+    assert 100 < len(received) < 200
+    assert received != sorted(received)
+
+
+@pytest.mark.parametrize("seed", range(3))
+def test_both_ends_agree_after_rollbacks(seed):
+    sessions = play_loopback(frames=1500, loss=0.2, delay=4, jitter=3, seed=seed)
+    assert sessions[0].frame == sessions[1].frame == 1500
+    assert state_hash(sessions[0].state) == state_hash(sessions[1].state)
+    assert sum(session.rollbacks for session in sessions) > 0
+
+
+def test_check_loopback():
+    assert check_loopback(frames=1000, seed=7) > 0
@@ -0,0 +1,34 @@
+"""Where the sparkles come from."""
+
+import random
+import numpy as np
+
+from engine import GameState
+from particle_emitter import ParticleEmitter
+
+
+def sparkles(emitter, frames=40):
+    for frame in range(frames):
+        emitter.sparkle(frame)
+    return emitter.x.copy(), emitter.y.copy(), emitter.colour.copy()
+
+
+def test_sparkles_ignore_the_global_random_state():
+    ball = GameState(seed=0).ball
+    made = []
+    for global_seed in (1, 2):
+        random.seed(global_seed)
+        made.append(sparkles(ParticleEmitter(ball)))
+    for first, second in zip(*made):
+        assert np.array_equal(first, second)
+
+
+def test_seeded_matches_sparkle_the_same():
+    made = []
+    for _ in range(2):
+        state = GameState(seed=4)
+        made.append(sparkles(state.sparkler))
+    for first, second in zip(*made):
+        assert np.array_equal(first, second)
+    other = sparkles(GameState(seed=5).sparkler)
+    assert not np.array_equal(made[0][0], other[0])
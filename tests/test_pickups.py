@@ -0,0 +1,80 @@
+"""Pickup conditions scheduled, stacked and expired by EffectScheduler."""
+
+from random import Random
+
+from engine import GameState, PADDLE_HEIGHT, PADDLE_HEIGHT_EXPANDED
+from pickups import (
+    EffectScheduler,
+    Pickup,
+    Pickups,
+    PickupType,
+    PICKUP_LENGTH,
+    PICKUP_WIDTH,
+)
+
+
+def collect(pickups, name, frame):
+    """Put a pickup of the named type on the board and collect it."""
+    pickup = Pickup(0, 0, PICKUP_WIDTH, PICKUP_WIDTH, name)
+    pickups.pickups.append(pickup)
+    pickups.grid.add(pickup)
+    pickups.collect(pickup, frame)
+
+
+def test_stacked_conditions_stay_active_until_the_last_ends():
+    scheduler = EffectScheduler()
+    scheduler.schedule("expand", 10)
+    scheduler.schedule("expand", 20)
+    assert len(scheduler) == 2
+
+    assert scheduler.expire(10) == []
+    assert scheduler.expire(11) == [("expand", None)]
+    assert scheduler.is_active("expand")
+    assert scheduler.expire(21) == [("expand", None)]
+    assert not scheduler.is_active("expand")
+    assert len(scheduler) == 0
+
+
+def test_first_expiry_does_not_undo_a_stacked_expand():
+    state = GameState(seed=0)
+    pickups = state.pickups
+    pickups.next_pickup = float("inf")
+    state.ball.x_vol = 1  # Last hit by the left paddle
+    paddle = state.l_paddle
+
+    for frame in (0, 100):
+        collect(pickups, "expand", frame)
+    assert paddle.height == PADDLE_HEIGHT_EXPANDED
+
+    pickups.check_pickup(PICKUP_LENGTH + 1)
+    assert paddle.height == PADDLE_HEIGHT_EXPANDED
+    assert pickups.is_condition_active("expand")
+
+    pickups.check_pickup(PICKUP_LENGTH + 101)
+    assert paddle.height == PADDLE_HEIGHT
+    assert not pickups.is_condition_active("expand")
+
+
+def test_simultaneous_expiries_end_in_the_order_scheduled():
+    scheduler = EffectScheduler()
+    order = ["slow", "expand", "bounce", "expand", "giantball", "slow"]
+    tokens = [object() for _ in order]  # Not comparable, so never compared
+    scheduler.schedule("sparkle", 60)
+    for condition, token in zip(order, tokens):
+        scheduler.schedule(condition, 50, token)
+    assert scheduler.expire(51) == list(zip(order, tokens))
+    assert scheduler.expire(61) == [("sparkle", None)]
+
+
+def test_pickups_run_simultaneous_exits_in_a_fixed_order():
+    exits = []
+    types = {
+        name: PickupType(8, exit=lambda name=name: exits.append(name))
+        for name in ("a", "b", "c")
+    }
+    pickups = Pickups(types, 0, 80, 0, 50, rng=Random(0))
+    pickups.next_pickup = float("inf")
+    for name in ("c", "a", "b", "a"):
+        collect(pickups, name, 0)
+    pickups.check_pickup(PICKUP_LENGTH + 1)
+    assert exits == ["c", "a", "b", "a"]
@@ -0,0 +1,104 @@
+"""Recordings: input logs, headers and replaying them."""
+
+from random import Random
+import struct
+import pytest
+
+from engine import GameState, INPUT_L_UP, INPUT_L_DOWN, INPUT_R_UP, INPUT_R_DOWN
+from replay import InputLog, Recording, Recorder, HEADER_FORMAT, verify
+
+CONTROLS = (0, INPUT_L_UP, INPUT_L_DOWN | INPUT_R_UP, INPUT_R_DOWN)
+
+
+def round_trip(log):
+    return InputLog.from_bytes(log.to_bytes(), len(log.runs))
+
+
+def test_empty_input_log():
+    log = InputLog()
+    assert log.to_bytes() == b""
+    assert len(log) == 0
+    assert round_trip(log).runs == []
+
+
+@pytest.mark.parametrize("steps", (1, 127, 128, 16383, 16384, 2**21 + 5, 2**40))
+def test_long_runs_round_trip(steps):
+    log = InputLog([[INPUT_L_UP, steps], [0, 1]])
+    decoded = round_trip(log)
+    assert decoded.runs == log.runs
+    assert len(decoded) == steps + 1
+
+
+def test_recorded_controls_round_trip():
+    rng = Random(0)
+    log = InputLog()
+    expected = []
+    for _ in range(50):
+        inputs = rng.choice(CONTROLS)
+        for _ in range(rng.choice((1, 2, 200, 5000))):
+            log.record(inputs)
+            expected.append(inputs)
+    decoded = round_trip(log)
+    assert decoded.runs == log.runs
+    assert list(decoded) == expected
+    # Repeated controls join the run before them
+    assert all(a[0] != b[0] for a, b in zip(log.runs, log.runs[1:]))
+
+
+def record(seed=2**64 - 3, steps=1500, frames=1, swept=False):
+    """Record a match of random controls, as far as the given number of steps."""
+    rng = Random(seed)
+    recorder = Recorder(GameState(seed=seed, swept=swept), frames)
+    inputs = 0
+    for _ in range(steps):
+        if rng.random() < 0.05:
+            inputs = rng.choice(CONTROLS)
+        recorder.step(inputs)
+    return recorder.finish()
+
+
+@pytest.mark.parametrize("frames, swept", ((1, False), (1, True), (4, False)))
+def test_header_round_trip(frames, swept):
+    recording = record(steps=300, frames=frames, swept=swept)
+    decoded = Recording.from_bytes(recording.to_bytes())
+    assert decoded.seed == recording.seed == 2**64 - 3
+    assert decoded.frames == frames
+    assert decoded.swept == swept
+    assert decoded.final_hash == recording.final_hash
+    assert decoded.inputs.runs == recording.inputs.runs
+    assert verify(decoded)
+
+
+def test_empty_recording_round_trip():
+    recording = Recorder(GameState(seed=1)).finish()
+    decoded = Recording.from_bytes(recording.to_bytes())
+    assert len(decoded.inputs) == 0
+    assert verify(decoded)
+
+
+def test_corrupt_recordings_are_refused():
+    data = record(steps=300).to_bytes()
+    with pytest.raises(ValueError):
+        Recording.from_bytes(b"NOTPONG!" + data[8:])
+
+    # One step more than the log holds
+    header_size = struct.calcsize(HEADER_FORMAT)
+    fields = list(struct.unpack(HEADER_FORMAT, data[:header_size]))
+    fields[4] += 1
+    with pytest.raises(ValueError):
+        Recording.from_bytes(struct.pack(HEADER_FORMAT, *fields) + data[header_size:])
+
+
+def test_verify_catches_tampering():
+    recording = record()
+    assert verify(recording)
+
+    tampered = Recording.from_bytes(recording.to_bytes())
+    # The paddles held still at the end of the match; move them instead
+    assert tampered.inputs.runs[-1][0] == 0
+    tampered.inputs.runs[-1][0] = INPUT_L_DOWN | INPUT_R_UP
+    assert not verify(tampered)
+
+    tampered = Recording.from_bytes(recording.to_bytes())
+    tampered.final_hash = bytes(16)
+    assert not verify(tampered)
@@ -0,0 +1,129 @@
+"""Frames sent by the match server, and clients following its matches."""
+
+import asyncio
+from random import Random
+import numpy as np
+
+from batch import LEFT, RIGHT
+from netplay import CONTROL_UP, CONTROL_DOWN
+from server import (
+    MatchServer,
+    MatchClient,
+    encode_frame,
+    decode_frame,
+    FRAME_FIELDS,
+    FULL_FRAME,
+    PICKUPS_CHANGED,
+    LENGTH_FORMAT,
+)
+
+
+def test_frame_round_trip():
+    fields = dict.fromkeys(FRAME_FIELDS, 0.0)
+    pickups = []
+    values = np.arange(len(FRAME_FIELDS), dtype="<f4") + 0.5
+    data = encode_frame(12, FULL_FRAME, values, [(10, 20, 1), (30, 40, 3)])
+    (length,) = LENGTH_FORMAT.unpack_from(data)
+    assert length == len(data) - LENGTH_FORMAT.size
+    assert decode_frame(data[LENGTH_FORMAT.size :], fields, pickups) == 12
+    assert [fields[name] for name in FRAME_FIELDS] == list(values)
+    assert pickups == [(10, 20, 1), (30, 40, 3)]
+
+    # Only ball_y and r_score changed, and the pickups are left alone
+    mask = 1 << FRAME_FIELDS.index("ball_y") | 1 << FRAME_FIELDS.index("r_score")
+    data = encode_frame(13, mask, np.array([99.25, 4], dtype="<f4"))
+    assert decode_frame(data[LENGTH_FORMAT.size :], fields, pickups) == 13
+    assert fields["ball_y"] == 99.25 and fields["r_score"] == 4
+    assert fields["ball_x"] == values[0]
+    assert pickups == [(10, 20, 1), (30, 40, 3)]
+
+    # Every pickup collected
+    data = encode_frame(14, PICKUPS_CHANGED, np.array([], dtype="<f4"))
+    assert decode_frame(data[LENGTH_FORMAT.size :], fields, pickups) == 14
+    assert pickups == []
+
+
+def batch_fields(batch, match):
+    """A match's fields as the server encodes them, straight from the BatchGame."""
+    values = (
+        batch.x[match],
+        batch.y[match],
+        batch.width[match],
+        batch.height[match],
+        batch.paddle_y[LEFT, match],
+        batch.paddle_y[RIGHT, match],
+        batch.paddle_height[LEFT, match],
+        batch.paddle_height[RIGHT, match],
+        batch.l_score[match],
+        batch.r_score[match],
+        batch.finish[match],
+    )
+    return dict(zip(FRAME_FIELDS, np.array(values, dtype="<f4").tolist()))
+
+
+def batch_pickups(batch, match):
+    """A match's pickups, straight from the BatchGame, in slot order."""
+    return [
+        (
+            int(batch.pickup_x[match, slot]),
+            int(batch.pickup_y[match, slot]),
+            int(batch.pickup_type[match, slot]),
+        )
+        for slot in np.flatnonzero(batch.pickup_alive[match])
+    ]
+
+
+async def follow_matches(matches, ticks):
+    """Run a server with both players and a spectator on every match, and
+    return it with each match's clients."""
+
+    host = "127.0.0.1"
+    server = MatchServer(matches, tick_rate=1000, seeds=range(matches))
+    listener = await asyncio.start_server(server.handle_client, host, 0)
+    port = listener.sockets[0].getsockname()[1]
+    clients = [
+        [
+            await MatchClient.connect(host, port, match, side)
+            for side in (LEFT, RIGHT, None)
+        ]
+        for match in range(matches)
+    ]
+    await asyncio.sleep(0.1)  # Let everyone join
+
+    async def listen(client):
+        while True:
+            await client.receive()
+
+    everyone = [client for match_clients in clients for client in match_clients]
+    listeners = [asyncio.create_task(listen(client)) for client in everyone]
+
+    rng = Random(0)
+    for _ in range(ticks):
+        for match_clients in clients:
+            for player in match_clients[:2]:
+                player.send_controls(rng.choice((0, CONTROL_UP, CONTROL_DOWN)))
+        await asyncio.sleep(0)
+        server.tick()
+        await asyncio.sleep(0)
+    await asyncio.sleep(0.2)  # Let the last frames arrive
+
+    for task in listeners:
+        task.cancel()
+    for client in everyone:
+        await client.close()
+    listener.close()
+    await listener.wait_closed()
+    return server, clients
+
+
+def test_clients_follow_the_batch():
+    matches = 6
+    server, clients = asyncio.run(follow_matches(matches, 900))
+    batch = server.batch
+    assert batch.frame.min() > 0
+    for match in range(matches):
+        for client in clients[match]:
+            # Frames where nothing changed aren't sent, so the frame number can lag
+            assert client.frame is not None and client.frame <= batch.frame[match]
+            assert client.fields == batch_fields(batch, match)
+            assert client.pickups == batch_pickups(batch, match)
@@ -0,0 +1,48 @@
+"""Round trips through GameState.save_state and load_state."""
+
+from engine import GameState, INPUT_L_UP, INPUT_R_DOWN, INPUT_L_DOWN, INPUT_R_UP
+from multiball import MultiBallState
+
+
+def play(state, frames, inputs):
+    for _ in range(frames):
+        state.step(inputs)
+        state.sparkler.sparkle_events(state.events)
+
+
+def test_round_trip_plays_on_identically():
+    state = GameState(seed=3)
+    state.sparkler.turn_on()
+    play(state, 2000, INPUT_L_UP | INPUT_R_DOWN)
+    data = state.save_state()
+
+    restored = GameState(seed=99)
+    restored.load_state(data)
+    assert restored.save_state() == data
+    play(state, 3000, INPUT_L_DOWN | INPUT_R_UP)
+    play(restored, 3000, INPUT_L_DOWN | INPUT_R_UP)
+    assert restored.save_state() == state.save_state()
+
+
+def test_only_live_particles_are_saved():
+    state = GameState(seed=3)
+    state.sparkler.turn_on()
+    play(state, 2000, 0)
+    assert len(state.sparkler.window(state.frame_count))
+    # The rest is mostly the 2.5 KB Mersenne Twister state
+    assert len(state.save_state()) < 4000
+
+
+def test_multiball_round_trip():
+    state = MultiBallState(200, seed=3)
+    play(state, 3000, INPUT_L_UP | INPUT_R_DOWN)
+    data = state.save_state()
+
+    restored = MultiBallState(5, seed=99, win_condition=7)
+    restored.load_state(data)
+    assert restored.ball_count == 200
+    assert restored.win_condition is None
+    assert restored.save_state() == data
+    play(state, 3000, INPUT_L_DOWN | INPUT_R_UP)
+    play(restored, 3000, INPUT_L_DOWN | INPUT_R_UP)
+    assert restored.save_state() == state.save_state()
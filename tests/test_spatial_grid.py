@@ -0,0 +1,77 @@
+"""SpatialGrid against checking every object."""
+
+from random import Random
+import pytest
+
+from spatial_grid import SpatialGrid, GRID_CELL_SIZE
+from utilities import is_overlap, Rect
+
+
+class Box:
+    """A rectangle which can move and change size, like a paddle."""
+
+    def __init__(self, x, y, width, height):
+        self.x = x
+        self.y = y
+        self.width = width
+        self.height = height
+
+
+def random_rect(rng, cls=Rect):
+    """Anywhere on a board a few cells across, from a speck to several cells big,
+    often exactly on a cell boundary."""
+    if rng.random() < 0.3:
+        x = rng.randint(-1, 10) * GRID_CELL_SIZE
+        y = rng.randint(-1, 8) * GRID_CELL_SIZE
+    else:
+        x = rng.uniform(-10, 90)
+        y = rng.uniform(-10, 60)
+    size = rng.choice((0, 1, GRID_CELL_SIZE, 2.5 * GRID_CELL_SIZE))
+    return cls(x, y, rng.uniform(0, size), rng.uniform(0, size))
+
+
+@pytest.mark.parametrize("seed", range(5))
+def test_near_matches_brute_force(seed):
+    rng = Random(seed)
+    grid = SpatialGrid()
+    present = []  # In the order added
+
+    for _ in range(2000):
+        action = rng.random()
+        if action < 0.4 or not present:
+            box = random_rect(rng, Box)
+            grid.add(box)
+            present.append(box)
+        elif action < 0.8:
+            box = rng.choice(present)
+            moved = random_rect(rng)
+            if rng.random() < 0.5:  # Only nudged, often staying in its cells
+                moved = Rect(box.x + rng.uniform(-2, 2), box.y, box.width, box.height)
+            box.x, box.y, box.width, box.height = moved
+            grid.move(box)
+        else:
+            box = present.pop(rng.randrange(len(present)))
+            grid.remove(box)
+        assert len(grid) == len(present)
+
+        for _ in range(3):
+            rect = random_rect(rng)
+            near = grid.near(rect)
+            overlapping = [box for box in present if is_overlap(rect, box)]
+            assert [box for box in near if is_overlap(rect, box)] == overlapping
+            order = [present.index(box) for box in near]
+            assert order == sorted(order)
+
+
+def test_empty_cells_are_dropped():
+    grid = SpatialGrid()
+    boxes = [Box(i * 3.7, i * 2.1, 12, 12) for i in range(10)]
+    for box in boxes:
+        grid.add(box)
+    for box in boxes:
+        box.x += 20
+        grid.move(box)
+    for box in boxes:
+        grid.remove(box)
+    assert len(grid) == 0
+    assert grid.cells == {}
@@ -0,0 +1,134 @@
+"""Swept collision of the ball with the walls, sides and paddles."""
+
+from random import Random
+import pytest
+
+from engine import (
+    GameState,
+    DIMENSIONS,
+    WIDTH,
+    HEIGHT,
+    BALL_SIDE,
+    COL_BALL,
+    COL_PADDLE,
+    PADDLE_WIDTH,
+    PADDLE_HEIGHT,
+    PADDLE_MOVE_SPEED,
+)
+from objects import Ball, Paddle
+
+
+def make_ball(x, y, x_vol, y_vol):
+    ball = Ball((x, y), COL_BALL, BALL_SIDE, BALL_SIDE, 0, DIMENSIONS, rng=Random(0))
+    ball.x_vol = x_vol
+    ball.y_vol = y_vol
+    return ball
+
+
+def make_paddle(x, y):
+    return Paddle(
+        (x, y), COL_PADDLE, PADDLE_WIDTH, PADDLE_HEIGHT, PADDLE_MOVE_SPEED, DIMENSIONS
+    )
+
+
+@pytest.mark.parametrize("y_vol", (0, 0.3, -0.3))
+def test_fast_ball_cannot_pass_through_a_paddle(y_vol):
+    paddle = make_paddle(4, 20)
+    # Eight frames at this speed carry the ball from the middle, through the
+    # paddle and off the side of the board
+    ball = make_ball(43, 24, -6, y_vol)
+    outcome, hit = ball.sweep([paddle], frames=8)
+    assert outcome is None and hit
+    assert ball.x_vol > 0
+    assert ball.x >= paddle.x + paddle.width
+
+    # A frame at a time, the ball jumps from x=7 to x=1 and never overlaps it
+    ball = make_ball(43, 24, -6, y_vol)
+    outcomes = []
+    for _ in range(8):
+        outcomes.append(ball.update())
+        assert not ball.check_collision([paddle])
+    assert "r" in outcomes
+
+
+def test_no_points_through_a_covering_paddle():
+    state = GameState(seed=5, swept=True)
+    state.start = -1
+    state.ball.x_vol = -5
+    for _ in range(200):
+        # The left paddle is always where the ball will cross it, the right one never
+        state.l_paddle.y = min(max(state.ball.y - 4, 0), HEIGHT - PADDLE_HEIGHT)
+        state.r_paddle.y = 0 if state.ball.y > HEIGHT / 2 else HEIGHT - PADDLE_HEIGHT
+        state.paddles.move(state.l_paddle)
+        state.paddles.move(state.r_paddle)
+        state.ball.y_vol = 0
+        state.step(frames=8)
+    assert state.r_score == 0
+    assert state.l_score > 0
+
+
+@pytest.mark.parametrize(
+    "y, y_vol, end_y, end_y_vol",
+    [
+        # Off the top once
+        (10, -5, 30, 5),
+        # Off the bottom once
+        (HEIGHT - BALL_SIDE - 10, 5, HEIGHT - BALL_SIDE - 30, -5),
+        # Off the top, then the bottom: 8 * 12 = 96 = 10 up + 48 down + 38 up
+        (10, -12, HEIGHT - BALL_SIDE - 38, -12),
+    ],
+)
+def test_wall_reflections_within_one_step(y, y_vol, end_y, end_y_vol):
+    ball = make_ball(WIDTH / 2, y, 0.1, y_vol)
+    outcome, hit = ball.sweep([], frames=8)
+    assert outcome is None and not hit
+    assert ball.y == pytest.approx(end_y)
+    assert ball.y_vol == end_y_vol
+    assert ball.x == pytest.approx(WIDTH / 2 + 0.8)
+
+
+def test_sweep_matches_update_a_frame_at_a_time():
+    rng = Random(1)
+    for _ in range(200):
+        start = (
+            rng.uniform(0, WIDTH - BALL_SIDE),
+            rng.uniform(0, HEIGHT - BALL_SIDE),
+            rng.uniform(-3, 3),
+            rng.uniform(-3, 3),
+        )
+        stepped = make_ball(*start)
+        swept = make_ball(*start)
+        for _ in range(100):
+            outcome = stepped.update()
+            swept_outcome, _ = swept.sweep([], frames=1)
+            assert swept_outcome == outcome
+            if outcome:
+                break
+            assert (swept.x, swept.y) == pytest.approx((stepped.x, stepped.y))
+            assert (swept.x_vol, swept.y_vol) == (stepped.x_vol, stepped.y_vol)
+
+
+def test_paddle_hits_agree_a_frame_at_a_time():
+    rng = Random(2)
+    for _ in range(200):
+        paddle = make_paddle(4, rng.uniform(0, HEIGHT - PADDLE_HEIGHT))
+        start = (
+            rng.uniform(10, 20),
+            rng.uniform(paddle.y - 1, paddle.y + PADDLE_HEIGHT - 1),
+            -rng.uniform(0.2, 1.5),
+            0,
+        )
+        stepped = make_ball(*start)
+        swept = make_ball(*start)
+        for _ in range(100):
+            stepped.update()
+            stepped_hit = stepped.check_collision([paddle])
+            _, swept_hit = swept.sweep([paddle], frames=1)
+            assert swept_hit == stepped_hit
+            if stepped_hit:
+                break
+        assert stepped_hit
+        # The swept ball carries on for the rest of the frame after the hit
+        assert swept.x_vol == stepped.x_vol > 0
+        assert swept.y_vol == pytest.approx(stepped.y_vol)
+        assert stepped.x <= swept.x <= stepped.x + swept.x_vol
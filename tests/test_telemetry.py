@@ -0,0 +1,38 @@
+"""Counting what happens in matches with Telemetry."""
+
+from engine import GameState, INPUT_L_UP, INPUT_L_DOWN
+from multiball import MultiBallState
+from telemetry import Telemetry, MATCHES, FRAMES, HITS
+
+
+def test_points_go_to_the_side_which_scored():
+    telemetry = Telemetry()
+    telemetry.score("l")
+    telemetry.score("r", 3)
+    assert telemetry.points.tolist() == [1, 3]
+
+
+def test_a_match_is_counted_from_its_events():
+    state = GameState(seed=1)
+    telemetry = Telemetry()
+    while not state.finish:
+        middle = state.l_paddle.y + state.l_paddle.height / 2
+        state.step(INPUT_L_UP if state.ball.y < middle else INPUT_L_DOWN)
+        telemetry.count_events(state.events)
+
+    assert telemetry.points.tolist() == [state.l_score, state.r_score]
+    assert telemetry.counters[MATCHES] == 1
+    assert telemetry.counters[FRAMES] == state.frame_count - 1
+    assert telemetry.hit_positions.sum() == telemetry.counters[HITS] > 0
+    assert telemetry.rally_lengths.sum() == state.l_score + state.r_score
+
+
+def test_multiball_hits_are_counted_together():
+    state = MultiBallState(100, seed=1, win_condition=10)
+    telemetry = Telemetry()
+    while not state.finish:
+        state.step()
+        telemetry.count_events(state.events)
+
+    assert telemetry.points.sum() == state.l_score + state.r_score
+    assert telemetry.hit_positions.sum() == telemetry.counters[HITS] > 0
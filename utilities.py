@@ -1,6 +1,10 @@
 """Some utility functions."""
 
-from random import choice
+import random
+from collections import namedtuple
+
+# A plain rectangle, for when an object's position needs to be stood in for.
+Rect = namedtuple("Rect", "x y width height")
 
 ####################
 # Helper functions #
@@ -34,11 +38,54 @@ def is_overlap(object1, object2):
     return True
 
 
+def sweep_overlap(object1, dx, dy, object2):
+    """Finds when a moving rectangle first touches a still one.
+
+    object1 moves by (dx, dy) over the course of the sweep. Returns the
+    fraction of the move (between 0 and 1) at which it first touches object2,
+    or None if it doesn't. Like is_overlap, touching counts, and rectangles
+    which already overlap return 0.
+
+    Each axis gives the interval of the move during which the rectangles
+    overlap on that axis, and they touch during the intersection of the two.
+    """
+
+    entry = 0.0
+    exit = 1.0
+    for position, size, move, other_position, other_size in (
+        (object1.x, object1.width, dx, object2.x, object2.width),
+        (object1.y, object1.height, dy, object2.y, object2.height),
+    ):
+        if move == 0:
+            if position + size < other_position or other_position + other_size < position:
+                return None
+            continue
+
+        if move > 0:
+            axis_entry = (other_position - (position + size)) / move
+            axis_exit = (other_position + other_size - position) / move
+        else:
+            axis_entry = (other_position + other_size - position) / move
+            axis_exit = (other_position - (position + size)) / move
+
+        entry = max(entry, axis_entry)
+        exit = min(exit, axis_exit)
+        if entry > exit:
+            return None
+
+    return entry
+
+
+def lerp(start, end, fraction):
+    """Return the value the given fraction of the way from start to end."""
+    return start + (end - start) * fraction
+
+
 def sign(number):
     """Return the sign of a number."""
     return 1 if number >= 0 else -1
 
 
-def random_direction():
-    """Return a random direction as 1 or -1."""
-    return choice((-1, 1))
+def random_direction(rng=random):
+    """Return a random direction as 1 or -1, drawn from the given random number generator."""
+    return rng.choice((-1, 1))